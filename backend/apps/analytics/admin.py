@@ -15,9 +15,15 @@ class SalesMetricAdmin(admin.ModelAdmin):
         return False  # Prevent manual creation
     
     def recalculate_metrics(self, request, queryset):
-        for metric in queryset:
-            SalesMetric.calculate_for_date(metric.date)
-        self.message_user(request, f"Recalculated metrics for {queryset.count()} dates")
+        # One set-based pass per run of consecutive selected dates.
+        dates = sorted(queryset.values_list('date', flat=True))
+        start = previous = dates[0]
+        for date in dates[1:] + [None]:
+            if date is None or (date - previous).days > 1:
+                SalesMetric.calculate_for_period(start, previous)
+                start = date
+            previous = date
+        self.message_user(request, f"Recalculated metrics for {len(dates)} dates")
     recalculate_metrics.short_description = "Recalculate selected metrics"
     
     def calculate_today_metrics(self, request, queryset):
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.analytics'
+
+    def ready(self):
+        # Connects the receivers that keep SalesMetric up to date, mark
+        # rollups stale, invalidate cached dashboard widgets, count
+        # inserted items into the top product sketches and record deleted
+        # items for the columnar export.
+        from . import columnar, dashboard, heavy_hitters, incremental, rollups  # noqa: F401
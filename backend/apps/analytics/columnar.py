@@ -0,0 +1,285 @@
+"""
+Columnar snapshot export of orders, order items and stock movements.
+
+Each table is exported to a directory under ``ANALYTICS_EXPORT_DIR`` holding
+one 1-d ``.npy`` file per column and a ``manifest.json``. Analytics jobs
+memory-map the columns (``open_table``) and scan them with NumPy instead of
+pulling rows through the ORM.
+
+- Rows are read in keyset-ordered chunks of ``ANALYTICS_EXPORT_CHUNK_SIZE``
+  and appended in place: ``.npy`` headers leave room for the row count to
+  grow, so a column stays a single memory-mappable file.
+- Strings are dictionary-encoded as ``int32`` codes into the manifest's
+  ``categories``. Money is stored as ``int64`` cents, datetimes as UTC
+  ``datetime64[us]`` and missing foreign keys as -1.
+- Every run continues from the manifest's watermark. Orders and items are
+  exported by ``(updated_at, id)``, so a row that changed is appended
+  again, and ``latest`` picks the last row of each id. Deleted items leave
+  an ``OrderItemDeletion`` tombstone, exported as ``order_item_deletions``
+  for ``latest`` to leave out. Movements and tombstones are append-only
+  and exported by id. Archived orders are not read: orders are archived
+  long after their last export (``ORDER_ARCHIVE_AFTER_DAYS``).
+- Rows written less than ``SETTLE_SECONDS`` ago wait for the next run, so
+  rows committed out of order are not skipped by the watermark. The check
+  is on the time the row was written, never on an order's ``created_at``,
+  which offline devices backdate.
+
+The manifest is replaced after the columns of each chunk are written. It
+is the source of truth for the row count: a run that died halfway is
+overwritten from the last recorded row by the next one.
+"""
+import datetime
+import json
+import os
+import shutil
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.inventory.models import StockMovement
+from apps.orders.archive import is_archiving
+from apps.orders.models import Order, OrderItem
+
+from .models import OrderItemDeletion
+
+SETTLE_SECONDS = 60
+MANIFEST = 'manifest.json'
+
+# (column name, ORM lookup, kind) triples; see ``_to_array`` for the kinds.
+ORDER_COLUMNS = (
+    ('id', 'id', 'int'),
+    ('user_id', 'user_id', 'fk'),
+    ('customer_id', 'customer_id', 'fk'),
+    ('status', 'status', 'category'),
+    ('payment_method', 'payment_method', 'category'),
+    ('payment_status', 'payment_status', 'category'),
+    ('total_amount', 'total_amount', 'money'),
+    ('tax_amount', 'tax_amount', 'money'),
+    ('discount_amount', 'discount_amount', 'money'),
+    ('created_at', 'created_at', 'datetime'),
+    ('updated_at', 'updated_at', 'datetime'),
+)
+
+ITEM_COLUMNS = (
+    ('id', 'id', 'int'),
+    ('order_id', 'order_id', 'int'),
+    ('product_type', 'product_type', 'category'),
+    ('product_id', 'product_id', 'int'),
+    ('product_name', 'product_name', 'category'),
+    ('quantity', 'quantity', 'int'),
+    ('unit_price', 'unit_price', 'money'),
+    ('subtotal', 'subtotal', 'money'),
+    ('updated_at', 'updated_at', 'datetime'),
+)
+
+ITEM_DELETION_COLUMNS = (
+    ('id', 'id', 'int'),
+    ('item_id', 'item_id', 'int'),
+    ('order_id', 'order_id', 'int'),
+    ('deleted_at', 'deleted_at', 'datetime'),
+)
+
+MOVEMENT_COLUMNS = (
+    ('id', 'id', 'int'),
+    ('product_id', 'product_id', 'int'),
+    ('movement_type', 'movement_type', 'category'),
+    ('quantity', 'quantity', 'int'),
+    ('performed_by_id', 'performed_by_id', 'fk'),
+    ('created_at', 'created_at', 'datetime'),
+)
+
+DTYPES = {
+    'int': np.int64,
+    'fk': np.int64,
+    'money': np.int64,
+    'datetime': 'datetime64[us]',
+    'category': np.int32,
+}
+
+
+class ExportTable(NamedTuple):
+    model: type
+    columns: tuple
+    # Field of the watermark next to the id (None: the id alone), and the
+    # timestamp that must be SETTLE_SECONDS old for a row to be exported.
+    updated_field: str | None
+    settled_lookup: str
+
+
+EXPORT_TABLES = {
+    'orders': ExportTable(Order, ORDER_COLUMNS, 'updated_at', 'updated_at'),
+    'order_items': ExportTable(OrderItem, ITEM_COLUMNS, 'updated_at', 'updated_at'),
+    'order_item_deletions': ExportTable(OrderItemDeletion, ITEM_DELETION_COLUMNS, None, 'deleted_at'),
+    'stock_movements': ExportTable(StockMovement, MOVEMENT_COLUMNS, None, 'created_at'),
+}
+
+
+@receiver(post_delete, sender=OrderItem)
+def record_deleted_item(sender, instance, **kwargs):
+    # Archived items stay in the export: they were exported long before.
+    if not is_archiving():
+        OrderItemDeletion.objects.create(item_id=instance.pk, order_id=instance.order_id)
+
+
+def table_dir(name, directory=None):
+    return os.path.join(directory or settings.ANALYTICS_EXPORT_DIR, name)
+
+
+def read_manifest(name, directory=None):
+    """The manifest of an exported table, or ``None`` if it was never exported."""
+    try:
+        with open(os.path.join(table_dir(name, directory), MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(path, manifest):
+    temporary = os.path.join(path, MANIFEST + '.tmp')
+    with open(temporary, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(temporary, os.path.join(path, MANIFEST))
+
+
+def write_column(path, array, start):
+    """
+    Write ``array`` into the 1-d ``.npy`` file at ``path`` from row
+    ``start`` on, dropping any rows after it, in place.
+    """
+    if not os.path.exists(path):
+        np.save(path, array[:0])
+    with open(path, 'r+b') as column_file:
+        np.lib.format.read_magic(column_file)
+        _, _, dtype = np.lib.format.read_array_header_1_0(column_file)
+        data_start = column_file.tell()
+        column_file.seek(data_start + start * dtype.itemsize)
+        column_file.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        column_file.truncate()
+        column_file.seek(0)
+        np.lib.format.write_array_header_1_0(column_file, {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (start + len(array),),
+        })
+        if column_file.tell() != data_start:
+            raise ValueError(f"{path}: the header outgrew its padding")
+
+
+def _to_array(kind, values, categories=None):
+    if kind == 'fk':
+        return np.array([-1 if value is None else value for value in values], dtype=np.int64)
+    if kind == 'money':
+        return np.array([int(value.scaleb(2)) for value in values], dtype=np.int64)
+    if kind == 'datetime':
+        return np.array([value.astimezone(datetime.timezone.utc).replace(tzinfo=None) for value in values],
+                        dtype='datetime64[us]')
+    if kind == 'category':
+        codes = {category: code for code, category in enumerate(categories)}
+        for value in values:
+            if value not in codes:
+                codes[value] = len(categories)
+                categories.append(value)
+        return np.array([codes[value] for value in values], dtype=np.int32)
+    return np.array(values, dtype=DTYPES[kind])
+
+
+def export_table(name, directory=None, chunk_size=None, full=False, progress=None):
+    """
+    Append the rows of table ``name`` changed since its last export. With
+    ``full``, drop the export and start again. Returns the rows appended.
+    """
+    table = EXPORT_TABLES[name]
+    chunk_size = chunk_size or settings.ANALYTICS_EXPORT_CHUNK_SIZE
+    path = table_dir(name, directory)
+    if full and os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path, exist_ok=True)
+
+    manifest = read_manifest(name, directory)
+    if manifest is None:
+        manifest = {
+            'table': name,
+            'columns': {column: {'kind': kind, 'dtype': np.dtype(DTYPES[kind]).str}
+                        for column, _, kind in table.columns},
+            'categories': {column: [] for column, _, kind in table.columns if kind == 'category'},
+            'rows': 0,
+            'watermark': None,
+        }
+        # Written up front so a table with nothing to export yet can be opened.
+        _write_manifest(path, manifest)
+    cutoff = timezone.now() - datetime.timedelta(seconds=SETTLE_SECONDS)
+    queryset = table.model.objects.filter(**{f'{table.settled_lookup}__lt': cutoff})
+    ordering = (table.updated_field, 'id') if table.updated_field else ('id',)
+    lookups = [lookup for _, lookup, _ in table.columns]
+    if table.updated_field and table.updated_field not in lookups:
+        lookups.append(table.updated_field)
+    appended = 0
+
+    while True:
+        chunk = queryset
+        watermark = manifest['watermark']
+        if watermark and table.updated_field:
+            updated_at = datetime.datetime.fromisoformat(watermark['updated_at'])
+            chunk = chunk.filter(Q(**{f'{table.updated_field}__gt': updated_at})
+                                 | Q(**{table.updated_field: updated_at, 'id__gt': watermark['id']}))
+        elif watermark:
+            chunk = chunk.filter(id__gt=watermark['id'])
+        rows = list(chunk.order_by(*ordering).values_list(*lookups)[:chunk_size])
+        if not rows:
+            break
+
+        values = list(zip(*rows))
+        for index, (column, _, kind) in enumerate(table.columns):
+            array = _to_array(kind, values[index], manifest['categories'].get(column))
+            write_column(os.path.join(path, f'{column}.npy'), array, manifest['rows'])
+        last = dict(zip(lookups, rows[-1]))
+        manifest['watermark'] = {'id': last['id']}
+        if table.updated_field:
+            manifest['watermark']['updated_at'] = last[table.updated_field].isoformat()
+        manifest['rows'] += len(rows)
+        manifest['exported_at'] = timezone.now().isoformat()
+        _write_manifest(path, manifest)
+        appended += len(rows)
+        if progress:
+            progress(name, appended)
+        if len(rows) < chunk_size:
+            break
+    return appended
+
+
+def open_table(name, columns=None, directory=None):
+    """
+    Memory-map the exported ``columns`` (all by default) of table ``name``.
+    Returns ``(arrays, manifest)``; category columns hold codes into
+    ``manifest['categories'][column]``.
+    """
+    manifest = read_manifest(name, directory)
+    if manifest is None:
+        raise FileNotFoundError(f"Table {name!r} has not been exported")
+    path = table_dir(name, directory)
+    arrays = {}
+    for column in columns or manifest['columns']:
+        if manifest['rows'] == 0:
+            arrays[column] = np.empty(0, dtype=manifest['columns'][column]['dtype'])
+            continue
+        # A run in progress may have appended rows the manifest does not count yet.
+        arrays[column] = np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r')[:manifest['rows']]
+    return arrays, manifest
+
+
+def latest(ids, deleted=None):
+    """
+    Indices of the last row of each id, for tables that re-export changed
+    rows (orders and items), leaving out the ids in ``deleted`` (the
+    ``item_id`` column of ``order_item_deletions``).
+    """
+    _, first_from_end = np.unique(ids[::-1], return_index=True)
+    indices = np.sort(len(ids) - 1 - first_from_end)
+    if deleted is not None:
+        indices = indices[~np.isin(ids[indices], deleted)]
+    return indices
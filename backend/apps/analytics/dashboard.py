@@ -0,0 +1,298 @@
+"""
+Data of the dashboard widgets, computed together for one request.
+
+``load_dashboard`` reads a user's visible ``DashboardWidget`` rows (or
+``DEFAULT_WIDGETS`` if they have none), serves each widget from the cache
+and computes the missing ones concurrently: one on the request's thread,
+the others in a thread pool, each pool thread on its own database
+connection.
+
+A widget's cache key is built from the user, a hash of the widget's
+settings, the local date and the version stamp of every data source the
+widget reads:
+
+- ``orders``: bumped after commit by every order write. That covers saves,
+  deletes, the bulk create signals and status transitions, and the
+  ``SalesMetric`` rewrites (incremental updates and recalculations, from
+  the admin or a command).
+- ``inventory``: bumped by product saves and deletes. Stock levels change
+  through conditional UPDATEs that send no signals (``apps.inventory.stock``),
+  so widgets that show stock are also cached for only
+  ``DASHBOARD_STOCK_CACHE_TIMEOUT`` seconds.
+
+Stamps are ``DashboardDataVersion`` rows, so a write in any process or
+command invalidates the widgets cached by all of them; a transaction bumps
+each source once. A warm load makes one query for the stamps.
+"""
+import hashlib
+import json
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Count, F, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.inventory import alerts
+from apps.inventory.models import Product, StockMovement
+from apps.orders.models import Customer, Order, OrderItem, OrderTransition
+from apps.orders.signals import order_items_created, order_status_changed, orders_created
+
+from .models import DashboardDataVersion, DashboardWidget, SalesMetric, SalesMetricProduct
+from .periods import day_bounds
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDGETS = ('quick_stats', 'sales_summary', 'revenue_chart', 'top_products', 'recent_orders', 'low_stock')
+WIDGET_KEY = 'analytics:widget:{type}:{user}:{settings}:{date}:{versions}'
+
+_pool = None
+
+
+class Widget(NamedTuple):
+    compute: object
+    sources: tuple
+    # Shows stock levels, which change without signals.
+    stock: bool = False
+
+
+def _setting(widget_settings, name, default, low, high):
+    """An integer setting of a widget, clamped to ``[low, high]``."""
+    try:
+        value = int((widget_settings or {}).get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(low, min(value, high))
+
+
+def _day_range(days):
+    today = timezone.localdate()
+    return today - timedelta(days=days - 1), today
+
+
+def sales_summary(widget_settings):
+    days = _setting(widget_settings, 'days', 30, 1, 366)
+    start, end = _day_range(days)
+    previous_start = start - timedelta(days=days)
+    current = Q(date__gte=start)
+    previous = Q(date__lt=start)
+    totals = SalesMetric.objects.filter(date__gte=previous_start, date__lte=end).aggregate(
+        sales=Sum('total_sales', filter=current, default=0),
+        orders=Sum('total_orders', filter=current, default=0),
+        previous_sales=Sum('total_sales', filter=previous, default=0),
+        previous_orders=Sum('total_orders', filter=previous, default=0),
+    )
+    return {
+        'days': days,
+        'total_sales': totals['sales'],
+        'total_orders': totals['orders'],
+        'average_order_value': totals['sales'] / totals['orders'] if totals['orders'] else 0,
+        'previous_total_sales': totals['previous_sales'],
+        'previous_total_orders': totals['previous_orders'],
+        'sales_change': ((totals['sales'] - totals['previous_sales']) / totals['previous_sales'] * 100
+                         if totals['previous_sales'] else None),
+    }
+
+
+def recent_orders(widget_settings):
+    limit = _setting(widget_settings, 'limit', 10, 1, 50)
+    return list(Order.objects.order_by('-created_at', '-id').values(
+        'id', 'order_number', 'status', 'payment_status', 'total_amount', 'created_at',
+        customer_name=F('customer__name'))[:limit])
+
+
+def low_stock(widget_settings):
+    limit = _setting(widget_settings, 'limit', 10, 1, 100)
+    products = alerts.low_stock_products()
+    return {
+        'count': products.count(),
+        'products': list(products.values(
+            'id', 'name', 'sku', 'stock_quantity', 'available_quantity', 'min_stock_level')[:limit]),
+    }
+
+
+def top_products(widget_settings):
+    days = _setting(widget_settings, 'days', 30, 1, 366)
+    limit = _setting(widget_settings, 'limit', 5, 1, 50)
+    start, end = _day_range(days)
+    return list(SalesMetricProduct.objects.filter(date__gte=start, date__lte=end, quantity__gt=0)
+                .values('product_name').annotate(quantity=Sum('quantity'))
+                .order_by('-quantity', 'product_name')[:limit])
+
+
+def revenue_chart(widget_settings):
+    days = _setting(widget_settings, 'days', 30, 1, 366)
+    start, end = _day_range(days)
+    stored = {row['date']: row for row in SalesMetric.objects.filter(date__gte=start, date__lte=end).values(
+        'date', 'total_sales', 'total_orders')}
+    return [stored.get(day, {'date': day, 'total_sales': 0, 'total_orders': 0})
+            for day in (start + timedelta(days=offset) for offset in range(days))]
+
+
+def customer_map(widget_settings):
+    """Who is buying: top customers by spend, and how the counted orders split by buyer."""
+    days = _setting(widget_settings, 'days', 30, 1, 366)
+    limit = _setting(widget_settings, 'limit', 10, 1, 50)
+    start_at, _ = day_bounds(*_day_range(days))
+    orders = SalesMetric.counted_orders(Order.objects.filter(created_at__gte=start_at))
+    buyers = orders.order_by().aggregate(
+        registered=Count('pk', filter=Q(user__isnull=False)),
+        guests=Count('pk', filter=Q(user__isnull=True, customer__isnull=False)),
+        anonymous=Count('pk', filter=Q(user__isnull=True, customer__isnull=True)),
+    )
+    top = list(orders.filter(customer__isnull=False).order_by().values(
+        'customer_id', name=F('customer__name'), email=F('customer__email'),
+    ).annotate(orders=Count('pk'), total_spent=Sum('total_amount')).order_by('-total_spent', 'customer_id')[:limit])
+    new_customers = Customer.objects.filter(created_at__gte=start_at).count()
+    return {'days': days, 'orders_by_buyer': buyers, 'new_customers': new_customers, 'top_customers': top}
+
+
+def quick_stats(widget_settings):
+    today = SalesMetric.objects.filter(date=timezone.localdate()).values(
+        'total_sales', 'total_orders', 'total_customers', 'average_order_value').first()
+    return {
+        **(today or {'total_sales': 0, 'total_orders': 0, 'total_customers': 0, 'average_order_value': 0}),
+        'pending_orders': Order.objects.filter(status='pending').count(),
+        'low_stock_products': alerts.low_stock_products().count(),
+    }
+
+
+def activity_feed(widget_settings):
+    limit = _setting(widget_settings, 'limit', 15, 1, 50)
+    transitions = OrderTransition.objects.order_by('-created_at', '-id').values(
+        'created_at', 'from_status', 'to_status', order_number=F('order__order_number'),
+        user=F('performed_by__username'))[:limit]
+    movements = StockMovement.objects.order_by('-created_at', '-id').values(
+        'created_at', 'movement_type', 'quantity', 'reason', product_name=F('product__name'),
+        user=F('performed_by__username'))[:limit]
+    feed = [{'type': 'order_status', **row} for row in transitions]
+    feed += [{'type': 'stock_movement', **row} for row in movements]
+    feed.sort(key=lambda entry: entry['created_at'], reverse=True)
+    return feed[:limit]
+
+
+WIDGETS = {
+    'sales_summary': Widget(sales_summary, ('orders',)),
+    'recent_orders': Widget(recent_orders, ('orders',)),
+    'low_stock': Widget(low_stock, ('orders', 'inventory'), stock=True),
+    'top_products': Widget(top_products, ('orders',)),
+    'revenue_chart': Widget(revenue_chart, ('orders',)),
+    'customer_map': Widget(customer_map, ('orders',)),
+    'quick_stats': Widget(quick_stats, ('orders', 'inventory'), stock=True),
+    'activity_feed': Widget(activity_feed, ('orders', 'inventory'), stock=True),
+}
+
+
+def widget_cache_key(widget_type, user_id, widget_settings, versions):
+    settings_hash = hashlib.md5(
+        json.dumps(widget_settings or {}, sort_keys=True, default=str).encode(), usedforsecurity=False
+    ).hexdigest()
+    return WIDGET_KEY.format(
+        type=widget_type, user=user_id, settings=settings_hash, date=timezone.localdate().isoformat(),
+        versions='.'.join(str(versions[source]) for source in WIDGETS[widget_type].sources),
+    )
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.DASHBOARD_WORKERS, thread_name_prefix='dashboard')
+    return _pool
+
+
+def _compute(widget_type, widget_settings):
+    # Pool threads keep their own connections; close them as a request
+    # would, according to CONN_MAX_AGE.
+    close_old_connections()
+    try:
+        return WIDGETS[widget_type].compute(widget_settings)
+    finally:
+        close_old_connections()
+
+
+def visible_widgets(user):
+    """``(widget_type, position, settings)`` of the widgets on ``user``'s dashboard."""
+    rows = list(DashboardWidget.objects.filter(user=user, is_visible=True).order_by('position', 'id').values_list(
+        'widget_type', 'position', 'settings'))
+    if not rows:
+        rows = [(widget_type, position, {}) for position, widget_type in enumerate(DEFAULT_WIDGETS)]
+    return [row for row in rows if row[0] in WIDGETS]
+
+
+def load_dashboard(user, widgets=None):
+    """
+    Data of ``user``'s visible widgets, in dashboard order: dicts with
+    ``widget_type``, ``position``, ``settings``, ``cached`` and ``data`` (or
+    ``error`` if the widget failed).
+    """
+    widgets = visible_widgets(user) if widgets is None else widgets
+    versions = DashboardDataVersion.current({source for widget_type, _, _ in widgets for source in WIDGETS[widget_type].sources})
+    keys = [widget_cache_key(widget_type, user.pk, widget_settings, versions)
+            for widget_type, _, widget_settings in widgets]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    for key, (widget_type, _, widget_settings) in zip(keys, widgets):
+        if key not in cached:
+            missing.setdefault(key, (widget_type, widget_settings))
+    missing = list(missing.items())
+    pending = {key: get_pool().submit(_compute, *widget) for key, widget in missing[1:]}
+    # The first missing widget is computed on this thread, and its connection,
+    # while the pool works on the rest.
+    for key, (widget_type, widget_settings) in missing[:1]:
+        pending[key] = Future()
+        try:
+            pending[key].set_result(WIDGETS[widget_type].compute(widget_settings))
+        except Exception as exc:
+            pending[key].set_exception(exc)
+
+    results = []
+    for key, (widget_type, position, widget_settings) in zip(keys, widgets):
+        result = {'widget_type': widget_type, 'position': position, 'settings': widget_settings,
+                  'cached': key in cached}
+        if key in cached:
+            result['data'] = cached[key]
+        else:
+            try:
+                result['data'] = pending[key].result()
+            except Exception:
+                logger.exception("Dashboard widget %s failed", widget_type)
+                result['error'] = "Widget data could not be loaded"
+                results.append(result)
+                continue
+            timeout = settings.DASHBOARD_STOCK_CACHE_TIMEOUT if WIDGETS[widget_type].stock \
+                else settings.DASHBOARD_CACHE_TIMEOUT
+            cache.set(key, result['data'], timeout)
+        results.append(result)
+    return results
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_save, sender=Customer)
+def order_data_changed(sender, raw=False, **kwargs):
+    if not raw:
+        DashboardDataVersion.bump_after_commit('orders')
+
+
+@receiver(orders_created, sender=Order)
+@receiver(order_items_created, sender=OrderItem)
+@receiver(order_status_changed, sender=Order)
+def orders_bulk_changed(sender, **kwargs):
+    DashboardDataVersion.bump_after_commit('orders')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=StockMovement)
+def inventory_data_changed(sender, raw=False, **kwargs):
+    if not raw:
+        DashboardDataVersion.bump_after_commit('inventory')
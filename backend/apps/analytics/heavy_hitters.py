@@ -0,0 +1,330 @@
+"""
+Streaming top products: the units sold per product name, kept for every
+hour in a Space-Saving sketch (``TopProductSketch``), so "top 10 products in
+the last N hours" is answered from at most N small rows instead of a
+``GROUP BY`` over the order items.
+
+A sketch holds at most ``TOP_PRODUCT_SKETCH_SIZE`` counters. A product with
+a counter has an estimate that never undercounts it and an ``error``, the
+most it may overcount by; a product without one sold at most the sketch's
+``floor`` units. With ``k`` counters no estimate is off by more than
+``total / k``, so the products that sell well are counted exactly or
+nearly so however many products there are.
+
+- Items are counted as they are inserted (``post_save`` of an item, or
+  ``order_items_created``) towards the hour their order was created in, if
+  the order counts as a sale (``SalesMetric.is_counted``). The checkout's
+  transaction only appends ``TopProductDelta`` rows, so concurrent
+  checkouts never wait on a sketch row; ``fold_deltas`` adds them to the
+  sketches, and reads merge the deltas not folded yet.
+- Sketches only count up. Any other change to an order or item (a
+  cancellation, a refund, an edited line, a deletion) marks the hour
+  ``stale``; ``refresh_stale``, run by the ``refresh_top_product_sketches``
+  command, folds the deltas and rebuilds the stale hours from their items,
+  live and archived. Archiving changes nothing: archived items still count.
+- Sketches of different hours merge into one (``SpaceSaving.merge``) with
+  the same guarantees.
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.orders.models import ArchivedOrderItem, Order, OrderItem
+from apps.orders.signals import order_items_created, order_status_changed
+from apps.orders.archive import is_archiving
+
+from .models import SalesMetric, TopProductDelta, TopProductSketch
+from .periods import items_between
+
+HOUR = datetime.timedelta(hours=1)
+# Order fields that decide which hour its items count towards, and whether they do.
+ORDER_FIELDS = {'created_at', 'status', 'payment_status'}
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+LOOKUP_BATCH_SIZE = 500
+# Deltas folded into the sketches per transaction.
+FOLD_BATCH_SIZE = 10000
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary (Metwally, Agrawal and El Abbadi) of a weighted
+    stream in at most ``capacity`` counters of ``[count, error]`` per key.
+    """
+
+    def __init__(self, capacity, counters=None, total=0, base=0):
+        self.capacity = capacity
+        self.counters = counters or {}
+        self.total = total
+        # Most a key without a counter may have had, before any eviction.
+        self.base = base
+
+    @property
+    def floor(self):
+        """The most a key without a counter may have been added."""
+        if len(self.counters) < self.capacity:
+            return self.base
+        return max(self.base, min(count for count, _ in self.counters.values()))
+
+    def add(self, key, weight=1):
+        self.total += weight
+        if key in self.counters:
+            self.counters[key][0] += weight
+            return
+        floor = self.floor
+        if len(self.counters) >= self.capacity:
+            del self.counters[min(self.counters, key=lambda name: (self.counters[name][0], name))]
+        self.counters[key] = [floor + weight, floor]
+
+    def update(self, weights):
+        """Add a mapping of key to weight, heaviest first so they are the least likely to be evicted."""
+        for key, weight in sorted(weights.items(), key=lambda item: (-item[1], item[0])):
+            self.add(key, weight)
+
+    def top(self, limit=None):
+        """``(key, count, error)`` of the largest counters, largest first."""
+        ranked = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(key, count, error) for key, (count, error) in ranked[:limit]]
+
+    @classmethod
+    def from_counts(cls, counts, capacity):
+        """A summary of exact ``counts``: the ``capacity`` largest, with no error."""
+        summary = cls(capacity, total=sum(counts.values()))
+        for key, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:capacity]:
+            summary.counters[key] = [count, 0]
+        return summary
+
+    @classmethod
+    def merge(cls, summaries, capacity):
+        """
+        Combine summaries of disjoint streams (Agarwal et al., "Mergeable
+        summaries"): a key missing from a summary is counted at that
+        summary's floor, then the ``capacity`` largest counters are kept.
+        """
+        summaries = list(summaries)
+        floors = [summary.floor for summary in summaries]
+        base = sum(floors)
+        merged = defaultdict(lambda: [base, base])
+        for summary, floor in zip(summaries, floors):
+            for key, (count, error) in summary.counters.items():
+                counter = merged[key]
+                counter[0] += count - floor
+                counter[1] += error - floor
+        kept = sorted(merged.items(), key=lambda item: (-item[1][0], item[0]))[:capacity]
+        return cls(capacity, dict(kept), total=sum(summary.total for summary in summaries), base=base)
+
+    def to_dict(self):
+        return {
+            'capacity': self.capacity,
+            'total': self.total,
+            'base': self.base,
+            'counters': [[key, count, error] for key, count, error in self.top()],
+        }
+
+    @classmethod
+    def from_dict(cls, data, capacity=None):
+        """Load ``to_dict`` output; an empty dict is an empty summary of ``capacity`` counters."""
+        counters = {key: [count, error] for key, count, error in data.get('counters', [])}
+        return cls(data.get('capacity', capacity), counters, data.get('total', 0), data.get('base', 0))
+
+
+def bucket_of(value):
+    """The start of the (UTC) hour containing the aware datetime ``value``."""
+    return value.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def record(units):
+    """Append ``{bucket: {product_name: quantity}}`` as deltas for the next fold."""
+    TopProductDelta.objects.bulk_create([
+        TopProductDelta(bucket=bucket, product_name=product_name, quantity=quantity)
+        for bucket, weights in units.items() for product_name, quantity in weights.items() if quantity
+    ], batch_size=LOOKUP_BATCH_SIZE)
+
+
+def fold_deltas(batch_size=FOLD_BATCH_SIZE):
+    """Add the recorded deltas to the sketches of their hours. Returns the number of deltas."""
+    folded = 0
+    while True:
+        with transaction.atomic():
+            rows = list(TopProductDelta.objects.order_by('pk').values_list(
+                'pk', 'bucket', 'product_name', 'quantity')[:batch_size])
+            if not rows:
+                return folded
+            units = defaultdict(lambda: defaultdict(int))
+            for _, bucket, product_name, quantity in rows:
+                units[bucket][product_name] += quantity
+            TopProductSketch.objects.bulk_create([TopProductSketch(bucket=bucket) for bucket in units],
+                                                 ignore_conflicts=True)
+            buckets = list(units)
+            for start in range(0, len(buckets), LOOKUP_BATCH_SIZE):
+                sketches = TopProductSketch.objects.select_for_update().filter(
+                    bucket__in=buckets[start:start + LOOKUP_BATCH_SIZE])
+                for row in sketches:
+                    sketch = SpaceSaving.from_dict(row.sketch, settings.TOP_PRODUCT_SKETCH_SIZE)
+                    sketch.update(units[row.bucket])
+                    row.sketch = sketch.to_dict()
+                    row.save(update_fields=['sketch'])
+            # Exactly the rows read: deltas committed meanwhile wait for the next fold.
+            pks = [pk for pk, *_ in rows]
+            for start in range(0, len(pks), LOOKUP_BATCH_SIZE):
+                TopProductDelta.objects.filter(pk__in=pks[start:start + LOOKUP_BATCH_SIZE]).delete()
+        folded += len(rows)
+        if len(rows) < batch_size:
+            return folded
+
+
+def mark_stale(datetimes):
+    """Mark the hours of orders created at ``datetimes`` for the next refresh."""
+    buckets = list({bucket_of(value) for value in datetimes if value is not None})
+    for start in range(0, len(buckets), LOOKUP_BATCH_SIZE):
+        batch = buckets[start:start + LOOKUP_BATCH_SIZE]
+        # An hour that had nothing counted yet gets a row too, so it is rebuilt.
+        TopProductSketch.objects.bulk_create([TopProductSketch(bucket=bucket, stale=True) for bucket in batch],
+                                             ignore_conflicts=True)
+        TopProductSketch.objects.filter(bucket__in=batch).update(stale=True)
+
+
+def rebuild(start_at, end_at):
+    """Recount the sketches of the hours from ``start_at`` to ``end_at`` from their items, exactly."""
+    start_at, end_at = bucket_of(start_at), bucket_of(end_at - datetime.timedelta(microseconds=1)) + HOUR
+    capacity = settings.TOP_PRODUCT_SKETCH_SIZE
+    with transaction.atomic():
+        # The items counted below include those of the deltas not folded yet.
+        TopProductDelta.objects.filter(bucket__gte=start_at, bucket__lt=end_at).delete()
+        counts = defaultdict(lambda: defaultdict(int))
+        for item_model in (OrderItem, ArchivedOrderItem):
+            rows = items_between(item_model, start_at, end_at).values(
+                'product_name', bucket=TruncHour('order__created_at', tzinfo=datetime.timezone.utc)
+            ).annotate(quantity=Sum('quantity')).values_list('bucket', 'product_name', 'quantity')
+            for bucket, product_name, quantity in rows:
+                counts[bucket][product_name] += quantity
+
+        TopProductSketch.objects.filter(bucket__gte=start_at, bucket__lt=end_at).delete()
+        TopProductSketch.objects.bulk_create([
+            TopProductSketch(bucket=bucket, sketch=SpaceSaving.from_counts(products, capacity).to_dict())
+            for bucket, products in counts.items() if any(products.values())
+        ], batch_size=LOOKUP_BATCH_SIZE)
+    return len(counts)
+
+
+def refresh_stale():
+    """Fold the recorded deltas, then rebuild the hours marked stale. Returns the number of hours rebuilt."""
+    fold_deltas()
+    with transaction.atomic():
+        buckets = sorted(TopProductSketch.objects.filter(stale=True).values_list('bucket', flat=True))
+        runs = []
+        for bucket in buckets:
+            if runs and bucket - runs[-1][1] == HOUR:
+                runs[-1][1] = bucket
+            else:
+                runs.append([bucket, bucket])
+        for first, last in runs:
+            rebuild(first, last + HOUR)
+    return len(buckets)
+
+
+def window(hours, now=None):
+    """The bounds of the last ``hours`` hours, the current one included."""
+    end_at = bucket_of(now or timezone.now()) + HOUR
+    return end_at - hours * HOUR, end_at
+
+
+def merged_sketch(start_at, end_at):
+    """The sketches of the hours from ``start_at`` to ``end_at``, and their pending deltas, merged into one."""
+    capacity = settings.TOP_PRODUCT_SKETCH_SIZE
+    rows = TopProductSketch.objects.filter(bucket__gte=bucket_of(start_at), bucket__lt=end_at).values_list(
+        'sketch', flat=True)
+    summaries = [SpaceSaving.from_dict(data, capacity) for data in rows]
+    pending = dict(TopProductDelta.objects.filter(bucket__gte=bucket_of(start_at), bucket__lt=end_at).values(
+        'product_name').annotate(quantity=Sum('quantity')).values_list('product_name', 'quantity'))
+    if pending:
+        summaries.append(SpaceSaving.from_counts(pending, capacity))
+    return SpaceSaving.merge(summaries, capacity)
+
+
+def top_products(limit=10, hours=24, start_at=None, end_at=None, now=None):
+    """
+    The ``limit`` products with the most units sold in the last ``hours``
+    hours, or in the hours from ``start_at`` to ``end_at``, estimated from
+    the sketches.
+
+    Returns dicts with ``product_name``, ``quantity`` (never below the units
+    sold), ``error`` (the most ``quantity`` may be above them) and
+    ``guaranteed``, set when the product is certain to be in the exact top
+    ``limit``.
+    """
+    if start_at is None or end_at is None:
+        start_at, end_at = window(hours, now)
+    sketch = merged_sketch(start_at, end_at)
+    ranked = sketch.top(limit + 1)
+    # The most any product outside the results may have sold.
+    runner_up = max(ranked[limit][1] if len(ranked) > limit else 0, sketch.floor)
+    return [
+        {'product_name': name, 'quantity': count, 'error': error, 'guaranteed': count - error >= runner_up}
+        for name, count, error in ranked[:limit]
+    ]
+
+
+def _units(items, orders):
+    """``{bucket: {product_name: quantity}}`` of ``items``, given ``{order_id: (created_at, counted)}``."""
+    units = defaultdict(lambda: defaultdict(int))
+    for item in items:
+        created_at, counted = orders[item.order_id]
+        if counted:
+            units[bucket_of(created_at)][item.product_name] += item.quantity
+    return units
+
+
+@receiver(post_save, sender=OrderItem)
+def count_saved_item(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    row = Order.objects.filter(pk=instance.order_id).values_list('created_at', 'status', 'payment_status').first()
+    if row is None:
+        return
+    created_at, status, payment_status = row
+    if created:
+        record(_units([instance], {instance.order_id: (created_at, SalesMetric.is_counted(status, payment_status))}))
+    else:
+        mark_stale([created_at])
+
+
+@receiver(order_items_created, sender=OrderItem)
+def count_created_items(sender, items, **kwargs):
+    orders = {item.order_id: (item.order.created_at, SalesMetric.is_counted(item.order.status,
+                                                                            item.order.payment_status))
+              for item in items}
+    record(_units(items, orders))
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def mark_order_stale(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # A new order has no items yet; recalculated totals do not change units.
+    if raw or created or (update_fields is not None and not ORDER_FIELDS & set(update_fields)):
+        return
+    if not is_archiving():
+        mark_stale([instance.created_at])
+
+
+@receiver(post_delete, sender=OrderItem)
+def mark_item_stale(sender, instance, **kwargs):
+    if is_archiving():
+        return
+    mark_stale(Order.objects.filter(pk=instance.order_id).values_list('created_at', flat=True))
+
+
+@receiver(order_status_changed, sender=Order)
+def mark_transitions_stale(sender, transitions, **kwargs):
+    order_ids = list({order_id for order_id, _, _ in transitions})
+    created = []
+    for start in range(0, len(order_ids), LOOKUP_BATCH_SIZE):
+        created += Order.objects.filter(pk__in=order_ids[start:start + LOOKUP_BATCH_SIZE]).values_list(
+            'created_at', flat=True)
+    mark_stale(created)
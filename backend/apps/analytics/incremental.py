@@ -0,0 +1,345 @@
+"""
+Incremental maintenance of the daily ``SalesMetric`` rows.
+
+Instead of re-scanning a day's orders, every order write applies its change
+to the day's row with ``F()`` updates, in the transaction of the write:
+
+- a new order (``post_save``, or ``orders_created`` for bulk inserts) adds
+  its amount, one order and its buyer; new items (``post_save`` of an item,
+  or ``order_items_created``) add their units to their product;
+- a saved order that was paid, refunded, had its payment fail, changed its
+  total or buyer is taken out of the day in its previous state and added
+  back in its new one, items included when it stops or starts counting;
+- a cancellation through the transition engine takes the order out, once
+  the status change has been committed.
+
+An order counts towards the day it was created on unless it is cancelled or
+its payment failed or was refunded, the same rule ``SalesMetric.compute_for_date``
+applies. The number of customers and the top product are not additive, so
+two small per-day tallies are kept alongside: ``SalesMetricBuyer`` (orders
+per buyer) and ``SalesMetricProduct`` (units per product name). After each
+change the day's customer count, average order value and top product are
+read back from the row and the tallies, a handful of indexed statements
+however many orders the day has.
+
+An order or item deleted outright is taken out of its day before the row
+goes. Archiving changes nothing: archived orders keep counting, since the
+recompute reads the archive too. ``check_sales_metrics`` compares stored days with a full
+recompute and, with ``--fix``, recalculates the days that drifted.
+"""
+from collections import Counter, defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.orders.archive import is_archiving
+from apps.orders.models import Order, OrderItem
+from apps.orders.signals import order_items_created, order_status_changed, orders_created
+
+from .models import DashboardDataVersion, SalesMetric, SalesMetricBuyer, SalesMetricProduct
+
+CENT = Decimal('0.01')
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+LOOKUP_BATCH_SIZE = 500
+
+# Order fields a metric depends on, in the order OrderState is built from.
+STATE_FIELDS = ('created_at', 'total_amount', 'status', 'payment_status', 'user_id', 'customer_id')
+_STATE_UPDATE_FIELDS = {'created_at', 'total_amount', 'status', 'payment_status', 'user', 'customer'}
+
+OrderState = namedtuple('OrderState', 'date amount counted buyers')
+
+
+def order_date(created_at):
+    """The day an order created at ``created_at`` is counted on."""
+    return timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+
+
+def order_state(created_at, total_amount, status, payment_status, user_id, customer_id):
+    buyers = []
+    if user_id is not None:
+        buyers.append(('user', user_id))
+    if customer_id is not None:
+        buyers.append(('customer', customer_id))
+    return OrderState(order_date(created_at), Decimal(str(total_amount)),
+                      SalesMetric.is_counted(status, payment_status), tuple(buyers))
+
+
+def _instance_state(order):
+    return order_state(*(getattr(order, field) for field in STATE_FIELDS))
+
+
+class MetricDeltas:
+    """Changes to apply to the daily metrics, accumulated per day."""
+
+    def __init__(self):
+        self.sales = defaultdict(Decimal)
+        self.orders = Counter()
+        self.buyers = Counter()
+        self.products = Counter()
+
+    def add_order(self, state, sign=1):
+        """Add (or with ``sign=-1`` take out) an order's amount, count and buyers."""
+        if not state.counted:
+            return
+        self.sales[state.date] += sign * state.amount
+        self.orders[state.date] += sign
+        for kind, buyer_id in state.buyers:
+            self.buyers[(state.date, kind, buyer_id)] += sign
+
+    def add_items(self, state, items, sign=1):
+        """Add (or take out) the ``(product_name, quantity)`` items of an order."""
+        if not state.counted:
+            return
+        for product_name, quantity in items:
+            self.products[(state.date, product_name)] += sign * quantity
+
+    def apply(self):
+        """Apply the changes with atomic increments and refresh the derived fields of the days touched."""
+        buyers = [(date, kind, buyer_id, n) for (date, kind, buyer_id), n in self.buyers.items() if n]
+        products = [(date, name, quantity) for (date, name), quantity in self.products.items() if quantity]
+        totals = {date: (self.sales[date], self.orders[date]) for date in set(self.sales) | set(self.orders)
+                  if self.sales[date] or self.orders[date]}
+        dates = sorted(set(totals) | {row[0] for row in buyers} | {row[0] for row in products})
+        if not dates:
+            return
+
+        # No savepoint: a failure must roll back the order write as well.
+        with transaction.atomic(savepoint=False):
+            SalesMetric.objects.bulk_create([SalesMetric(date=date) for date in dates], ignore_conflicts=True)
+            for date, (sales, orders) in totals.items():
+                SalesMetric.objects.filter(date=date).update(
+                    total_sales=F('total_sales') + sales, total_orders=F('total_orders') + orders
+                )
+            if buyers:
+                _increment(SalesMetricBuyer, ('date', 'kind', 'buyer_id'), 'orders', buyers)
+                if any(row[-1] < 0 for row in buyers):
+                    SalesMetricBuyer.objects.filter(date__in=dates, orders__lte=0).delete()
+            if products:
+                _increment(SalesMetricProduct, ('date', 'product_name'), 'quantity', products)
+                if any(row[-1] < 0 for row in products):
+                    SalesMetricProduct.objects.filter(date__in=dates, quantity__lte=0).delete()
+            refresh_derived(dates, totals=bool(totals), customers=bool(buyers), top_product=bool(products))
+
+
+def _increment(model, key_fields, field, rows):
+    """Add each row's last value to ``field`` of the ``model`` row keyed by the others, inserting it if missing."""
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = [quote(model._meta.get_field(name).column) for name in (*key_fields, field)]
+    target = columns[-1]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(columns[:-1])}) DO UPDATE SET {target} = {table}.{target} + excluded.{target}"
+    )
+    adapt = connection.ops.adapt_datefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(adapt(row[0]), *row[1:]) for row in rows])
+
+
+def refresh_derived(dates, totals=True, customers=True, top_product=True):
+    """
+    Recompute the fields of ``dates`` derived from the totals (the average
+    order value) and from the tallies (customer count and top product).
+    """
+    counts = {}
+    if customers:
+        counts = dict(SalesMetricBuyer.objects.filter(date__in=dates).values('date').annotate(buyers=Count('pk'))
+                      .values_list('date', 'buyers'))
+    stored = {}
+    if totals:
+        stored = {date: (sales, orders) for date, sales, orders in SalesMetric.objects.filter(date__in=dates)
+                  .values_list('date', 'total_sales', 'total_orders')}
+    for date in dates:
+        values = {}
+        if totals:
+            sales, orders = stored[date]
+            values['average_order_value'] = sales / orders if orders > 0 else 0
+        if customers:
+            values['total_customers'] = counts.get(date, 0)
+        if top_product:
+            values['top_product'] = (
+                SalesMetricProduct.objects.filter(date=date, quantity__gt=0).order_by('-quantity', 'product_name')
+                .values_list('product_name', flat=True).first()
+            )
+        if values:
+            SalesMetric.objects.filter(date=date).update(**values)
+    DashboardDataVersion.bump_after_commit('orders')
+
+
+def _order_items(order_ids):
+    """Return the ``(product_name, quantity)`` items of each order in ``order_ids``."""
+    order_ids = list(order_ids)
+    items = defaultdict(list)
+    for start in range(0, len(order_ids), LOOKUP_BATCH_SIZE):
+        rows = OrderItem.objects.filter(order_id__in=order_ids[start:start + LOOKUP_BATCH_SIZE]).values_list(
+            'order_id', 'product_name', 'quantity')
+        for order_id, product_name, quantity in rows:
+            items[order_id].append((product_name, quantity))
+    return items
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Read the stored state of an order about to be saved, to take it out of its day afterwards."""
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not _STATE_UPDATE_FIELDS & set(update_fields):
+        return
+    row = Order.objects.filter(pk=instance.pk).values_list(*STATE_FIELDS).first()
+    if row is not None:
+        instance._sales_metric_state = order_state(*row)
+
+
+@receiver(post_save, sender=Order)
+def apply_saved_order(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = MetricDeltas()
+    new = _instance_state(instance)
+    if created:
+        # Items are added by their own signals once inserted.
+        deltas.add_order(new)
+    else:
+        old = instance.__dict__.pop('_sales_metric_state', None)
+        if old is None or old == new:
+            return
+        deltas.add_order(old, -1)
+        deltas.add_order(new)
+        if (old.counted, old.date) != (new.counted, new.date):
+            items = _order_items([instance.pk])[instance.pk]
+            deltas.add_items(old, items, -1)
+            deltas.add_items(new, items)
+    deltas.apply()
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_item_state(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._sales_metric_item = OrderItem.objects.filter(pk=instance.pk).values_list(
+        'product_name', 'quantity').first()
+
+
+@receiver(post_save, sender=OrderItem)
+def apply_saved_item(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance.__dict__.pop('_sales_metric_item', None)
+    new = (instance.product_name, instance.quantity)
+    if old == new:
+        return
+    row = Order.objects.filter(pk=instance.order_id).values_list(*STATE_FIELDS).first()
+    if row is None:
+        return
+    state = order_state(*row)
+    deltas = MetricDeltas()
+    if old is not None:
+        deltas.add_items(state, [old], -1)
+    deltas.add_items(state, [new])
+    deltas.apply()
+
+
+@receiver(pre_delete, sender=Order)
+def apply_deleted_order(sender, instance, **kwargs):
+    """Take a deleted order out of its day; its items are taken out by their own receiver."""
+    if is_archiving():
+        return
+    row = Order.objects.filter(pk=instance.pk).values_list(*STATE_FIELDS).first()
+    if row is not None:
+        deltas = MetricDeltas()
+        deltas.add_order(order_state(*row), -1)
+        deltas.apply()
+
+
+@receiver(pre_delete, sender=OrderItem)
+def apply_deleted_item(sender, instance, **kwargs):
+    # Deleting an order sends this for each item while the order row still exists.
+    if is_archiving():
+        return
+    row = OrderItem.objects.filter(pk=instance.pk).values_list(
+        'product_name', 'quantity', *(f'order__{field}' for field in STATE_FIELDS)).first()
+    if row is not None:
+        deltas = MetricDeltas()
+        deltas.add_items(order_state(*row[2:]), [row[:2]], -1)
+        deltas.apply()
+
+
+@receiver(orders_created, sender=Order)
+def apply_created_orders(sender, orders, **kwargs):
+    deltas = MetricDeltas()
+    for order in orders:
+        deltas.add_order(_instance_state(order))
+    deltas.apply()
+
+
+@receiver(order_items_created, sender=OrderItem)
+def apply_created_items(sender, items, **kwargs):
+    deltas = MetricDeltas()
+    states = {}
+    for item in items:
+        if item.order_id not in states:
+            states[item.order_id] = _instance_state(item.order)
+        deltas.add_items(states[item.order_id], [(item.product_name, item.quantity)])
+    deltas.apply()
+
+
+@receiver(order_status_changed, sender=Order)
+def apply_status_changes(sender, transitions, **kwargs):
+    """Take cancelled orders out of their day (and put back any that stop being excluded)."""
+    excluded = SalesMetric.EXCLUDED_STATUSES
+    changed = {}
+    for order_id, from_status, to_status in transitions:
+        if (from_status in excluded) == (to_status in excluded) and order_id not in changed:
+            continue
+        first_status = changed.get(order_id, (from_status, None))[0]
+        changed[order_id] = (first_status, to_status)
+    order_ids = list(changed)
+    rows = []
+    for start in range(0, len(order_ids), LOOKUP_BATCH_SIZE):
+        rows += Order.objects.filter(pk__in=order_ids[start:start + LOOKUP_BATCH_SIZE]).values_list(
+            'pk', *STATE_FIELDS)
+
+    deltas = MetricDeltas()
+    flipped = []
+    for pk, created_at, total_amount, _, payment_status, user_id, customer_id in rows:
+        from_status, to_status = changed[pk]
+        old = order_state(created_at, total_amount, from_status, payment_status, user_id, customer_id)
+        new = order_state(created_at, total_amount, to_status, payment_status, user_id, customer_id)
+        if old.counted != new.counted:
+            flipped.append((pk, old, new))
+    items = _order_items(pk for pk, _, _ in flipped)
+    for pk, old, new in flipped:
+        deltas.add_order(old, -1)
+        deltas.add_items(old, items[pk], -1)
+        deltas.add_order(new)
+        deltas.add_items(new, items[pk])
+    deltas.apply()
+
+
+def compare_with_recompute(dates):
+    """
+    Compare the stored metrics of ``dates`` with a full recompute. Returns
+    ``(date, field, stored, expected)`` for every difference. The average
+    order value, a rounded quotient, may differ by one cent.
+    """
+    fields = ('total_sales', 'total_orders', 'total_customers', 'average_order_value', 'top_product')
+    stored = {row['date']: row for row in SalesMetric.objects.filter(date__in=dates).values('date', *fields)}
+    differences = []
+    for date in dates:
+        expected, _, _ = SalesMetric.compute_for_date(date)
+        expected['average_order_value'] = Decimal(expected['average_order_value']).quantize(CENT)
+        row = stored.get(date)
+        if row is None:
+            if expected['total_orders']:
+                differences.append((date, 'row', None, 'missing'))
+            continue
+        for field in fields:
+            if field == 'average_order_value' and abs(row[field] - expected[field]) <= CENT:
+                continue
+            if row[field] != expected[field]:
+                differences.append((date, field, row[field], expected[field]))
+    return differences
@@ -0,0 +1,135 @@
+import datetime
+import random
+import tempfile
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.analytics.columnar import SETTLE_SECONDS, export_table, latest, open_table
+from apps.analytics.models import OrderItemDeletion
+from apps.orders.models import Order, OrderItem
+
+PRODUCTS = [f'Bench product {i}' for i in range(500)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the columnar export of orders and items and a revenue-per-product scan over the "
+        "memory-mapped columns against the same scan through the ORM, then re-export after updating "
+        "some orders and items and deleting some items. Synthetic orders are inserted inside a transaction that is rolled back; the export "
+        "goes to a temporary directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200_000)
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory, transaction.atomic():
+            self.stdout.write(f"Inserting {options['orders']} orders...")
+            self.populate(options['orders'])
+            count = Order.objects.count()
+
+            for name in ('orders', 'order_items', 'order_item_deletions'):
+                started = time.perf_counter()
+                rows = export_table(name, directory=directory, chunk_size=options['chunk_size'])
+                self.stdout.write(f"Exported {rows} {name} in {time.perf_counter() - started:.2f}s")
+
+            started = time.perf_counter()
+            expected = self.orm_revenue()
+            orm_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            actual = self.columnar_revenue(directory)
+            columnar_seconds = time.perf_counter() - started
+            self.stdout.write(f"Revenue per product: ORM {orm_seconds:.2f}s, memory-mapped columns "
+                              f"{columnar_seconds:.3f}s ({orm_seconds / columnar_seconds:.0f}x faster)")
+            if actual != expected:
+                raise CommandError("Columnar revenue per product differs from the ORM")
+
+            # Cancel some orders and export again: only they are appended.
+            changed = list(Order.objects.filter(status='completed').values_list('pk', flat=True)[::50])
+            Order.objects.filter(pk__in=changed[:500]).update(
+                status='cancelled', updated_at=timezone.now() - datetime.timedelta(minutes=5))
+            rows = export_table('orders', directory=directory, chunk_size=options['chunk_size'])
+            orders, order_manifest = open_table('orders', ['id', 'status'], directory)
+            current = latest(orders['id'])
+            cancelled = order_manifest['categories']['status'].index('cancelled')
+            self.stdout.write(f"Re-export appended {rows} changed orders")
+            if rows != len(changed[:500]) or len(current) != count or (
+                    orders['status'][current] == cancelled).sum() != Order.objects.filter(status='cancelled').count():
+                raise CommandError("Incremental export does not match the orders")
+
+            # Change and delete some items: the changes are appended and the deletions recorded.
+            settled = timezone.now() - datetime.timedelta(seconds=SETTLE_SECONDS + 1)
+            item_ids = list(OrderItem.objects.values_list('pk', flat=True)[::100])
+            edited, deleted = item_ids[:200], item_ids[200:400]
+            OrderItem.objects.filter(pk__in=edited).update(
+                quantity=F('quantity') + 1, subtotal=F('subtotal') + F('unit_price'),
+                updated_at=settled)
+            OrderItem.objects.filter(pk__in=deleted).delete()
+            OrderItemDeletion.objects.update(deleted_at=settled)
+            rows = export_table('order_items', directory=directory, chunk_size=options['chunk_size'])
+            tombstones = export_table('order_item_deletions', directory=directory, chunk_size=options['chunk_size'])
+            self.stdout.write(f"Re-export appended {rows} changed items and {tombstones} deletions")
+            if (rows, tombstones) != (len(edited), len(deleted)) or (
+                    self.columnar_revenue(directory) != self.orm_revenue()):
+                raise CommandError("Incremental export does not match the items")
+
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Columnar export matches the database"))
+
+    def orm_revenue(self):
+        revenue = defaultdict(int)
+        for name, subtotal, status in OrderItem.objects.values_list(
+                'product_name', 'subtotal', 'order__status').iterator(chunk_size=10_000):
+            if status == 'completed':
+                revenue[name] += int(subtotal.scaleb(2))
+        return dict(revenue)
+
+    def columnar_revenue(self, directory):
+        items, manifest = open_table('order_items', ['id', 'order_id', 'product_name', 'subtotal'], directory)
+        deletions, _ = open_table('order_item_deletions', ['item_id'], directory)
+        orders, order_manifest = open_table('orders', ['id', 'status'], directory)
+        current = latest(orders['id'])
+        status = orders['status'][current]
+        completed = orders['id'][current][status == order_manifest['categories']['status'].index('completed')]
+        rows = latest(items['id'], deletions['item_id'])
+        rows = rows[np.isin(items['order_id'][rows], completed)]
+        revenue = np.bincount(items['product_name'][rows], weights=items['subtotal'][rows],
+                              minlength=len(manifest['categories']['product_name']))
+        return {name: int(cents) for name, cents in zip(manifest['categories']['product_name'], revenue) if cents}
+
+    def populate(self, total, batch_size=5000):
+        rng = random.Random(23)
+        # Older than the export's settle delay.
+        start = timezone.now() - datetime.timedelta(days=365)
+        statuses = ['completed'] * 6 + ['pending', 'cancelled']
+        for offset in range(0, total, batch_size):
+            orders = Order.objects.bulk_create([
+                Order(
+                    order_number=f'BENCH-{i:010d}',
+                    status=rng.choice(statuses),
+                    payment_method=rng.choice(['cash', 'credit_card', 'mobile_payment']),
+                    total_amount=Decimal('10.00'),
+                    created_at=start + datetime.timedelta(seconds=i * 30),
+                )
+                for i in range(offset, min(offset + batch_size, total))
+            ])
+            items = []
+            for order in orders:
+                for _ in range(rng.randint(1, 5)):
+                    quantity = rng.randint(1, 4)
+                    unit_price = Decimal(rng.randint(50, 5000)) / 100
+                    items.append(OrderItem(order=order, product_name=rng.choice(PRODUCTS), product_id=1,
+                                           product_type='inventory', quantity=quantity, unit_price=unit_price,
+                                           subtotal=unit_price * quantity))
+            OrderItem.objects.bulk_create(items)
+        Order.objects.filter(order_number__startswith='BENCH-').update(updated_at=F('created_at'))
+        OrderItem.objects.filter(order__order_number__startswith='BENCH-').update(updated_at=start)
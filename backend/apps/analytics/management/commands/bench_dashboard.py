@@ -0,0 +1,83 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from apps.analytics.dashboard import WIDGETS, get_pool, load_dashboard
+
+
+class QueryCounter:
+    """Count queries on every connection opened or used while active, in any thread."""
+
+    def __init__(self, connections):
+        self.count = 0
+        self.lock = threading.Lock()
+        self.wrapped = []
+        for connection in connections:
+            self.wrap(connection)
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def wrap(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            self.wrapped.append(connection)
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self.wrap)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.wrap)
+        for connection in self.wrapped:
+            connection.execute_wrappers.remove(self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark loading a dashboard with every widget type: computing the widgets one after another, "
+        "a cold load through the thread pool, and a warm load from the cache. Uses the first superuser."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(is_superuser=True).first() or get_user_model().objects.first()
+        if user is None:
+            raise CommandError("No user to load a dashboard for")
+        widgets = [(widget_type, position, {}) for position, widget_type in enumerate(WIDGETS)]
+        get_pool()  # Start the pool outside the timings.
+
+        def run(label, load, clear):
+            samples = []
+            queries = []
+            for _ in range(options['repeat']):
+                if clear:
+                    cache.clear()
+                with QueryCounter(connections.all()) as counter:
+                    started = time.perf_counter()
+                    result = load()
+                    samples.append((time.perf_counter() - started) * 1000)
+                queries.append(counter.count)
+            self.stdout.write(f"{label:>16}: {statistics.median(samples):8.2f} ms, "
+                              f"{statistics.median(queries):.0f} queries")
+            return result
+
+        run('serial', lambda: [WIDGETS[widget_type].compute({}) for widget_type, _, _ in widgets], clear=True)
+        run('cold (pool)', lambda: load_dashboard(user, widgets), clear=True)
+        warm = run('warm', lambda: load_dashboard(user, widgets), clear=False)
+        if not all(widget['cached'] for widget in warm):
+            raise CommandError("A warm load computed widgets again")
+        failed = [widget['widget_type'] for widget in warm if 'error' in widget]
+        if failed:
+            raise CommandError(f"Widgets failed: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(f"{len(widgets)} widgets served from the cache on warm loads"))
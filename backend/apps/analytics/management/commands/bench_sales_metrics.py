@@ -0,0 +1,139 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.analytics.models import SalesMetric, SalesMetricBuyer, SalesMetricProduct
+from apps.orders.models import ArchivedOrder, ArchivedOrderItem, Customer, Order, OrderItem
+
+PRODUCTS = [f'Bench product {i}' for i in range(60)]
+COMPARED_FIELDS = ('total_sales', 'total_orders', 'total_customers', 'average_order_value', 'top_product')
+
+
+class QueryCounter:
+    """Count the queries run inside the block, without keeping their SQL."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.wrapper = connection.execute_wrapper(self)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.wrapper.__exit__(*exc_info)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark recalculating daily sales metrics day by day against the set-based "
+        "SalesMetric.calculate_for_period, and check both give the same rows. Synthetic live and "
+        "archived orders are inserted inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=730)
+        parser.add_argument('--orders-per-day', type=int, default=50)
+        parser.add_argument('--archived', type=float, default=0.5, help="Share of the orders that is archived")
+
+    def handle(self, *args, **options):
+        # Synthetic days well before any real sales.
+        start = datetime.date(2001, 1, 1)
+        end = start + datetime.timedelta(days=options['days'] - 1)
+
+        with transaction.atomic():
+            self.stdout.write(f"Inserting {options['days'] * options['orders_per_day']} orders...")
+            self.populate(start, options['days'], options['orders_per_day'], options['archived'])
+
+            started = time.perf_counter()
+            with QueryCounter() as daily_queries:
+                date = start
+                while date <= end:
+                    SalesMetric.calculate_for_date(date)
+                    date += datetime.timedelta(days=1)
+            daily_seconds = time.perf_counter() - started
+            expected = self.snapshot(start, end)
+
+            SalesMetric.objects.filter(date__range=(start, end)).delete()
+            SalesMetricBuyer.objects.filter(date__range=(start, end)).delete()
+            SalesMetricProduct.objects.filter(date__range=(start, end)).delete()
+
+            started = time.perf_counter()
+            with QueryCounter() as period_queries:
+                SalesMetric.calculate_for_period(start, end)
+            period_seconds = time.perf_counter() - started
+            actual = self.snapshot(start, end)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Day by day: {daily_seconds:.2f}s, {daily_queries.count} queries")
+        self.stdout.write(f"Set-based:  {period_seconds:.2f}s, {period_queries.count} queries "
+                          f"({daily_seconds / period_seconds:.1f}x faster)")
+        if actual != expected:
+            differing = [key for key in expected if actual.get(key) != expected[key]]
+            for key in differing[:10]:
+                self.stdout.write(f"{key}: day by day {expected[key]}, set-based {actual.get(key)}")
+            raise CommandError(f"{len(differing)} rows differ")
+        self.stdout.write(self.style.SUCCESS(f"{len(expected)} metric and tally rows match"))
+
+    def populate(self, start, days, per_day, archived_share, batch_size=5000):
+        rng = random.Random(21)
+        tz = timezone.get_current_timezone()
+        customers = Customer.objects.bulk_create([
+            Customer(name=f'Bench customer {i}', email=f'bench-metrics-{i}@example.com') for i in range(200)
+        ])
+        payment_statuses = ['completed'] * 8 + ['pending', 'failed', 'refunded']
+        statuses = ['completed'] * 6 + ['pending', 'processing', 'cancelled']
+        live, archived = [], []
+        for number in range(days * per_day):
+            day = start + datetime.timedelta(days=number // per_day)
+            created_at = timezone.make_aware(
+                datetime.datetime.combine(day, datetime.time(rng.randint(0, 23), rng.randint(0, 59))), tz)
+            fields = dict(
+                order_number=f'BENCH-{number:010d}', status=rng.choice(statuses),
+                payment_status=rng.choice(payment_statuses), payment_method='credit_card',
+                customer=rng.choice(customers) if rng.random() < 0.8 else None,
+                total_amount=Decimal(rng.randint(100, 20000)) / 100, created_at=created_at,
+            )
+            if rng.random() < archived_share:
+                archived.append(ArchivedOrder(id=10**12 + number, updated_at=created_at, archived_at=created_at,
+                                              **fields))
+            else:
+                live.append(Order(**fields))
+
+        def items(order):
+            for _ in range(rng.randint(1, 4)):
+                quantity = rng.randint(1, 5)
+                yield dict(order=order, product_name=rng.choice(PRODUCTS), product_id=1, product_type='other',
+                           quantity=quantity, unit_price=Decimal('2.50'), subtotal=Decimal('2.50') * quantity)
+
+        live = Order.objects.bulk_create(live, batch_size=batch_size)
+        ArchivedOrder.objects.bulk_create(archived, batch_size=batch_size)
+        OrderItem.objects.bulk_create([OrderItem(**item) for order in live for item in items(order)],
+                                      batch_size=batch_size)
+        ArchivedOrderItem.objects.bulk_create(
+            [ArchivedOrderItem(id=10**12 + i, **item)
+             for i, item in enumerate(item for order in archived for item in items(order))],
+            batch_size=batch_size,
+        )
+
+    def snapshot(self, start, end):
+        rows = {}
+        for values in SalesMetric.objects.filter(date__range=(start, end)).values('date', *COMPARED_FIELDS):
+            rows[('metric', values.pop('date'))] = values
+        for date, kind, buyer_id, orders in SalesMetricBuyer.objects.filter(date__range=(start, end)).values_list(
+                'date', 'kind', 'buyer_id', 'orders'):
+            rows[('buyer', date, kind, buyer_id)] = orders
+        for date, name, quantity in SalesMetricProduct.objects.filter(date__range=(start, end)).values_list(
+                'date', 'product_name', 'quantity'):
+            rows[('product', date, name)] = quantity
+        return rows
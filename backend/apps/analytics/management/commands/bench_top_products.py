@@ -0,0 +1,148 @@
+import datetime
+import json
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from apps.analytics.heavy_hitters import count_created_items, fold_deltas, refresh_stale, top_products, window
+from apps.analytics.models import TopProductSketch
+from apps.analytics.periods import items_between
+from apps.orders.models import Order, OrderItem
+from apps.orders.signals import orders_created
+
+WINDOWS = (1, 24, 7 * 24)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the top product sketches against exact GROUP BY queries: stream synthetic orders "
+        "with Zipf-distributed products into the sketches hour by hour, fold them, then cancel some orders and "
+        "refresh the stale hours, comparing the top products of the last 1, 24 and 168 hours before "
+        "and after. Checks the sketch guarantees. Orders are inserted inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=7 * 24)
+        parser.add_argument('--orders-per-hour', type=int, default=60)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent of product popularity")
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--cancel', type=float, default=0.02, help="Share of the orders cancelled afterwards")
+
+    def handle(self, *args, **options):
+        # Synthetic hours well before any real sales.
+        start = datetime.datetime(2001, 1, 1, tzinfo=datetime.timezone.utc)
+        now = start + (options['hours'] - 1) * datetime.timedelta(hours=1)
+
+        with transaction.atomic():
+            self.stdout.write(f"Streaming {options['hours'] * options['orders_per_hour']} orders...")
+            feed_seconds = self.populate(start, options)
+            self.stdout.write(f"Recorded the deltas in {feed_seconds:.2f}s "
+                              f"({feed_seconds / (options['hours'] * options['orders_per_hour']) * 1000:.2f} ms per order)")
+            started = time.perf_counter()
+            deltas = fold_deltas()
+            self.stdout.write(f"Folded {deltas} deltas into the sketches in {time.perf_counter() - started:.2f}s")
+            sketches = list(TopProductSketch.objects.filter(bucket__gte=start).values_list('sketch', flat=True))
+            size = statistics.mean(len(json.dumps(sketch)) for sketch in sketches)
+            self.stdout.write(f"{len(sketches)} sketches, {size / 1024:.1f} KiB each on average")
+            failures = []
+            for hours in WINDOWS:
+                failures += self.compare(hours, now, options['limit'])
+
+            orders = list(Order.objects.filter(created_at__gte=start, created_at__lte=now + datetime.timedelta(
+                hours=1), status='completed').order_by('pk'))
+            cancelled = random.Random(25).sample(orders, int(len(orders) * options['cancel']))
+            for order in cancelled:
+                order.status = 'cancelled'
+                order.save(update_fields=['status'])
+            started = time.perf_counter()
+            hours = refresh_stale()
+            self.stdout.write(f"Cancelled {len(cancelled)} orders, rebuilt {hours} stale hours in "
+                              f"{time.perf_counter() - started:.2f}s")
+            for hours in WINDOWS:
+                failures += self.compare(hours, now, options['limit'])
+            transaction.set_rollback(True)
+
+        if failures:
+            for failure in failures[:10]:
+                self.stdout.write(failure)
+            raise CommandError(f"{len(failures)} estimates break the sketch guarantees")
+        self.stdout.write(self.style.SUCCESS("Every estimate is within its error bounds"))
+
+    def populate(self, start, options):
+        rng = random.Random(25)
+        products = [f'Bench product {i}' for i in range(options['products'])]
+        weights = [1 / (rank + 1) ** options['skew'] for rank in range(len(products))]
+        rng.shuffle(products)
+        statuses = ['completed'] * 9 + ['cancelled']
+        feed_seconds = 0
+        for hour in range(options['hours']):
+            hour_start = start + datetime.timedelta(hours=hour)
+            orders = Order.objects.bulk_create([
+                Order(order_number=f'BENCH-{hour:05d}-{number:05d}', status=rng.choice(statuses),
+                      payment_method='cash', total_amount=Decimal('10.00'),
+                      created_at=hour_start + datetime.timedelta(seconds=rng.randrange(3600)))
+                for number in range(options['orders_per_hour'])
+            ])
+            # The daily metrics count the orders, so cancelling them later takes them out again.
+            orders_created.send(sender=Order, orders=orders, customers=[])
+            items = []
+            for order in orders:
+                items.append([])
+                for name in rng.choices(products, weights, k=rng.randint(1, 4)):
+                    quantity = rng.randint(1, 5)
+                    items[-1].append(OrderItem(order=order, product_name=name, product_id=1, product_type='other',
+                                               quantity=quantity, unit_price=Decimal('2.50'),
+                                               subtotal=Decimal('2.50') * quantity))
+            OrderItem.objects.bulk_create([item for order_items in items for item in order_items])
+            # One order at a time, as create_order sends them, and the receiver
+            # alone so the other analytics receivers are not timed.
+            started = time.perf_counter()
+            for order_items in items:
+                count_created_items(sender=OrderItem, items=order_items)
+            feed_seconds += time.perf_counter() - started
+        return feed_seconds
+
+    def compare(self, hours, now, limit):
+        start_at, end_at = window(hours, now)
+
+        def exact():
+            return dict(items_between(OrderItem, start_at, end_at).values('product_name').annotate(
+                quantity=Sum('quantity')).values_list('product_name', 'quantity'))
+
+        def timed(function):
+            samples = []
+            for _ in range(5):
+                started = time.perf_counter()
+                result = function()
+                samples.append((time.perf_counter() - started) * 1000)
+            return result, statistics.median(samples)
+
+        sold, exact_ms = timed(exact)
+        estimated, sketch_ms = timed(lambda: top_products(limit=limit, hours=hours, now=now))
+        ranked = sorted(sold.items(), key=lambda item: (-item[1], item[0]))
+        threshold = ranked[limit - 1][1] if len(ranked) >= limit else 0
+        expected = {name for name, _ in ranked[:limit]}
+        total = sum(sold.values())
+
+        failures = []
+        for row in estimated:
+            actual = sold.get(row['product_name'], 0)
+            if not row['quantity'] - row['error'] <= actual <= row['quantity']:
+                failures.append(f"{hours}h {row['product_name']}: sold {actual}, estimated {row['quantity']} "
+                                f"- {row['error']}")
+            if row['guaranteed'] and actual < threshold:
+                failures.append(f"{hours}h {row['product_name']}: guaranteed but sold {actual} < {threshold}")
+        found = sum(row['product_name'] in expected for row in estimated)
+        overcount = max((row['quantity'] - sold.get(row['product_name'], 0) for row in estimated), default=0)
+        self.stdout.write(
+            f"last {hours:>3}h: top {limit} recall {found}/{len(expected)}, "
+            f"{sum(row['guaranteed'] for row in estimated)} guaranteed, largest overcount {overcount} of "
+            f"{total} units; exact {exact_ms:.1f} ms, sketches {sketch_ms:.1f} ms"
+        )
+        return failures
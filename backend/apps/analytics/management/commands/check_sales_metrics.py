@@ -0,0 +1,36 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.analytics.incremental import compare_with_recompute
+from apps.analytics.models import SalesMetric
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the incrementally maintained daily sales metrics with a full recompute. "
+        "--fix recalculates the days that differ."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Days to check, ending today")
+        parser.add_argument('--fix', action='store_true', help="Recalculate the days that differ")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        dates = [today - datetime.timedelta(days=offset) for offset in range(options['days'])]
+        differences = compare_with_recompute(dates)
+        self.report(differences)
+        if differences and options['fix']:
+            for date in sorted({difference[0] for difference in differences}):
+                SalesMetric.calculate_for_date(date)
+            self.stdout.write(self.style.SUCCESS(f"Recalculated {len({d[0] for d in differences})} days"))
+        elif differences:
+            raise CommandError(f"{len(differences)} differences in {len(dates)} days")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(dates)} days match a full recompute"))
+
+    def report(self, differences):
+        for date, field, stored, expected in differences:
+            self.stdout.write(f"{date} {field}: stored {stored}, recomputed {expected}")
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.analytics.columnar import EXPORT_TABLES, export_table, table_dir
+
+
+class Command(BaseCommand):
+    help = (
+        "Append orders, order items, item deletions and stock movements changed since the last run to "
+        "the columnar export in ANALYTICS_EXPORT_DIR (one memory-mappable .npy file per column). Safe to "
+        "interrupt and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', nargs='+', choices=list(EXPORT_TABLES), default=list(EXPORT_TABLES))
+        parser.add_argument('--directory', default=settings.ANALYTICS_EXPORT_DIR)
+        parser.add_argument('--chunk-size', type=int, default=settings.ANALYTICS_EXPORT_CHUNK_SIZE)
+        parser.add_argument('--full', action='store_true', help="Drop the existing export and start again")
+
+    def handle(self, *args, **options):
+        def progress(name, rows):
+            self.stdout.write(f"{name}: {rows} rows")
+
+        for name in options['tables']:
+            started = time.perf_counter()
+            rows = export_table(name, directory=options['directory'], chunk_size=options['chunk_size'],
+                                full=options['full'], progress=progress)
+            self.stdout.write(self.style.SUCCESS(
+                f"Appended {rows} rows to {table_dir(name, options['directory'])} "
+                f"in {time.perf_counter() - started:.1f}s"
+            ))
@@ -0,0 +1,29 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.analytics.rollups import refresh, refresh_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the sales rollups of the days changed since the last run, or of every day from "
+        "--start to --end (e.g. to backfill), and of the weeks and months containing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['start'] or options['end']:
+            if not (options['start'] and options['end']) or options['start'] > options['end']:
+                raise CommandError("--start and --end must both be given, --start first")
+            days = (options['end'] - options['start']).days + 1
+            refresh(options['start'] + datetime.timedelta(days=offset) for offset in range(days))
+        else:
+            days = refresh_stale()
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed rollups of {days} days in {time.perf_counter() - started:.2f}s"))
@@ -0,0 +1,29 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.analytics.heavy_hitters import rebuild, refresh_stale
+from apps.analytics.periods import day_bounds
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the top product sketches of the hours whose orders changed since they were counted, "
+        "or of every hour from --start to --end (e.g. to backfill)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['start'] or options['end']:
+            if not (options['start'] and options['end']) or options['start'] > options['end']:
+                raise CommandError("--start and --end must both be given, --start first")
+            hours = rebuild(*day_bounds(options['start'], options['end']))
+        else:
+            hours = refresh_stale()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt top product sketches of {hours} hours in {time.perf_counter() - started:.2f}s"))
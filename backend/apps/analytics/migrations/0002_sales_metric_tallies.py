@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesMetricBuyer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('user', 'User'), ('customer', 'Customer')], max_length=10)),
+                ('buyer_id', models.PositiveBigIntegerField()),
+                ('orders', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'kind', 'buyer_id'), name='sales_metric_buyer_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesMetricProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('product_name', models.CharField(max_length=200)),
+                ('quantity', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', '-quantity', 'product_name'], name='sales_metric_product_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'product_name'), name='sales_metric_product_unique')],
+            },
+        ),
+    ]
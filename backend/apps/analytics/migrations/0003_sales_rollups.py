@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_sales_metric_tallies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupStale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grain', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=10)),
+                ('period', models.DateField(help_text='Day of the hour, or first day of the day, week or month')),
+                ('hour', models.PositiveSmallIntegerField(default=0, help_text='Hour of the day for hour rows, 0 otherwise')),
+                ('dimension', models.CharField(choices=[('product', 'Product'), ('category', 'Category'), ('payment_method', 'Payment Method')], max_length=20)),
+                ('key', models.CharField(help_text="Product name, category id ('' if none) or payment method", max_length=200)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('grain', 'dimension', 'period', 'hour', 'key'), name='sales_rollup_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopProductSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the hour', unique=True)),
+                ('sketch', models.JSONField(blank=True, default=dict)),
+                ('stale', models.BooleanField(default=False, help_text='Orders of the hour changed since it was counted')),
+            ],
+        ),
+    ]
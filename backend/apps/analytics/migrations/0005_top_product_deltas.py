@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_top_product_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopProductDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(db_index=True, help_text='Start of the hour')),
+                ('product_name', models.CharField(max_length=200)),
+                ('quantity', models.PositiveIntegerField()),
+            ],
+        ),
+    ]
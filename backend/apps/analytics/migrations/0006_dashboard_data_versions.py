@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_top_product_deltas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardDataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=20, unique=True)),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_dashboard_data_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItemDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.BigIntegerField()),
+                ('order_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1,14 +1,26 @@
-from django.db import models
+import time
+from collections import Counter
+from functools import partial
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count, Avg
+from django.db.models import Sum, Count, Avg, F
 from django.utils import timezone
-from apps.orders.models import Order, OrderItem
+from apps.orders.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
 from apps.inventory.models import Product
 
 class SalesMetric(models.Model):
     """
     Model to store daily sales metrics for analytics.
+    
+    Rows are kept up to date as orders are written (see
+    ``apps.analytics.incremental``); ``calculate_for_date`` recomputes a day
+    from scratch to reconcile it.
     """
+    # Orders in these states are not counted as sales.
+    EXCLUDED_STATUSES = ('cancelled',)
+    EXCLUDED_PAYMENT_STATUSES = ('failed', 'refunded')
+    
     date = models.DateField(unique=True)
     total_sales = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total_orders = models.PositiveIntegerField(default=0)
@@ -20,70 +32,243 @@ class SalesMetric(models.Model):
         return f"Sales Metrics for {self.date}"
     
     @classmethod
-    def calculate_for_date(cls, date=None):
-        """Calculate and store metrics for a specific date."""
-        if date is None:
-            date = timezone.now().date()
+    def is_counted(cls, status, payment_status):
+        """Return whether an order in these states counts as a sale."""
+        return status not in cls.EXCLUDED_STATUSES and payment_status not in cls.EXCLUDED_PAYMENT_STATUSES
+    
+    @classmethod
+    def counted_q(cls, prefix=''):
+        """A Q object matching the orders that count as sales, through ``prefix`` (e.g. ``'order__'``)."""
+        return (~models.Q(**{f'{prefix}status__in': cls.EXCLUDED_STATUSES})
+                & ~models.Q(**{f'{prefix}payment_status__in': cls.EXCLUDED_PAYMENT_STATUSES}))
+    
+    @classmethod
+    def counted_orders(cls, queryset):
+        """Restrict an order queryset to the orders that count as sales."""
+        return queryset.filter(cls.counted_q())
+    
+    @staticmethod
+    def pick_top_product(quantities):
+        """The product name with the most units sold; ties go to the first name alphabetically."""
+        return min(quantities, key=lambda name: (-quantities[name], name)) if quantities else None
+    
+    @classmethod
+    def compute_for_date(cls, date):
+        """
+        Compute the metrics of a date from its orders without storing them.
         
-        # Get orders for the date
-        orders = Order.objects.filter(created_at__date=date)
+        Returns the field values, the number of orders per buyer (keyed by
+        ``('user', id)`` or ``('customer', id)``) and the units sold per
+        product name.
+        """
+        # Closed orders may already have been moved to the archive tables
+        querysets = [cls.counted_orders(model.objects.filter(created_at__date=date).order_by())
+                     for model in (Order, ArchivedOrder)]
         
         # Calculate metrics
-        total_sales = orders.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-        total_orders = orders.count()
+        total_sales = sum(
+            (orders.aggregate(Sum('total_amount'))['total_amount__sum'] or 0 for orders in querysets), 0
+        )
+        total_orders = sum(orders.count() for orders in querysets)
         
-        # Count unique customers
-        user_orders = orders.exclude(user=None).values('user').distinct().count()
-        guest_orders = orders.exclude(customer=None).values('customer').distinct().count()
-        total_customers = user_orders + guest_orders
+        # Count orders per customer; a customer may appear in both tables
+        buyers = Counter()
+        for orders in querysets:
+            for kind in ('user', 'customer'):
+                rows = orders.exclude(**{kind: None}).values(kind).annotate(orders=Count('pk'))
+                for row in rows:
+                    buyers[(kind, row[kind])] += row['orders']
         
         # Calculate average order value
         average_order_value = total_sales / total_orders if total_orders > 0 else 0
         
         # Find top product
-        top_product_data = OrderItem.objects.filter(
-            order__in=orders
-        ).values('product_name').annotate(
-            total_quantity=Sum('quantity')
-        ).order_by('-total_quantity').first()
+        quantities = Counter()
+        for item_model, orders in zip((OrderItem, ArchivedOrderItem), querysets):
+            rows = item_model.objects.filter(order__in=orders).values('product_name').annotate(
+                total_quantity=Sum('quantity')
+            )
+            for row in rows:
+                quantities[row['product_name']] += row['total_quantity']
         
-        top_product = top_product_data['product_name'] if top_product_data else None
+        values = {
+            'total_sales': total_sales,
+            'total_orders': total_orders,
+            'total_customers': len(buyers),
+            'average_order_value': average_order_value,
+            'top_product': cls.pick_top_product(quantities),
+        }
+        return values, buyers, quantities
+    
+    @classmethod
+    def calculate_for_date(cls, date=None):
+        """Calculate and store metrics for a specific date, replacing its running tallies."""
+        if date is None:
+            date = timezone.now().date()
+        
+        values, buyers, quantities = cls.compute_for_date(date)
         
         # Create or update the metrics record
-        metrics, created = cls.objects.update_or_create(
-            date=date,
-            defaults={
-                'total_sales': total_sales,
-                'total_orders': total_orders,
-                'total_customers': total_customers,
-                'average_order_value': average_order_value,
-                'top_product': top_product,
-            }
-        )
+        with transaction.atomic():
+            metrics, created = cls.objects.update_or_create(date=date, defaults=values)
+            SalesMetricBuyer.objects.filter(date=date).delete()
+            SalesMetricBuyer.objects.bulk_create([
+                SalesMetricBuyer(date=date, kind=kind, buyer_id=buyer_id, orders=orders)
+                for (kind, buyer_id), orders in buyers.items()
+            ], batch_size=500)
+            SalesMetricProduct.objects.filter(date=date).delete()
+            SalesMetricProduct.objects.bulk_create([
+                SalesMetricProduct(date=date, product_name=name, quantity=quantity)
+                for name, quantity in quantities.items()
+            ], batch_size=500)
+            DashboardDataVersion.bump_after_commit('orders')
         
         return metrics
     
     @classmethod
     def calculate_for_period(cls, start_date, end_date=None):
-        """Calculate metrics for each day in a date range."""
+        """
+        Calculate and store metrics for each day in a date range, with a
+        fixed number of queries for the whole range; see
+        ``apps.analytics.periods``.
+        """
+        from .periods import calculate_period
+        
         if end_date is None:
             end_date = timezone.now().date()
-        
-        current_date = start_date
-        metrics_list = []
-        
-        while current_date <= end_date:
-            metrics = cls.calculate_for_date(current_date)
-            metrics_list.append(metrics)
-            current_date += timezone.timedelta(days=1)
-        
-        return metrics_list
+        return calculate_period(start_date, end_date)
     
     class Meta:
         ordering = ['-date']
         verbose_name = "Sales Metric"
         verbose_name_plural = "Sales Metrics"
 
+class SalesMetricBuyer(models.Model):
+    """
+    Counted orders per buyer and day, from which ``SalesMetric.total_customers``
+    is kept up to date as orders are added and taken out.
+    """
+    KIND_CHOICES = (
+        ('user', 'User'),
+        ('customer', 'Customer'),
+    )
+    
+    date = models.DateField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    buyer_id = models.PositiveBigIntegerField()
+    orders = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.kind} {self.buyer_id} on {self.date}: {self.orders}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'kind', 'buyer_id'], name='sales_metric_buyer_unique'),
+        ]
+
+class SalesMetricProduct(models.Model):
+    """
+    Units sold per product name and day, from which ``SalesMetric.top_product``
+    is kept up to date.
+    """
+    date = models.DateField()
+    product_name = models.CharField(max_length=200)
+    quantity = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name} on {self.date}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product_name'], name='sales_metric_product_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['date', '-quantity', 'product_name'], name='sales_metric_product_top_idx'),
+        ]
+
+class SalesRollup(models.Model):
+    """
+    Orders, quantity and revenue per product, category or payment method
+    over one hour, day, week or month; see ``apps.analytics.rollups``.
+    """
+    GRAIN_CHOICES = (
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    )
+    
+    DIMENSION_CHOICES = (
+        ('product', 'Product'),
+        ('category', 'Category'),
+        ('payment_method', 'Payment Method'),
+    )
+    
+    grain = models.CharField(max_length=10, choices=GRAIN_CHOICES)
+    period = models.DateField(help_text="Day of the hour, or first day of the day, week or month")
+    hour = models.PositiveSmallIntegerField(default=0, help_text="Hour of the day for hour rows, 0 otherwise")
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=200, help_text="Product name, category id ('' if none) or payment method")
+    orders = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"{self.dimension} {self.key} for {self.grain} {self.period}: {self.revenue}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['grain', 'dimension', 'period', 'hour', 'key'],
+                                    name='sales_rollup_unique'),
+        ]
+
+class SalesRollupStale(models.Model):
+    """
+    Day whose rollups changed since they were last refreshed.
+    """
+    date = models.DateField(unique=True)
+    
+    def __str__(self):
+        return f"Stale rollups on {self.date}"
+
+class TopProductSketch(models.Model):
+    """
+    Space-Saving sketch of the units sold per product name over one hour;
+    see ``apps.analytics.heavy_hitters``.
+    """
+    bucket = models.DateTimeField(unique=True, help_text="Start of the hour")
+    sketch = models.JSONField(default=dict, blank=True)
+    stale = models.BooleanField(default=False, help_text="Orders of the hour changed since it was counted")
+    
+    def __str__(self):
+        return f"Top products sketch for {self.bucket}"
+
+class TopProductDelta(models.Model):
+    """
+    Units of a product sold in one hour, recorded as the items are created
+    and not yet folded into the hour's ``TopProductSketch``; see
+    ``apps.analytics.heavy_hitters``.
+    """
+    bucket = models.DateTimeField(db_index=True, help_text="Start of the hour")
+    product_name = models.CharField(max_length=200)
+    quantity = models.PositiveIntegerField()
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name} in {self.bucket}"
+
+class OrderItemDeletion(models.Model):
+    """
+    Tombstone of a deleted order item, exported next to the items so the
+    columnar export can drop rows it already holds; see
+    ``apps.analytics.columnar``.
+    """
+    item_id = models.BigIntegerField()
+    order_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Order item {self.item_id} deleted at {self.deleted_at}"
+
 class DashboardWidget(models.Model):
     """
     Customizable dashboard widgets for users.
@@ -115,3 +300,49 @@ class DashboardWidget(models.Model):
         unique_together = ('user', 'widget_type')
         verbose_name = "Dashboard Widget"
         verbose_name_plural = "Dashboard Widgets"
+
+
+class DashboardDataVersion(models.Model):
+    """
+    Version stamp of a data source the dashboard widgets read, bumped when
+    its data changes; see ``apps.analytics.dashboard``. Stamps are kept in
+    the database so every process, and every management command, sees and
+    bumps the same ones.
+    """
+    source = models.CharField(max_length=20, unique=True)
+    version = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.source} data version {self.version}"
+    
+    @classmethod
+    def current(cls, sources):
+        """The stamp of each of ``sources``, creating missing ones."""
+        sources = list(sources)
+        versions = dict(cls.objects.filter(source__in=sources).values_list('source', 'version'))
+        missing = [source for source in sources if source not in versions]
+        if missing:
+            # Started from the clock, so a recreated stamp never repeats an old one.
+            cls.objects.bulk_create([cls(source=source, version=time.time_ns()) for source in missing],
+                                    ignore_conflicts=True)
+            versions.update(cls.objects.filter(source__in=missing).values_list('source', 'version'))
+        return {source: versions[source] for source in sources}
+    
+    @classmethod
+    def bump(cls, source):
+        """Invalidate the cached widgets reading ``source``."""
+        if not cls.objects.filter(source=source).update(version=F('version') + 1):
+            cls.objects.bulk_create([cls(source=source, version=time.time_ns())], ignore_conflicts=True)
+    
+    @classmethod
+    def bump_after_commit(cls, source):
+        """Bump ``source`` once the current transaction commits, once however many rows it writes."""
+        connection = transaction.get_connection()
+        savepoints = set(connection.savepoint_ids)
+        for callback_savepoints, callback, _ in connection.run_on_commit:
+            # A bump queued at this level or above is rolled back only along with this write.
+            if getattr(callback, 'data_source', None) == source and callback_savepoints <= savepoints:
+                return
+        callback = partial(cls.bump, source)
+        callback.data_source = source
+        transaction.on_commit(callback)
@@ -0,0 +1,134 @@
+"""
+Set-based recalculation of ``SalesMetric`` over a range of days.
+
+Recalculating day by day costs around ten queries per day
+(``calculate_for_date``). ``calculate_period`` does the whole range with a
+fixed number of statements:
+
+1. the per-day buyer and product tallies (``SalesMetricBuyer``,
+   ``SalesMetricProduct``) are rebuilt with one ``INSERT ... SELECT`` each,
+   grouping the live and archived orders of the range by day in the
+   database;
+2. sales and order counts are read with one ``GROUP BY`` day per table;
+3. customer counts are counted from the buyer tally, and the top product of
+   every day is picked from the product tally with a ``ROW_NUMBER()``
+   window;
+4. the day rows are upserted with ``bulk_create(update_conflicts=True)``.
+
+Every day of the range gets a row, zeros included, as with
+``calculate_for_date``.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Value, Window
+from django.db.models.functions import RowNumber, TruncDate
+from django.utils import timezone
+
+from apps.orders.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+from .models import DashboardDataVersion, SalesMetric, SalesMetricBuyer, SalesMetricProduct
+
+UPSERT_BATCH_SIZE = 500
+METRIC_FIELDS = ['total_sales', 'total_orders', 'total_customers', 'average_order_value', 'top_product']
+
+
+def day_bounds(start_date, end_date):
+    """The (aware) datetimes at which ``start_date`` begins and ``end_date`` ends."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.datetime.combine(start_date, datetime.time.min), tz),
+        timezone.make_aware(datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min), tz),
+    )
+
+
+def orders_between(model, start_at, end_at):
+    """Counted orders of ``model`` (``Order`` or ``ArchivedOrder``) created from ``start_at`` to ``end_at``."""
+    return model.objects.filter(SalesMetric.counted_q(), created_at__gte=start_at, created_at__lt=end_at).order_by()
+
+
+def items_between(model, start_at, end_at):
+    """Items of the counted orders of ``model``'s order table created from ``start_at`` to ``end_at``."""
+    return model.objects.filter(SalesMetric.counted_q('order__'), order__created_at__gte=start_at,
+                                order__created_at__lt=end_at).order_by()
+
+
+def insert_grouped(model, querysets, keys, sums, constants=None, aliases=None):
+    """
+    Insert the rows of ``querysets`` into ``model``, summing ``sums`` across
+    rows with the same ``keys``. The querysets select the same columns in
+    the same order, named like the model fields or as mapped by
+    ``aliases``; ``constants`` fills further fields with fixed values.
+    """
+    quote = connection.ops.quote_name
+    aliases = aliases or {}
+    constants = constants or {}
+    parts = []
+    params = list(constants.values())
+    for queryset in querysets:
+        sql, query_params = queryset.query.sql_with_params()
+        parts.append(sql)
+        params.extend(query_params)
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in (*constants, *keys, *sums))
+    selected = ', '.join(quote(aliases.get(name, name)) for name in keys)
+    totals = ', '.join(f'SUM({quote(aliases.get(name, name))})' for name in sums)
+    values = ', '.join(['%s'] * len(constants) + [selected, totals])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(model._meta.db_table)} ({columns}) "
+            f"SELECT {values} FROM ({' UNION ALL '.join(parts)}) AS grouped GROUP BY {selected}",
+            params,
+        )
+
+
+def calculate_period(start_date, end_date):
+    """Recalculate and store the metrics of every day from ``start_date`` to ``end_date``. Returns the rows."""
+    start_at, end_at = day_bounds(start_date, end_date)
+    days = [start_date + datetime.timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    if not days:
+        return []
+
+    with transaction.atomic():
+        SalesMetricBuyer.objects.filter(date__range=(start_date, end_date)).delete()
+        insert_grouped(SalesMetricBuyer, [
+            orders_between(model, start_at, end_at).exclude(**{kind: None})
+            .values(date=TruncDate('created_at'), kind=Value(kind), buyer_id=F(kind)).annotate(orders=Count('pk'))
+            for model in (Order, ArchivedOrder) for kind in ('user', 'customer')
+        ], ('date', 'kind', 'buyer_id'), ('orders',))
+        SalesMetricProduct.objects.filter(date__range=(start_date, end_date)).delete()
+        insert_grouped(SalesMetricProduct, [
+            items_between(model, start_at, end_at).values(date=TruncDate('order__created_at'))
+            .annotate(product_name=F('product_name'), quantity=Sum('quantity')).values('date', 'product_name', 'quantity')
+            for model in (OrderItem, ArchivedOrderItem)
+        ], ('date', 'product_name'), ('quantity',))
+
+        totals = {}
+        for model in (Order, ArchivedOrder):
+            rows = orders_between(model, start_at, end_at).values(date=TruncDate('created_at')).annotate(
+                sales=Sum('total_amount'), orders=Count('pk')).values_list('date', 'sales', 'orders')
+            for date, sales, orders in rows:
+                previous_sales, previous_orders = totals.get(date, (0, 0))
+                totals[date] = (previous_sales + sales, previous_orders + orders)
+
+        customers = dict(
+            SalesMetricBuyer.objects.filter(date__range=(start_date, end_date)).values('date')
+            .annotate(buyers=Count('pk')).values_list('date', 'buyers')
+        )
+        top_products = dict(
+            SalesMetricProduct.objects.filter(date__range=(start_date, end_date), quantity__gt=0)
+            .annotate(rank=Window(RowNumber(), partition_by=[F('date')],
+                                  order_by=[F('quantity').desc(), F('product_name').asc()]))
+            .filter(rank=1).values_list('date', 'product_name')
+        )
+
+        metrics = []
+        for date in days:
+            sales, orders = totals.get(date, (0, 0))
+            metrics.append(SalesMetric(
+                date=date, total_sales=sales, total_orders=orders, total_customers=customers.get(date, 0),
+                average_order_value=sales / orders if orders > 0 else 0, top_product=top_products.get(date),
+            ))
+        SalesMetric.objects.bulk_create(metrics, batch_size=UPSERT_BATCH_SIZE, update_conflicts=True,
+                                        unique_fields=['date'], update_fields=METRIC_FIELDS)
+        DashboardDataVersion.bump_after_commit('orders')
+    return metrics
@@ -0,0 +1,272 @@
+"""
+Sales rollup cube: orders, quantity and revenue of counted orders (see
+``SalesMetric.counted_q``) by product, category and payment method, at hour,
+day, week and month grain.
+
+Only hour rows are aggregated from the live and archived orders. Day rows
+are summed from hour rows, and week and month rows from day rows, so a
+refresh reads the raw orders of the refreshed days once. Every measure is
+additive over time (an order belongs to a single hour), which makes the
+coarse rows exact.
+
+Order writes mark their day stale (``SalesRollupStale``); ``refresh_stale``,
+run by the ``refresh_sales_rollups`` command, rebuilds the stale days and the
+weeks and months that contain them. Archiving deletes live orders without
+marking anything: they are read from the archive tables just the same.
+
+``query`` answers a date range from the coarsest rows that fit it: whole
+months from month rows, whole weeks left at the edges from week rows and
+the remaining days from day rows (``plan``).
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import CharField, Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, ExtractHour, TruncDate, TruncMonth, TruncWeek
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.inventory.models import Category, Product
+from apps.inventory.reservations import INVENTORY_PRODUCT_TYPE
+from apps.orders.archive import is_archiving
+from apps.orders.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from apps.orders.signals import order_items_created, order_status_changed, orders_created
+
+from .models import SalesRollup, SalesRollupStale
+from .periods import day_bounds, insert_grouped, items_between, orders_between
+
+DAY = datetime.timedelta(days=1)
+MEASURES = ('orders', 'quantity', 'revenue')
+# Grains a query may read, coarsest first, for each bucket it groups by.
+BUCKET_GRAINS = {
+    None: ('month', 'week', 'day'),
+    'month': ('month', 'week', 'day'),
+    'week': ('week', 'day'),
+    'day': ('day',),
+    'hour': ('hour',),
+}
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+LOOKUP_BATCH_SIZE = 500
+
+
+def period_start(grain, date):
+    """The first day of the ``grain`` period (day, week or month) containing ``date``."""
+    if grain == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if grain == 'month':
+        return date.replace(day=1)
+    return date
+
+
+def next_period(grain, date):
+    """The first day of the ``grain`` period after the one starting on ``date``."""
+    if grain == 'week':
+        return date + datetime.timedelta(days=7)
+    if grain == 'month':
+        return (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return date + DAY
+
+
+def plan(start, stop, grains):
+    """
+    Cover the days ``[start, stop)`` with whole periods, coarsest of
+    ``grains`` first. Returns ``(grain, start, stop)`` pieces.
+    """
+    if start >= stop:
+        return []
+    grain, finer = grains[0], grains[1:]
+    if not finer:
+        return [(grain, start, stop)]
+    first = period_start(grain, start)
+    if first < start:
+        first = next_period(grain, first)
+    last = period_start(grain, stop)
+    if first >= last:
+        return plan(start, stop, finer)
+    return plan(start, first, finer) + [(grain, first, last)] + plan(last, stop, finer)
+
+
+def query(dimension, start_date, end_date, bucket=None, keys=None):
+    """
+    Orders, quantity and revenue for each key of ``dimension`` from
+    ``start_date`` to ``end_date``, in total or per ``bucket`` ('hour',
+    'day', 'week' or 'month').
+
+    Returns dicts with ``period`` (``None`` for totals, a date, or an aware
+    datetime for hours), ``key``, ``label`` and the measures, ordered by
+    period and key. Partial weeks and months at the edges of the range only
+    cover the days inside it.
+    """
+    if dimension not in dict(SalesRollup.DIMENSION_CHOICES):
+        raise ValueError(f"Unknown rollup dimension {dimension!r}")
+    if bucket not in BUCKET_GRAINS:
+        raise ValueError(f"Unknown rollup bucket {bucket!r}")
+
+    stop = end_date + DAY
+    segments = [(start_date, stop)]
+    if bucket in ('week', 'month'):
+        # Split at bucket boundaries so no row read straddles two buckets.
+        segments = []
+        start = start_date
+        while start < stop:
+            segment_stop = min(next_period(bucket, period_start(bucket, start)), stop)
+            segments.append((start, segment_stop))
+            start = segment_stop
+    pieces = [piece for start, segment_stop in segments for piece in plan(start, segment_stop, BUCKET_GRAINS[bucket])]
+    if not pieces:
+        return []
+
+    condition = Q()
+    for grain, start, piece_stop in pieces:
+        condition |= Q(grain=grain, period__gte=start, period__lt=piece_stop)
+    rows = SalesRollup.objects.filter(condition, dimension=dimension).order_by()
+    if keys is not None:
+        rows = rows.filter(key__in=list(keys))
+    group = {
+        None: {},
+        'hour': {'bucket': F('period'), 'bucket_hour': F('hour')},
+        'day': {'bucket': F('period')},
+        'week': {'bucket': TruncWeek('period')},
+        'month': {'bucket': TruncMonth('period')},
+    }[bucket]
+    rows = list(rows.values('key', **group).annotate(**{measure: Sum(measure) for measure in MEASURES}))
+
+    labels = _labels(dimension, {row['key'] for row in rows})
+    results = []
+    for row in rows:
+        period = row.pop('bucket', None)
+        hour = row.pop('bucket_hour', None)
+        if hour is not None:
+            period = timezone.make_aware(datetime.datetime.combine(period, datetime.time(hour)))
+        results.append({'period': period, 'key': row['key'], 'label': labels.get(row['key'], row['key']),
+                        **{measure: row[measure] for measure in MEASURES}})
+    results.sort(key=lambda result: (result['period'] or start_date, result['key']))
+    return results
+
+
+def _labels(dimension, keys):
+    if dimension == 'payment_method':
+        return dict(Order.PAYMENT_METHOD_CHOICES)
+    if dimension == 'category':
+        ids = [int(key) for key in keys if key]
+        labels = {'': 'Uncategorized'}
+        for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            labels.update((str(pk), name) for pk, name in Category.objects.filter(
+                pk__in=ids[start:start + LOOKUP_BATCH_SIZE]).values_list('pk', 'name'))
+        return labels
+    return {}
+
+
+def _raw_querysets(start_at, end_at):
+    """Hour rows of every dimension for the orders created from ``start_at`` to ``end_at``."""
+    category = Cast(Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('category_id')[:1]),
+                    CharField())
+    querysets = []
+    for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        orders = orders_between(order_model, start_at, end_at).values(
+            period=TruncDate('created_at'), hour=ExtractHour('created_at'))
+        items = items_between(item_model, start_at, end_at).values(
+            period=TruncDate('order__created_at'), hour=ExtractHour('order__created_at'))
+        item_measures = {'orders': Count('order', distinct=True), 'quantity': Sum('quantity'),
+                         'revenue': Sum('subtotal')}
+        querysets += [
+            items.annotate(dimension=Value('product'), key=F('product_name')).annotate(**item_measures),
+            items.filter(product_type=INVENTORY_PRODUCT_TYPE).annotate(
+                dimension=Value('category'), key=Coalesce(category, Value(''))).annotate(**item_measures),
+            # Payment method revenue is the order total, tax and discounts included.
+            orders.annotate(dimension=Value('payment_method'), key=F('payment_method')).annotate(
+                orders=Count('pk'), quantity=Value(0), revenue=Sum('total_amount')),
+            items.annotate(dimension=Value('payment_method'), key=F('order__payment_method')).annotate(
+                orders=Value(0), quantity=Sum('quantity'), revenue=Value(0)),
+        ]
+    return querysets
+
+
+def _replace(grain, start, stop, querysets, keys=('period', 'dimension', 'key'), aliases=None):
+    SalesRollup.objects.filter(grain=grain, period__gte=start, period__lt=stop).delete()
+    constants = {'grain': grain} if 'hour' in keys else {'grain': grain, 'hour': 0}
+    insert_grouped(SalesRollup, querysets, keys, MEASURES, constants=constants, aliases=aliases)
+
+
+def _derive(grain, source_grain, start, stop, period):
+    """Replace the ``grain`` rows from ``start`` to ``stop`` with sums of the ``source_grain`` rows."""
+    source = SalesRollup.objects.filter(grain=source_grain, period__gte=start, period__lt=stop).order_by().values(
+        'dimension', 'key', bucket=period).annotate(**{measure: Sum(measure) for measure in MEASURES})
+    _replace(grain, start, stop, [source], aliases={'period': 'bucket'})
+
+
+def refresh(dates):
+    """Rebuild the rollups of ``dates`` and of the weeks and months containing them."""
+    dates = sorted(set(dates))
+    runs = []
+    for date in dates:
+        if runs and (date - runs[-1][1]).days == 1:
+            runs[-1][1] = date
+        else:
+            runs.append([date, date])
+
+    with transaction.atomic():
+        for first, last in runs:
+            start_at, end_at = day_bounds(first, last)
+            _replace('hour', first, last + DAY, _raw_querysets(start_at, end_at),
+                     keys=('period', 'hour', 'dimension', 'key'))
+            _derive('day', 'hour', first, last + DAY, F('period'))
+        for first, last in runs:
+            for grain, truncate in (('week', TruncWeek('period')), ('month', TruncMonth('period'))):
+                start = period_start(grain, first)
+                _derive(grain, 'day', start, next_period(grain, period_start(grain, last)), truncate)
+    return len(dates)
+
+
+def refresh_stale():
+    """Rebuild the days marked stale by order writes. Returns the number of days."""
+    with transaction.atomic():
+        dates = list(SalesRollupStale.objects.values_list('date', flat=True))
+        for start in range(0, len(dates), LOOKUP_BATCH_SIZE):
+            SalesRollupStale.objects.filter(date__in=dates[start:start + LOOKUP_BATCH_SIZE]).delete()
+        return refresh(dates)
+
+
+def mark_stale(datetimes):
+    """Mark the days of orders created at ``datetimes`` for the next refresh."""
+    dates = {timezone.localdate(value) for value in datetimes if value is not None}
+    if dates:
+        SalesRollupStale.objects.bulk_create([SalesRollupStale(date=date) for date in dates],
+                                             ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def mark_order_stale(sender, instance, raw=False, **kwargs):
+    if not raw and not is_archiving():
+        mark_stale([instance.created_at])
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def mark_item_stale(sender, instance, raw=False, **kwargs):
+    if raw or is_archiving():
+        return
+    created_at = Order.objects.filter(pk=instance.order_id).values_list('created_at', flat=True).first()
+    mark_stale([created_at])
+
+
+@receiver(orders_created, sender=Order)
+def mark_created_orders_stale(sender, orders, **kwargs):
+    mark_stale(order.created_at for order in orders)
+
+
+@receiver(order_items_created, sender=OrderItem)
+def mark_created_items_stale(sender, items, **kwargs):
+    mark_stale(item.order.created_at for item in items)
+
+
+@receiver(order_status_changed, sender=Order)
+def mark_transitions_stale(sender, transitions, **kwargs):
+    order_ids = list({order_id for order_id, _, _ in transitions})
+    created = []
+    for start in range(0, len(order_ids), LOOKUP_BATCH_SIZE):
+        created += Order.objects.filter(pk__in=order_ids[start:start + LOOKUP_BATCH_SIZE]).values_list(
+            'created_at', flat=True)
+    mark_stale(created)
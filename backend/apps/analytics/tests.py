@@ -1,3 +1,161 @@
+import datetime
+import random
+import tempfile
+import uuid
+from decimal import Decimal
+
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.orders.archive import archive_batch, archive_cutoff
+from apps.orders.models import Order, OrderItem
+from apps.orders.services import create_order, sync_orders
+from apps.orders.transitions import transition_order
+
+from .columnar import SETTLE_SECONDS, export_table, latest, open_table
+from .incremental import compare_with_recompute
+from .models import OrderItemDeletion, SalesMetric
+
+PRODUCTS = ('Espresso', 'Latte', 'Bagel', 'Muffin', 'Tea', 'Juice')
+
+
+class IncrementalSalesMetricTests(TestCase):
+    """Daily metrics kept up to date by order writes match a full recompute."""
+
+    def setUp(self):
+        self.rng = random.Random(7)
+        self.dates = [datetime.date(2001, 1, 1) + datetime.timedelta(days=offset) for offset in range(5)]
+        self.customers = [{'name': f'Metric customer {i}', 'email': f'metrics-{i}@example.com'} for i in range(8)]
+        self.orders = []
+
+    def items(self):
+        return [{'product_name': self.rng.choice(PRODUCTS), 'product_id': 1, 'product_type': 'other',
+                 'quantity': self.rng.randint(1, 4), 'unit_price': f'{self.rng.randint(100, 900) / 100:.2f}'}
+                for _ in range(self.rng.randint(1, 3))]
+
+    def created_at(self):
+        day = self.rng.choice(self.dates)
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time(self.rng.randint(0, 23))))
+
+    def create(self):
+        order = create_order(self.items(), customer_data=self.rng.choice(self.customers + [None]),
+                             created_at=self.created_at(),
+                             payment_status=self.rng.choice(['pending', 'completed', 'failed']))
+        self.orders.append(order.pk)
+
+    def sync(self):
+        results = sync_orders([
+            {'idempotency_key': uuid.uuid4().hex, 'items': self.items(), 'created_at': self.created_at(),
+             'customer': self.rng.choice(self.customers), 'payment_status': 'completed'}
+            for _ in range(5)
+        ])
+        numbers = [result['order_number'] for result in results]
+        self.orders += Order.objects.filter(order_number__in=numbers).values_list('pk', flat=True)
+
+    def pay(self):
+        order = Order.objects.get(pk=self.rng.choice(self.orders))
+        order.payment_status = self.rng.choice(['completed', 'refunded', 'failed', 'pending'])
+        order.save(update_fields=['payment_status', 'updated_at'])
+
+    def cancel(self):
+        # The metrics follow the status change once it is committed.
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_order(self.rng.choice(self.orders), 'cancelled')
+
+    def add_item(self):
+        OrderItem.objects.create(order_id=self.rng.choice(self.orders), product_name=self.rng.choice(PRODUCTS),
+                                 product_id=1, product_type='other', quantity=self.rng.randint(1, 3),
+                                 unit_price=Decimal('2.50'))
+
+    def delete_item(self):
+        items = list(OrderItem.objects.filter(order_id__in=self.orders).order_by('pk'))
+        if items:
+            self.rng.choice(items).delete()
+
+    def delete_order(self):
+        order_id = self.orders.pop(self.rng.randrange(len(self.orders)))
+        Order.objects.filter(pk=order_id).delete()
+
+    def test_random_order_events_match_a_full_recompute(self):
+        events = [(0.35, self.create), (0.45, self.sync), (0.7, self.pay), (0.82, self.cancel),
+                  (0.92, self.add_item), (0.96, self.delete_item), (1.0, self.delete_order)]
+        for _ in range(300):
+            roll = self.rng.random()
+            if not self.orders:
+                self.create()
+                continue
+            next(event for threshold, event in events if roll < threshold)()
+
+        self.assertTrue(SalesMetric.objects.filter(date__in=self.dates, total_orders__gt=0).exists())
+        self.assertEqual(compare_with_recompute(self.dates), [])
+
+    def test_archived_orders_keep_counting(self):
+        for _ in range(10):
+            self.create()
+        Order.objects.filter(pk__in=self.orders[:5]).update(status='completed')
+        before = list(SalesMetric.objects.filter(date__in=self.dates).order_by('date').values())
+
+        moved, _ = archive_batch(archive_cutoff(days=0), 100)
+        self.assertEqual(moved, 5)
+        self.assertEqual(list(SalesMetric.objects.filter(date__in=self.dates).order_by('date').values()), before)
+        self.assertEqual(compare_with_recompute(self.dates), [])
+
+
+class ColumnarItemExportTests(TestCase):
+    """Item exports settle on the time rows are written and follow edits and deletions."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def settle(self, seconds=1):
+        # Stands in for the time passing until the next export run.
+        written = timezone.now() - datetime.timedelta(seconds=SETTLE_SECONDS + seconds)
+        OrderItem.objects.filter(updated_at__gt=written).update(updated_at=written)
+        OrderItemDeletion.objects.update(deleted_at=written)
+
+    def export(self):
+        return (export_table('order_items', directory=self.directory),
+                export_table('order_item_deletions', directory=self.directory))
+
+    def current_items(self):
+        items, _ = open_table('order_items', ['id', 'quantity'], self.directory)
+        deletions, _ = open_table('order_item_deletions', ['item_id'], self.directory)
+        rows = latest(items['id'], deletions['item_id'])
+        return dict(zip(items['id'][rows].tolist(), items['quantity'][rows].tolist()))
+
+    def items(self, quantity):
+        return [{'product_name': 'Latte', 'product_id': 1, 'product_type': 'other', 'quantity': quantity,
+                 'unit_price': '3.00'}]
+
+    def test_offline_orders_wait_for_their_items_to_settle(self):
+        create_order(self.items(1))
+        self.settle(seconds=60)
+        self.assertEqual(self.export(), (1, 0))
+
+        # Synced long after the sale: the old created_at must not let the items skip the settle delay.
+        sync_orders([{'idempotency_key': uuid.uuid4().hex, 'items': self.items(2),
+                      'created_at': timezone.now() - datetime.timedelta(days=3)}])
+        self.assertEqual(self.export(), (0, 0))
+        self.settle()
+        self.assertEqual(self.export(), (1, 0))
+        self.assertEqual(sorted(self.current_items().values()), [1, 2])
+
+    def test_edited_and_deleted_items_are_exported_again(self):
+        order = create_order(self.items(1) * 3)
+        first, second, third = order.items.order_by('pk')
+        self.settle(seconds=60)
+        self.assertEqual(self.export(), (3, 0))
+
+        second.quantity = 5
+        second.save()
+        third.delete()
+        self.settle()
+        self.assertEqual(self.export(), (1, 1))
+        self.assertEqual(self.current_items(), {first.pk: 1, second.pk: 5})
 
-# Create your tests here.
+        Order.objects.filter(pk=order.pk).delete()
+        self.settle()
+        self.assertEqual(self.export(), (0, 2))
+        self.assertEqual(self.current_items(), {})
@@ -1,7 +1,10 @@
 from django.urls import path
 
+from .views import DashboardView, TopProductsView
+
 app_name = 'analytics'
 
 urlpatterns = [
-    # Analytics endpoints will go here
-]
\ No newline at end of file
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('top-products/', TopProductsView.as_view(), name='top_products'),
+]
@@ -1,3 +1,40 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from .dashboard import load_dashboard
+from .heavy_hitters import top_products
+
+
+class DashboardView(APIView):
+    """
+    API view returning the data of every visible widget on the user's
+    dashboard in one response; see ``apps.analytics.dashboard``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'widgets': load_dashboard(request.user)}, status=status.HTTP_200_OK)
+
+
+class TopProductsView(APIView):
+    """
+    API view listing the products with the most units sold in the last
+    ``hours`` hours (24 by default), estimated from the hourly top product
+    sketches; see ``apps.analytics.heavy_hitters``. ``limit`` caps the
+    number of products returned.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            hours = max(1, min(int(request.query_params.get('hours', 24)), 366 * 24))
+        except ValueError:
+            hours = 24
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            limit = 10
+        return Response({'hours': hours, 'results': top_products(limit=limit, hours=hours)},
+                        status=status.HTTP_200_OK)
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from apps.images.fields import ImageVariantsField
 from .models import Profile
 import re
 
@@ -105,11 +106,12 @@ class UserProfileSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='user.email')
     first_name = serializers.CharField(source='user.first_name')
     last_name = serializers.CharField(source='user.last_name')
+    avatar_variants = ImageVariantsField(source='avatar')
     
     class Meta:
         model = Profile
         fields = ('username', 'email', 'first_name', 'last_name', 'phone_number', 
-                  'company_name', 'business_type', 'subscription_plan', 'avatar')
+                  'company_name', 'business_type', 'subscription_plan', 'avatar', 'avatar_variants')
         read_only_fields = ('username',)
     
     def update(self, instance, validated_data):
@@ -0,0 +1,34 @@
+from django.contrib import admin
+
+from .models import ImageAsset, ImageFile
+
+
+class ImageFileInline(admin.TabularInline):
+    model = ImageFile
+    extra = 0
+    fields = ('name', 'size', 'created_at')
+    readonly_fields = fields
+    can_delete = False
+
+
+@admin.register(ImageAsset)
+class ImageAssetAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'width', 'height', 'variant_widths', 'variant_format', 'generated_at', 'created_at')
+    list_filter = ('variant_format', 'generated_at')
+    search_fields = ('digest', 'files__name')
+    readonly_fields = ('digest', 'width', 'height', 'variant_widths', 'variant_format', 'generated_at', 'error',
+                       'created_at')
+    inlines = [ImageFileInline]
+
+    def has_add_permission(self, request):
+        return False  # Assets are recorded from uploads
+
+
+@admin.register(ImageFile)
+class ImageFileAdmin(admin.ModelAdmin):
+    list_display = ('name', 'asset', 'size', 'created_at')
+    search_fields = ('name', 'asset__digest')
+    readonly_fields = ('name', 'asset', 'size', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class ImagesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.images'
+
+    def ready(self):
+        # Connects the upload receivers of every image field in IMAGE_FIELDS.
+        from . import derivatives
+
+        derivatives.connect_receivers()
@@ -0,0 +1,282 @@
+"""
+Resized, recompressed variants of uploaded images.
+
+Every image stored through one of ``IMAGE_FIELDS`` is hashed and recorded
+as an ``ImageFile`` (storage name to content) pointing at one ``ImageAsset``
+per distinct content. Variants (``IMAGE_VARIANT_FORMAT`` at each of
+``IMAGE_VARIANT_WIDTHS`` narrower than the original, plus the original width
+up to the largest of them) are stored under
+``IMAGE_DERIVATIVE_DIR/<digest[:2]>/<digest>/<width>.<format>``. The path
+depends only on the content, so an image uploaded twice, or shared by
+several products, is rendered once.
+
+Decoding, resizing and encoding run in a process pool: after an upload is
+committed, the receiver hashes the file and reads its header, then hands
+the bytes to the pool and returns. The variants are written to storage from
+the parent process when the worker finishes, so any storage backend works
+and workers never touch Django. An asset's variants are listed by
+``ImageVariantsField`` once ``generated_at`` is set. The
+``backfill_image_derivatives`` command does the same for existing media.
+"""
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connections, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from PIL import UnidentifiedImageError
+
+from .models import ImageAsset, ImageFile
+from .rendering import read_size, render_variants
+
+logger = logging.getLogger(__name__)
+
+# (model label, field name) of every image field that gets variants.
+IMAGE_FIELDS = (
+    ('inventory.Product', 'image'),
+    ('inventory.Category', 'image'),
+    ('devices.Device', 'main_image'),
+    ('devices.DeviceImage', 'image'),
+    ('marketplace.App', 'icon'),
+    ('authentication.Profile', 'avatar'),
+)
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+LOOKUP_BATCH_SIZE = 500
+
+_pool = None
+_pool_lock = threading.Lock()
+# Digests this process is rendering in the background.
+_pending = set()
+
+
+def variant_widths(width):
+    """The variant widths of an image ``width`` pixels wide; originals are never upscaled."""
+    largest = max(settings.IMAGE_VARIANT_WIDTHS)
+    return sorted({w for w in settings.IMAGE_VARIANT_WIDTHS if w < width} | {min(width, largest)})
+
+
+def variant_path(digest, width, image_format=None):
+    extension = (image_format or settings.IMAGE_VARIANT_FORMAT).lower()
+    return f"{settings.IMAGE_DERIVATIVE_DIR}/{digest[:2]}/{digest}/{width}.{extension}"
+
+
+def variant_urls(names):
+    """
+    Return ``{name: {width: url}}`` for the stored files ``names`` whose
+    variants have been generated; other names are left out.
+    """
+    names = list({name for name in names if name})
+    urls = {}
+    for start in range(0, len(names), LOOKUP_BATCH_SIZE):
+        rows = ImageFile.objects.filter(
+            name__in=names[start:start + LOOKUP_BATCH_SIZE], asset__generated_at__isnull=False
+        ).values_list('name', 'asset__digest', 'asset__variant_widths', 'asset__variant_format')
+        for name, digest, widths, image_format in rows:
+            urls[name] = {str(width): default_storage.url(variant_path(digest, width, image_format))
+                          for width in widths}
+    return urls
+
+
+def register_file(name):
+    """
+    Hash the stored file ``name`` and record its content. Returns
+    ``(asset, data)``, or ``(None, None)`` if the file is missing or is not
+    an image.
+    """
+    try:
+        with default_storage.open(name, 'rb') as file:
+            data = file.read()
+    except (FileNotFoundError, OSError):
+        logger.warning("Image %s could not be read", name)
+        return None, None
+    digest = hashlib.sha256(data).hexdigest()
+
+    asset = ImageAsset.objects.filter(digest=digest).first()
+    if asset is None:
+        try:
+            width, height = read_size(data)
+        except (UnidentifiedImageError, OSError):
+            logger.warning("%s is not a readable image", name)
+            return None, None
+        try:
+            with transaction.atomic():
+                asset = ImageAsset.objects.create(digest=digest, width=width, height=height)
+        except IntegrityError:
+            asset = ImageAsset.objects.get(digest=digest)  # Registered concurrently
+    ImageFile.objects.update_or_create(name=name, defaults={'asset': asset, 'size': len(data)})
+    return asset, data
+
+
+def submit(pool, asset, data):
+    """Render the variants of ``asset`` from its ``data`` in ``pool``. Returns the future."""
+    return pool.submit(render_variants, data, variant_widths(asset.width), settings.IMAGE_VARIANT_FORMAT,
+                       settings.IMAGE_VARIANT_QUALITY)
+
+
+def store_variants(asset, variants, replace=False):
+    """
+    Save the rendered ``variants`` of ``asset`` and mark it generated.
+    Existing variant files are kept unless ``replace`` is set.
+    """
+    image_format = settings.IMAGE_VARIANT_FORMAT
+    for width, content in variants.items():
+        path = variant_path(asset.digest, width, image_format)
+        if default_storage.exists(path):
+            if not replace:
+                continue  # Content-addressed: already rendered from the same bytes
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(content))
+    ImageAsset.objects.filter(pk=asset.pk).update(
+        variant_widths=sorted(variants), variant_format=image_format, generated_at=timezone.now(), error=''
+    )
+
+
+def record_failure(asset, exc):
+    logger.warning("Variants of image %s could not be rendered: %s", asset.digest, exc)
+    ImageAsset.objects.filter(pk=asset.pk).update(error=str(exc) or exc.__class__.__name__)
+
+
+def get_pool():
+    """The process pool of this process, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def process_upload(name):
+    """Record an uploaded file and render its variants in the background, if not done yet."""
+    asset, data = register_file(name)
+    if asset is None or asset.generated_at is not None:
+        return
+    with _pool_lock:
+        if asset.digest in _pending:
+            return
+        _pending.add(asset.digest)
+    future = submit(get_pool(), asset, data)
+    future.add_done_callback(partial(_finish_upload, asset, threading.get_ident()))
+
+
+def _finish_upload(asset, submitter, future):
+    try:
+        try:
+            variants = future.result()
+        except Exception as exc:
+            record_failure(asset, exc)
+        else:
+            store_variants(asset, variants)
+    finally:
+        with _pool_lock:
+            _pending.discard(asset.digest)
+        if threading.get_ident() != submitter:
+            # Ran on the pool's management thread, which outlives any request.
+            connections.close_all()
+
+
+def backfill(workers=None, force=False, progress=None):
+    """
+    Record every stored image referenced by ``IMAGE_FIELDS`` and render the
+    variants of the assets that have none yet (all of them with ``force``),
+    ``workers`` images at a time. ``progress`` is called with the running
+    stats. Returns the stats: files, registered, rendered, failed, seconds.
+    """
+    workers = workers or settings.IMAGE_DERIVATIVE_WORKERS
+    stats = {'files': 0, 'registered': 0, 'rendered': 0, 'failed': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+    in_flight = {}
+
+    def collect(done):
+        for future in done:
+            asset = in_flight.pop(future)
+            try:
+                store_variants(asset, future.result(), replace=force)
+                stats['rendered'] += 1
+            except Exception as exc:
+                record_failure(asset, exc)
+                stats['failed'] += 1
+        stats['seconds'] = time.perf_counter() - started
+        if progress:
+            progress(stats)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for asset, data in _backfill_work(stats, force):
+            in_flight[submit(pool, asset, data)] = asset
+            if len(in_flight) >= workers * 2:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        while in_flight:
+            collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def _backfill_work(stats, force):
+    """Yield ``(asset, data)`` once per distinct content that needs rendering."""
+    names = set()
+    for label, field_name in IMAGE_FIELDS:
+        values = (apps.get_model(label)._default_manager.exclude(**{f'{field_name}__isnull': True})
+                  .exclude(**{field_name: ''}).values_list(field_name, flat=True))
+        names.update(values.iterator())
+    stats['files'] = len(names)
+
+    names = sorted(names)
+    known = set()
+    for start in range(0, len(names), LOOKUP_BATCH_SIZE):
+        known.update(ImageFile.objects.filter(name__in=names[start:start + LOOKUP_BATCH_SIZE])
+                     .values_list('name', flat=True))
+
+    seen = set()
+    for name in names:
+        if name in known:
+            continue
+        asset, data = register_file(name)
+        if asset is None:
+            continue
+        stats['registered'] += 1
+        if asset.digest not in seen and (force or asset.generated_at is None):
+            seen.add(asset.digest)
+            yield asset, data
+
+    # Assets recorded earlier whose variants are missing (failed or interrupted).
+    assets = ImageAsset.objects.all() if force else ImageAsset.objects.filter(generated_at__isnull=True)
+    for asset in assets.iterator():
+        if asset.digest in seen:
+            continue
+        for name in asset.files.values_list('name', flat=True):
+            try:
+                with default_storage.open(name, 'rb') as file:
+                    data = file.read()
+            except OSError:
+                continue
+            yield asset, data
+            break
+
+
+def _image_saved(sender, instance, update_fields=None, **kwargs):
+    """Process new uploads of ``instance``'s image fields once the save is committed."""
+    for field_name in _fields_by_model[sender]:
+        if update_fields is not None and field_name not in update_fields:
+            continue
+        name = getattr(instance, field_name).name
+        if name and not ImageFile.objects.filter(name=name).exists():
+            transaction.on_commit(partial(process_upload, name))
+
+
+_fields_by_model = {}
+
+
+def connect_receivers():
+    for label, field_name in IMAGE_FIELDS:
+        model = apps.get_model(label)
+        _fields_by_model.setdefault(model, []).append(field_name)
+        post_save.connect(_image_saved, sender=model, dispatch_uid=f'image_derivatives_{label}')
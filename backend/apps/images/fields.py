@@ -0,0 +1,45 @@
+from rest_framework import serializers
+
+from .derivatives import variant_urls
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    URLs of the rendered variants of an image field, keyed by width; empty
+    until the variants have been generated.
+
+    When the object is one of a list, the variants of the whole list are
+    looked up at once rather than one query per object.
+    """
+
+    def to_representation(self, value):
+        name = getattr(value, 'name', value)
+        if not name:
+            return {}
+        cache = self.root.__dict__.setdefault('_image_variant_urls', {})
+        if name not in cache:
+            names = self._list_names() | {name}
+            found = variant_urls(names)
+            cache.update({key: found.get(key, {}) for key in names})
+
+        urls = cache[name]
+        request = self.context.get('request')
+        if request is not None:
+            urls = {width: request.build_absolute_uri(url) for width, url in urls.items()}
+        return urls
+
+    def _list_names(self):
+        """Image names of the other objects of the list this object is serialized in."""
+        parent = self.parent
+        if not isinstance(getattr(parent, 'parent', None), serializers.ListSerializer):
+            return set()
+        names = set()
+        for instance in parent.parent.instance or ():
+            try:
+                value = self.get_attribute(instance)
+            except (AttributeError, KeyError):
+                continue
+            names.add(getattr(value, 'name', value))
+        names.discard(None)
+        names.discard('')
+        return names
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.images.derivatives import backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Record existing product, category, device, app and avatar images and render their variants "
+        "in a process pool. Images whose content was already rendered are skipped; safe to interrupt "
+        "and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_DERIVATIVE_WORKERS,
+                            help="Worker processes rendering images in parallel")
+        parser.add_argument('--force', action='store_true',
+                            help="Render the variants of every image again, e.g. after changing the widths")
+
+    def handle(self, *args, **options):
+        reported = {'done': 0}
+
+        def progress(stats):
+            done = stats['rendered'] + stats['failed']
+            if done - reported['done'] >= 100:
+                reported['done'] = done
+                self.stdout.write(f"{done} rendered ({stats['failed']} failed) in {stats['seconds']:.1f}s")
+
+        stats = backfill(workers=options['workers'], force=options['force'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['files']} image files, {stats['registered']} newly recorded; rendered {stats['rendered']} "
+            f"distinct images ({stats['failed']} failed) in {stats['seconds']:.1f}s"
+        ))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('variant_widths', models.JSONField(default=list, help_text='Widths of the rendered variants')),
+                ('variant_format', models.CharField(blank=True, max_length=10)),
+                ('generated_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['generated_at'], name='image_asset_generated_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage name of the original', max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='images.imageasset')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import models
+
+
+class ImageAsset(models.Model):
+    """
+    One distinct image content, identified by its SHA-256 digest, and the
+    variants rendered from it.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    variant_widths = models.JSONField(default=list, help_text="Widths of the rendered variants")
+    variant_format = models.CharField(max_length=10, blank=True)
+    generated_at = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.width}x{self.height})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['generated_at'], name='image_asset_generated_idx'),
+        ]
+
+
+class ImageFile(models.Model):
+    """
+    An uploaded file in media storage and the content it holds.
+    """
+    name = models.CharField(max_length=255, unique=True, help_text="Storage name of the original")
+    asset = models.ForeignKey(ImageAsset, on_delete=models.CASCADE, related_name='files')
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
@@ -0,0 +1,45 @@
+"""
+Image decoding, resizing and encoding for the derivative process pool.
+
+This module imports only Pillow, so pool workers started with ``spawn``
+can load it without setting up Django.
+"""
+import io
+
+from PIL import ExifTags, Image, ImageOps
+
+# EXIF orientations that swap width and height.
+_TRANSPOSED = {5, 6, 7, 8}
+
+
+def read_size(data):
+    """Return the displayed ``(width, height)`` of ``data``, reading only its header."""
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        if image.getexif().get(ExifTags.Base.Orientation) in _TRANSPOSED:
+            width, height = height, width
+    return width, height
+
+
+def render_variants(data, widths, image_format, quality):
+    """
+    Decode ``data`` and return ``{width: encoded bytes}`` for each of
+    ``widths``, largest first. Each variant is resized from the previous one,
+    and JPEG originals are decoded at the smallest scale that still covers
+    the largest width.
+    """
+    widths = sorted(set(widths), reverse=True)
+    variants = {}
+    with Image.open(io.BytesIO(data)) as original:
+        original.draft('RGB', (widths[0], widths[0]))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        for width in widths:
+            if width < image.width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, quality=quality)
+            variants[width] = buffer.getvalue()
+    return variants
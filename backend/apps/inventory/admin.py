@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Category, Product, StockMovement
+from .models import Category, Product, StockMovement, StockAlert, StockCheckpoint, StockReservation
+from .categories import invalidate_category_tree
+from .lookup import get_lookup_cache
+from .search import matching_product_ids
 
 class StockMovementInline(admin.TabularInline):
     model = StockMovement
@@ -10,38 +13,57 @@ class StockMovementInline(admin.TabularInline):
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'parent', 'is_active')
+    list_display = ('name', 'slug', 'parent', 'depth', 'is_active')
     list_filter = ('is_active', 'parent')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
+    readonly_fields = ('path', 'depth')
     actions = ['make_active', 'make_inactive']
     
     def make_active(self, request, queryset):
         queryset.update(is_active=True)
+        invalidate_category_tree()  # update() skips post_save
     make_active.short_description = "Mark selected categories as active"
     
     def make_inactive(self, request, queryset):
         queryset.update(is_active=False)
+        invalidate_category_tree()
     make_inactive.short_description = "Mark selected categories as inactive"
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'sku', 'category', 'price', 'stock_quantity', 'is_low_stock', 'profit_margin', 'is_active')
-    list_filter = ('category', 'is_active', 'created_at')
+    list_display = ('name', 'sku', 'category', 'price', 'stock_quantity', 'reserved_quantity', 'is_low_stock',
+                    'profit_margin', 'is_active')
+    list_filter = ('category', 'is_active', 'low_stock', 'created_at')
     search_fields = ('name', 'description', 'sku', 'barcode')
     prepopulated_fields = {'slug': ('name',)}
-    readonly_fields = ('created_at', 'updated_at', 'is_low_stock', 'profit_margin')
+    readonly_fields = ('created_at', 'updated_at', 'is_low_stock', 'profit_margin', 'daily_demand', 'demand_std',
+                       'reorder_point', 'order_up_to_level', 'forecast_at')
     inlines = [StockMovementInline]
     actions = ['make_active', 'make_inactive']
     
     def make_active(self, request, queryset):
-        queryset.update(is_active=True)
+        self.set_active(queryset, True)
     make_active.short_description = "Mark selected products as active"
     
     def make_inactive(self, request, queryset):
-        queryset.update(is_active=False)
+        self.set_active(queryset, False)
     make_inactive.short_description = "Mark selected products as inactive"
     
+    def set_active(self, queryset, is_active):
+        # update() skips post_save, so drop the cached scanner lookups here.
+        cache = get_lookup_cache()
+        for product_id in queryset.values_list('pk', flat=True):
+            cache.invalidate(product_id)
+        queryset.update(is_active=is_active)
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Served by the full-text index instead of icontains scans.
+        matches = matching_product_ids(search_term)
+        if matches is None:
+            return queryset, False
+        return queryset.filter(pk__in=matches), False
+    
     def is_low_stock(self, obj):
         return obj.is_low_stock
     is_low_stock.boolean = True
@@ -53,3 +75,36 @@ class StockMovementAdmin(admin.ModelAdmin):
     list_filter = ('movement_type', 'created_at', 'performed_by')
     search_fields = ('product__name', 'product__sku', 'reason')
     readonly_fields = ('created_at',)
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ('product', 'kind', 'stock_quantity', 'min_stock_level', 'created_at')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('product__name', 'product__sku')
+    list_select_related = ('product',)
+    readonly_fields = ('product', 'kind', 'stock_quantity', 'min_stock_level', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False  # Alerts are written by stock changes only
+
+@admin.register(StockCheckpoint)
+class StockCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('taken_at', 'product_count')
+    readonly_fields = ('taken_at', 'product_count')
+    
+    def has_add_permission(self, request):
+        return False  # Checkpoints are taken by the checkpoint_stock command
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('order', 'product', 'quantity', 'expires_at', 'created_at')
+    list_filter = ('expires_at',)
+    search_fields = ('order__order_number', 'product__name', 'product__sku')
+    list_select_related = ('order', 'product')
+    readonly_fields = ('order', 'order_item', 'product', 'quantity', 'expires_at', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False  # Holds are placed by apps.inventory.reservations only
+    
+    def has_delete_permission(self, request, obj=None):
+        return False  # Deleting a row would leave Product.reserved_quantity behind
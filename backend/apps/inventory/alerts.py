@@ -0,0 +1,73 @@
+"""
+Low-stock listing and the stock alert feed.
+
+``Product.low_stock`` is a stored generated column, so the database keeps it
+current in the same statement as every stock change, and the partial index
+``product_low_stock_idx`` holds only low-stock rows. ``low_stock_products``
+reads that index instead of comparing two columns across the whole table.
+
+Stock changes made through ``apps.inventory.stock`` and stock-takes append a
+``StockAlert`` whenever a product falls to its minimum level (``low``) or
+climbs back above it (``restocked``). Edits saved through the admin keep
+``low_stock`` current but do not append alerts. Consumers read the feed with
+``stock_alerts(after=<last id seen>)``.
+
+Alert ids are handed out when the row is inserted, not when its transaction
+commits, so on a database with concurrent writers an alert may become
+visible after one with a higher id. The feed therefore only serves alerts
+older than ``SETTLE_SECONDS``, by which time every lower id has committed
+or been rolled back, and an id cursor never steps over an alert.
+"""
+import datetime
+
+from django.utils import timezone
+
+from .models import Product, StockAlert
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Alerts younger than this are held back from the feed; longer than any
+# transaction that records alerts.
+SETTLE_SECONDS = 10
+
+
+def low_stock_products(active_only=True):
+    """Return low-stock products, emptiest first."""
+    queryset = Product.objects.filter(low_stock=True)
+    if active_only:
+        queryset = queryset.filter(is_active=True)
+    return queryset.order_by('stock_quantity', 'id')
+
+
+def record_crossings(changes):
+    """
+    Append alerts for the stock changes that cross a minimum level.
+
+    ``changes`` is an iterable of ``(product_id, old_quantity, new_quantity,
+    min_stock_level)``. Returns the alerts created.
+    """
+    alerts = []
+    for product_id, old_quantity, new_quantity, min_stock_level in changes:
+        was_low = old_quantity <= min_stock_level
+        is_low = new_quantity <= min_stock_level
+        if was_low != is_low:
+            alerts.append(StockAlert(product_id=product_id, kind='low' if is_low else 'restocked',
+                                     stock_quantity=new_quantity, min_stock_level=min_stock_level))
+    return StockAlert.objects.bulk_create(alerts)
+
+
+def stock_alerts(after=0, limit=DEFAULT_LIMIT):
+    """
+    Return up to ``limit`` alerts newer than the ``after`` cursor and the
+    cursor to pass next time. Alerts appear ``SETTLE_SECONDS`` after they
+    are recorded.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    settled = timezone.now() - datetime.timedelta(seconds=SETTLE_SECONDS)
+    queryset = StockAlert.objects.filter(pk__gt=after)
+    # Stop before the first unsettled alert, so the cursor cannot pass it.
+    unsettled = queryset.filter(created_at__gte=settled).order_by('pk').values_list('pk', flat=True).first()
+    if unsettled is not None:
+        queryset = queryset.filter(pk__lt=unsettled)
+    alerts = list(queryset.select_related('product').order_by('pk')[:limit])
+    return alerts, alerts[-1].pk if alerts else after
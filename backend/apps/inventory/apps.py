@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.inventory'
+
+    def ready(self):
+        # Connects the lookup cache, category tree, search index and
+        # reservation receivers.
+        from . import categories, lookup, reservations, search  # noqa: F401
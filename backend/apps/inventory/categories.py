@@ -0,0 +1,93 @@
+"""
+Reads over the materialized category tree.
+
+``Category.path`` holds the ids from the root down to the category, so a
+subtree is one range scan on the path index, the ancestors of a category
+are named by its own path, and ordering by path lists the whole tree in
+depth-first order. ``Category.save`` keeps paths current when categories
+are created or moved; deleting a category turns its children into roots.
+
+The serialized tree for the sidebar is cached under the current
+``CategoryTreeVersion``, which every category change bumps in its own
+transaction, so no process serves a tree older than the last change.
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Category, CategoryTreeVersion, Product
+
+TREE_CACHE_KEY = 'inventory:category_tree:{version}'
+TREE_CACHE_TIMEOUT = 60 * 60
+# Page size of a category's product listing.
+PRODUCTS_DEFAULT_LIMIT = 50
+PRODUCTS_MAX_LIMIT = 200
+
+
+def subtree(category):
+    """Return ``category`` and all of its descendants."""
+    low, high = Category.path_range(category.path)
+    return Category.objects.filter(path__gte=low, path__lt=high)
+
+
+def subtree_products(category):
+    """Return the products of ``category`` and of all its sub-categories."""
+    low, high = Category.path_range(category.path)
+    return Product.objects.filter(category__path__gte=low, category__path__lt=high)
+
+
+def ancestors(category):
+    """Return the ancestors of ``category``, root first."""
+    return Category.objects.filter(pk__in=category.ancestor_ids).order_by('depth')
+
+
+def breadcrumbs(category):
+    """Return the categories from the root down to ``category`` itself."""
+    return Category.objects.filter(pk__in=category.ancestor_ids + [category.pk]).order_by('depth')
+
+
+def build_tree(rows):
+    """Nest rows ordered by path into ``children`` lists, dropping inactive subtrees."""
+    roots = []
+    nodes = {}
+    for row in rows:
+        node = {'id': row['id'], 'name': row['name'], 'slug': row['slug'], 'children': []}
+        if not row['is_active']:
+            continue
+        if row['parent_id'] is None:
+            roots.append(node)
+        elif row['parent_id'] in nodes:
+            nodes[row['parent_id']]['children'].append(node)
+        else:
+            continue  # Under an inactive category
+        nodes[row['id']] = node
+    return roots
+
+
+def category_tree():
+    """Return the active category tree, served from the cache when possible."""
+    key = TREE_CACHE_KEY.format(version=CategoryTreeVersion.current())
+    tree = cache.get(key)
+    if tree is None:
+        rows = Category.objects.order_by('path').values('id', 'name', 'slug', 'is_active', 'parent_id')
+        tree = build_tree(rows)
+        cache.set(key, tree, TREE_CACHE_TIMEOUT)
+    return tree
+
+
+def invalidate_category_tree():
+    CategoryTreeVersion.bump()
+
+
+@receiver(pre_delete, sender=Category)
+def reroot_children(sender, instance, **kwargs):
+    """Children become roots when their parent is deleted (the FK is SET_NULL)."""
+    for child_id, child_path in Category.objects.filter(parent=instance).values_list('pk', 'path'):
+        new_path = f"{child_id:0{Category.PATH_STEP_WIDTH}d}/"
+        Category.rebase_subtree(child_path, new_path, -(instance.depth + 1))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    invalidate_category_tree()
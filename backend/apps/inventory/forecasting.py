@@ -0,0 +1,258 @@
+"""
+Demand forecasts and reorder points for the whole catalog.
+
+Sales are read in bulk from two sources: ``out`` stock movements and the
+inventory lines of completed orders, live and archived (orders are
+archived after ``ORDER_ARCHIVE_AFTER_DAYS``, well within the history
+window). Rather than grouping in SQL and
+fetching millions of row tuples, each query returns its product, day and
+quantity columns concatenated into strings (a few months of history per
+query), which NumPy parses and totals per product and day. Sales recorded
+both ways (an order committed from a reservation also moves stock) are not
+double counted: for each product and day the larger of the two figures is
+used.
+
+Forecasts are then computed for every product at once with NumPy, without
+per-product queries or a dense product-by-day matrix:
+
+- the demand rate is an exponentially weighted mean of daily sales
+  (``FORECAST_HALF_LIFE_DAYS``), days without sales counting as zero, from
+  the product's creation or the start of the history window;
+- the variability is the weighted standard deviation around that mean;
+- the reorder point covers the supplier lead time ``L`` at the service
+  level's ``z`` score: ``d * L + z * sd * sqrt(L)``;
+- the order-up-to level also covers the review period ``R``:
+  ``d * (L + R) + z * sd * sqrt(L + R)``.
+
+Results are written back with a single parameterized ``UPDATE`` run through
+``executemany``: ``bulk_update`` builds a ``CASE`` term per product and
+field, which costs over a millisecond per product to compile. With
+``apply_levels`` they also replace ``min_stock_level`` and
+``max_stock_level`` of products that have sales.
+"""
+import math
+import time
+from statistics import NormalDist
+
+import numpy as np
+from django.conf import settings
+from django.db import NotSupportedError, connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.utils import timezone
+
+from .models import Product
+
+FORECAST_FIELDS = ['daily_demand', 'demand_std', 'reorder_point', 'order_up_to_level', 'forecast_at']
+# Days of history read per query.
+LOAD_WINDOW_DAYS = 92
+# Products written per executemany call.
+WRITE_BATCH_SIZE = 10_000
+
+
+def _day_age_sql(column):
+    """SQL for the number of whole (UTC) days between ``column`` and the date parameter."""
+    if connection.vendor == 'sqlite':
+        return f"CAST(julianday(%s) - julianday(substr({column}, 1, 10)) AS INTEGER)"
+    if connection.vendor == 'postgresql':
+        return f"(CAST(%s AS date) - CAST({column} AS date))"
+    raise NotSupportedError(f"Demand forecasting is not available on {connection.vendor}")
+
+
+def _concat_sql(expression):
+    """SQL concatenating the integer ``expression`` of every row, comma-separated."""
+    if connection.vendor == 'sqlite':
+        return f"group_concat({expression}, ',')"
+    return f"string_agg(CAST({expression} AS text), ',')"
+
+
+def _fetch_columns(sql, params):
+    """Run ``sql``, which returns one row of concatenated integer columns, as NumPy arrays."""
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return [np.fromstring(value, dtype=np.int64, sep=',') if value else np.empty(0, dtype=np.int64)
+            for value in row]
+
+
+def load_daily_sales(start, end):
+    """
+    Return the ``(product_ids, ages_in_days, units)`` arrays of sales between
+    ``start`` and ``end``, one triple per source: stock movements and orders.
+    Age 0 is the day of ``end``. Rows are not aggregated.
+    """
+    end_date = end.date().isoformat()
+    adapt = connection.ops.adapt_datetimefield_value
+    age = _day_age_sql('created_at')
+    movement_sql = (
+        f"SELECT {_concat_sql('product_id')}, {_concat_sql(age)}, {_concat_sql('quantity')} "
+        "FROM inventory_stockmovement "
+        "WHERE movement_type = 'out' AND created_at >= %s AND created_at < %s"
+    )
+    age = _day_age_sql('o.created_at')
+    order_rows = [
+        f"SELECT i.product_id, {age} AS age, i.quantity FROM {items} i JOIN {orders} o ON o.id = i.order_id "
+        "WHERE i.product_type = 'inventory' AND o.status = 'completed' "
+        "AND o.created_at >= %s AND o.created_at < %s"
+        for items, orders in (('orders_orderitem', 'orders_order'),
+                              ('orders_archivedorderitem', 'orders_archivedorder'))
+    ]
+    order_sql = (
+        f"SELECT {_concat_sql('product_id')}, {_concat_sql('age')}, {_concat_sql('quantity')} "
+        f"FROM ({' UNION ALL '.join(order_rows)}) AS sales"
+    )
+    sources = []
+    # (query, number of times it takes the date parameters)
+    for sql, parts in ((movement_sql, 1), (order_sql, len(order_rows))):
+        chunks = []
+        window_start = start
+        while window_start < end:
+            window_end = min(window_start + timezone.timedelta(days=LOAD_WINDOW_DAYS), end)
+            chunks.append(_fetch_columns(sql, [end_date, adapt(window_start), adapt(window_end)] * parts))
+            window_start = window_end
+        sources.append(tuple(np.concatenate(column) for column in zip(*chunks)) if chunks
+                       else tuple(np.empty(0, dtype=np.int64) for _ in range(3)))
+    return sources
+
+
+def combine_sources(product_ids, days, *sources):
+    """
+    Map ``(product_ids, ages, units)`` sources onto positions in the sorted
+    ``product_ids``, total each source per product and day, then keep the
+    larger figure where both sources have one. Returns
+    ``(product_index, age, units)`` arrays.
+    """
+    all_codes = []
+    all_units = []
+    for ids, ages, units in sources:
+        positions = np.searchsorted(product_ids, ids)
+        known = (positions < len(product_ids)) & (ages >= 0) & (ages < days)
+        known[known] &= product_ids[positions[known]] == ids[known]
+        codes, inverse = np.unique(positions[known] * days + ages[known], return_inverse=True)
+        all_codes.append(codes)
+        all_units.append(np.bincount(inverse, weights=units[known], minlength=len(codes)))
+    codes = np.concatenate(all_codes) if all_codes else np.empty(0, dtype=np.int64)
+    units = np.concatenate(all_units) if all_units else np.empty(0, dtype=np.float64)
+
+    order = np.lexsort((units, codes))
+    codes, units = codes[order], units[order]
+    last = np.ones(len(codes), dtype=bool)
+    last[:-1] = codes[1:] != codes[:-1]
+    codes, units = codes[last], units[last]
+    return codes // days, codes % days, units
+
+
+def compute_forecasts(product_count, product_index, ages, units, active_days, half_life=None,
+                      lead_time=None, review_days=None, service_level=None):
+    """
+    Compute the demand rate, its standard deviation, the reorder point and
+    the order-up-to level of every product in one vectorized pass.
+
+    ``product_index``, ``ages`` and ``units`` hold one entry per product and
+    day with sales; ``active_days`` is the number of days of history each
+    product has. Returns four arrays of length ``product_count``.
+    """
+    half_life = settings.FORECAST_HALF_LIFE_DAYS if half_life is None else half_life
+    lead_time = settings.FORECAST_LEAD_TIME_DAYS if lead_time is None else lead_time
+    review_days = settings.FORECAST_REVIEW_DAYS if review_days is None else review_days
+    service_level = settings.FORECAST_SERVICE_LEVEL if service_level is None else service_level
+
+    decay = 0.5 ** (1 / half_life)
+    weights = decay ** ages
+    weighted = np.bincount(product_index, weights=weights * units, minlength=product_count)
+    weighted_squares = np.bincount(product_index, weights=weights * units * units, minlength=product_count)
+    # Sum of the weights of every active day, sales or not (a geometric series).
+    total_weight = (1 - decay ** active_days) / (1 - decay)
+
+    demand = weighted / total_weight
+    std = np.sqrt(np.clip(weighted_squares / total_weight - demand ** 2, 0, None))
+
+    z = NormalDist().inv_cdf(service_level)
+    cover = lead_time + review_days
+    reorder_point = np.ceil(demand * lead_time + z * std * math.sqrt(lead_time))
+    order_up_to = np.maximum(np.ceil(demand * cover + z * std * math.sqrt(cover)), reorder_point)
+    return demand, std, reorder_point.astype(np.int64), order_up_to.astype(np.int64)
+
+
+def forecast_demand(history_days=None, apply_levels=False, now=None, **options):
+    """
+    Forecast demand for every product and store the results on the products.
+
+    ``options`` are passed to ``compute_forecasts``. Returns the stats:
+    products, products with sales, daily rows read and the seconds spent
+    loading, computing and writing.
+    """
+    history_days = settings.FORECAST_HISTORY_DAYS if history_days is None else history_days
+    now = timezone.now() if now is None else now
+    start = now - timezone.timedelta(days=history_days)
+    stats = {'products': 0, 'with_sales': 0, 'rows': 0, 'load_seconds': 0.0,
+             'compute_seconds': 0.0, 'write_seconds': 0.0}
+
+    started = time.perf_counter()
+    products = list(Product.objects.order_by('pk').values_list('pk', 'created_at', 'min_stock_level',
+                                                               'max_stock_level'))
+    product_ids = np.fromiter((row[0] for row in products), dtype=np.int64, count=len(products))
+    end_date = now.date()
+    active_days = np.clip(
+        np.fromiter(((end_date - row[1].date()).days + 1 for row in products), dtype=np.int64,
+                    count=len(products)),
+        1, history_days,
+    )
+    sources = load_daily_sales(start, now)
+    stats['rows'] = sum(len(source[0]) for source in sources)
+    stats['load_seconds'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    product_index, ages, units = combine_sources(product_ids, history_days, *sources)
+    demand, std, reorder_point, order_up_to = compute_forecasts(
+        len(products), product_index, ages, units, active_days, **options
+    )
+    stats['compute_seconds'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    forecast_at = connection.ops.adapt_datetimefield_value(now)
+    columns = [demand.tolist(), std.tolist(), reorder_point.tolist(), order_up_to.tolist(),
+               [forecast_at] * len(products)]
+    fields = list(FORECAST_FIELDS)
+    if apply_levels:
+        has_sales = demand > 0
+        current_min = np.fromiter((row[2] for row in products), dtype=np.int64, count=len(products))
+        current_max = np.fromiter((row[3] for row in products), dtype=np.int64, count=len(products))
+        columns += [np.where(has_sales, reorder_point, current_min).tolist(),
+                    np.where(has_sales, order_up_to, current_max).tolist()]
+        fields += ['min_stock_level', 'max_stock_level']
+    columns.append(product_ids.tolist())
+    _write_columns(fields, list(zip(*columns)))
+    stats['write_seconds'] = time.perf_counter() - started
+
+    stats['products'] = len(products)
+    stats['with_sales'] = int(np.count_nonzero(demand))
+    return stats
+
+
+def _write_columns(fields, rows):
+    """Set ``fields`` of each product from ``rows`` of field values followed by the product id."""
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f"{quote(field)} = %s" for field in fields)
+    sql = f"UPDATE {quote(Product._meta.db_table)} SET {assignments} WHERE {quote('id')} = %s"
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + WRITE_BATCH_SIZE])
+
+
+def suggested_purchase_order(products=None):
+    """
+    Return the active products at or below their reorder point, annotated
+    with the ``order_quantity`` that brings available stock back to the
+    order-up-to level and the ``order_cost`` of that quantity.
+    """
+    products = Product.objects.all() if products is None else products
+    order_quantity = F('order_up_to_level') - F('available_quantity')
+    return (
+        products.filter(is_active=True, reorder_point__gt=0, available_quantity__lte=F('reorder_point'))
+        .annotate(
+            order_quantity=order_quantity,
+            order_cost=ExpressionWrapper(order_quantity * F('cost_price'),
+                                         output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+        .order_by('-order_cost', 'pk')
+    )
@@ -0,0 +1,136 @@
+"""
+Point-in-time stock from checkpoints and the movement ledger.
+
+``take_checkpoint`` records the stock and unit cost of every product in
+one ``INSERT ... SELECT``. Stock at a past moment is then the nearest
+checkpoint at or before it plus the movements recorded since, read through
+the ``(product, created_at)`` index, instead of a sum over the product's
+whole history. Products created after that checkpoint (or moments before
+the first one) are answered from the current stock minus later movements.
+
+Each snapshot row also records the id of the product's last movement
+visible to the same statement, so the stock read and the replay boundary
+come from one consistent view. Movements are replayed by id rather than by
+``created_at``: a movement committed while the checkpoint was being taken
+is either in the snapshot (and at or below the boundary) or after it, never
+both or neither. This relies on stock writers updating the product row
+before recording its movement, so the ids of one product's movements are
+assigned in commit order. ``taken_at`` is stamped once the snapshot has been
+read. Checkpoints taken before boundaries were recorded fall back to
+``created_at``.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.utils import timezone
+
+from .models import Product, StockMovement, StockCheckpoint, StockSnapshot
+
+# Signed stock change of a movement: "out" quantities are stored positive.
+SIGNED_QUANTITY = Case(When(movement_type='out', then=-F('quantity')), default=F('quantity'))
+
+
+def take_checkpoint():
+    """Snapshot the stock, unit cost and last movement of every product. Returns the checkpoint."""
+    quote = connection.ops.quote_name
+    snapshots = StockSnapshot._meta
+    products = quote(Product._meta.db_table)
+    movements = quote(StockMovement._meta.db_table)
+    with transaction.atomic():
+        checkpoint = StockCheckpoint.objects.create(taken_at=timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(snapshots.db_table)} "
+                f"({quote('checkpoint_id')}, {quote('product_id')}, {quote('stock_quantity')}, {quote('cost_price')}, "
+                f"{quote('last_movement_id')}) "
+                f"SELECT %s, p.{quote('id')}, p.{quote('stock_quantity')}, p.{quote('cost_price')}, "
+                f"(SELECT COALESCE(MAX(m.{quote('id')}), 0) FROM {movements} m "
+                f"WHERE m.{quote('product_id')} = p.{quote('id')}) "
+                f"FROM {products} p",
+                [checkpoint.pk],
+            )
+            checkpoint.product_count = cursor.rowcount
+        checkpoint.taken_at = timezone.now()
+        checkpoint.save(update_fields=['taken_at', 'product_count'])
+    return checkpoint
+
+
+def checkpoint_at(when):
+    """Return the latest checkpoint taken at or before ``when``, or None."""
+    return StockCheckpoint.objects.filter(taken_at__lte=when).order_by('-taken_at').first()
+
+
+def _replayed(movements, last_movement_id, taken_at, when):
+    """The ``movements`` after a snapshot, up to ``when``."""
+    if last_movement_id is None:
+        return movements.filter(created_at__gt=taken_at, created_at__lte=when)
+    return movements.filter(pk__gt=last_movement_id, created_at__lte=when)
+
+
+def _movement_totals(movements):
+    totals = movements.values('product_id').annotate(change=Sum(SIGNED_QUANTITY))
+    return dict(totals.values_list('product_id', 'change'))
+
+
+def stock_at(product, when):
+    """Return the stock of ``product`` (an instance or id) at ``when``."""
+    product_id = getattr(product, 'pk', product)
+    snapshot = (
+        StockSnapshot.objects.filter(product_id=product_id, checkpoint__taken_at__lte=when)
+        .select_related('checkpoint').order_by('-checkpoint__taken_at').first()
+    )
+
+    movements = StockMovement.objects.filter(product_id=product_id)
+    if snapshot is not None:
+        since = _replayed(movements, snapshot.last_movement_id, snapshot.checkpoint.taken_at, when)
+        return snapshot.stock_quantity + (since.aggregate(change=Sum(SIGNED_QUANTITY))['change'] or 0)
+
+    current = Product.objects.filter(pk=product_id).values_list('stock_quantity', flat=True).get()
+    later = movements.filter(created_at__gt=when).aggregate(change=Sum(SIGNED_QUANTITY))['change'] or 0
+    return current - later
+
+
+def stock_levels_at(when):
+    """
+    Return ``{product_id: (stock_quantity, unit_cost)}`` for every product at
+    ``when`` in a handful of set-based queries, whatever the size of the ledger.
+    """
+    checkpoint = checkpoint_at(when)
+    levels = {}
+    if checkpoint is not None:
+        snapshots = list(checkpoint.snapshots.values_list('product_id', 'stock_quantity', 'cost_price',
+                                                          'last_movement_id'))
+        levels = {product_id: (quantity, cost) for product_id, quantity, cost, _ in snapshots}
+        boundaries = [last_movement_id for *_, last_movement_id in snapshots]
+        if None in boundaries:
+            since = StockMovement.objects.filter(created_at__gt=checkpoint.taken_at, created_at__lte=when)
+        else:
+            # The lowest boundary bounds the primary key range scanned; each
+            # movement is then compared with its own product's boundary.
+            since = StockMovement.objects.filter(
+                Q(pk__gt=min(boundaries, default=0)), Q(pk__gt=F('product__stock_snapshots__last_movement_id')),
+                created_at__lte=when, product__stock_snapshots__checkpoint=checkpoint,
+            )
+        since = _movement_totals(since)
+        for product_id, change in since.items():
+            if product_id in levels:
+                quantity, cost = levels[product_id]
+                levels[product_id] = (quantity + change, cost)
+
+    # Products missing from the checkpoint are walked back from today.
+    missing = Product.objects.filter(created_at__lte=when).order_by()
+    if checkpoint is not None:
+        missing = missing.exclude(pk__in=checkpoint.snapshots.values('product_id'))
+    later = _movement_totals(StockMovement.objects.filter(created_at__gt=when, product__in=missing))
+    for product_id, quantity, cost in missing.values_list('pk', 'stock_quantity', 'cost_price'):
+        levels[product_id] = (quantity - later.get(product_id, 0), cost)
+    return levels
+
+
+def value_inventory_at(when):
+    """Return the number of products, units on hand and their value at cost at ``when``."""
+    levels = stock_levels_at(when)
+    units = sum(quantity for quantity, _ in levels.values())
+    value = sum((quantity * cost for quantity, cost in levels.values()), Decimal('0'))
+    return {'at': when, 'products': len(levels), 'units': units, 'value': value}
@@ -0,0 +1,181 @@
+"""
+Product lookup by scanned code for the register.
+
+A scanned code is matched against ``Product.barcode`` first and then
+``Product.sku``, both indexed. Results, including codes that matched
+nothing, are kept in a per-process LRU cache bounded in size and age, so a
+repeat scan is a dictionary lookup. ``post_save``/``post_delete`` receivers
+drop the affected entries in this process; entries in other processes
+expire after ``PRODUCT_LOOKUP_CACHE_TTL`` seconds. Stock levels are not
+cached, since they change through updates that bypass ``save()``.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product
+
+# Fields returned for a scanned product.
+LOOKUP_FIELDS = ('id', 'name', 'sku', 'barcode', 'price', 'is_active', 'category_id')
+
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+LOOKUP_BATCH_SIZE = 500
+MAX_CODES = 500
+
+
+class ProductLookupCache:
+    """Thread-safe LRU cache of scanned code to product fields, with a TTL."""
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = settings.PRODUCT_LOOKUP_CACHE_SIZE if max_size is None else max_size
+        self.ttl = settings.PRODUCT_LOOKUP_CACHE_TTL if ttl is None else ttl
+        self.entries = OrderedDict()  # code -> (expires, row or None)
+        self.codes_by_product = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, code):
+        """Return ``(found, row)``; ``row`` is None for codes known not to match."""
+        with self.lock:
+            entry = self.entries.get(code)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(code)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, code, row, replace=True):
+        with self.lock:
+            if not replace and code in self.entries:
+                return
+            self.entries[code] = (time.monotonic() + self.ttl, row)
+            self.entries.move_to_end(code)
+            if row is not None:
+                self.codes_by_product.setdefault(row[0], set()).add(code)
+            while len(self.entries) > self.max_size:
+                evicted, (_, evicted_row) = self.entries.popitem(last=False)
+                if evicted_row is not None:
+                    self._forget_code(evicted_row[0], evicted)
+
+    def _forget_code(self, product_id, code):
+        codes = self.codes_by_product.get(product_id)
+        if codes is not None:
+            codes.discard(code)
+            if not codes:
+                del self.codes_by_product[product_id]
+
+    def invalidate(self, product_id=None, codes=()):
+        """Drop the entries of a product and of the given codes."""
+        with self.lock:
+            for code in self.codes_by_product.pop(product_id, set()) | set(codes):
+                self.entries.pop(code, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.codes_by_product.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_lookup_cache():
+    """Return this process's lookup cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ProductLookupCache()
+    return _cache
+
+
+def _as_dict(row):
+    return dict(zip(LOOKUP_FIELDS, row)) if row is not None else None
+
+
+def _fetch(codes):
+    """Resolve codes with indexed queries; barcode matches win over SKU matches."""
+    found = {}
+    for start in range(0, len(codes), LOOKUP_BATCH_SIZE):
+        batch = set(codes[start:start + LOOKUP_BATCH_SIZE])
+        rows = Product.objects.filter(Q(barcode__in=batch) | Q(sku__in=batch)).order_by('pk')
+        for row in rows.values_list(*LOOKUP_FIELDS):
+            sku, barcode = row[2], row[3]
+            if barcode in batch and (barcode not in found or found[barcode][3] != barcode):
+                found[barcode] = row
+            if sku in batch and sku not in found:
+                found[sku] = row
+    return found
+
+
+def lookup_products(codes):
+    """
+    Resolve scanned codes in one go. Returns a mapping of each code to its
+    product fields, or None when nothing matches.
+    """
+    cache = get_lookup_cache()
+    results = {}
+    missing = []
+    for code in dict.fromkeys(codes):
+        found, row = cache.get(code)
+        if found:
+            results[code] = _as_dict(row)
+        else:
+            missing.append(code)
+
+    if missing:
+        fetched = _fetch(missing)
+        for code in missing:
+            row = fetched.get(code)
+            cache.set(code, row)
+            results[code] = _as_dict(row)
+    return results
+
+
+def lookup_product(code):
+    """Resolve a single scanned code; see ``lookup_products``."""
+    return lookup_products([code])[code]
+
+
+def warm_lookup_cache(batch_size=2000):
+    """Load active products into the cache by barcode and SKU, up to its size."""
+    cache = get_lookup_cache()
+    loaded = 0
+    rows = Product.objects.filter(is_active=True).order_by('pk').values_list(*LOOKUP_FIELDS)
+    for row in rows.iterator(chunk_size=batch_size):
+        # A barcode match takes precedence over another product's SKU.
+        for code, replace in ((row[3], True), (row[2], False)):
+            if code and loaded < cache.max_size:
+                cache.set(code, row, replace=replace)
+                loaded += 1
+        if loaded >= cache.max_size:
+            break
+    return loaded
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_lookup(sender, instance, **kwargs):
+    """Drop cached lookups of a changed product, including codes that matched nothing."""
+    get_lookup_cache().invalidate(instance.pk, [code for code in (instance.barcode, instance.sku) if code])
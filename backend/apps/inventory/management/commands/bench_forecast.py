@@ -0,0 +1,108 @@
+import math
+import random
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.inventory.forecasting import forecast_demand
+from apps.inventory.models import Product, StockMovement
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the catalog demand forecast on synthetic daily sales, against forecasting "
+        "products one query at a time. Synthetic products and movements are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skus', type=int, default=50_000)
+        parser.add_argument('--days', type=int, default=730)
+        parser.add_argument('--density', type=float, default=0.25, help="Share of days on which a SKU sells")
+        parser.add_argument('--sample', type=int, default=200, help="Products forecast one at a time")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(11)
+        now = timezone.now()
+        with transaction.atomic():
+            Product.objects.all().update(is_active=False)  # Leave only the synthetic catalog in the report
+            self.stdout.write(f"Inserting daily sales for {options['skus']} SKUs over {options['days']} days...")
+            rows = self.populate(options, rng, now)
+            self.stdout.write(f"Inserted {rows} movements")
+
+            started = time.perf_counter()
+            stats = forecast_demand(history_days=options['days'], now=now)
+            elapsed = time.perf_counter() - started
+
+            sample = random.Random(3).sample(
+                list(Product.objects.filter(sku__startswith='BENCH-FC-').values_list('pk', flat=True)),
+                options['sample'],
+            )
+            started = time.perf_counter()
+            naive = {pk: self.forecast_one(pk, now, options['days']) for pk in sample}
+            naive_elapsed = (time.perf_counter() - started) * options['skus'] / options['sample']
+
+            stored = Product.objects.filter(pk__in=sample).values_list('pk', 'daily_demand', 'demand_std')
+            mismatches = [
+                pk for pk, demand, std in stored
+                if not (math.isclose(demand, naive[pk][0], rel_tol=1e-9, abs_tol=1e-9)
+                        and math.isclose(std, naive[pk][1], rel_tol=1e-6, abs_tol=1e-6))
+            ]
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"Vectorized: {elapsed:.2f}s for {stats['products']} products ({stats['rows']} daily rows): "
+            f"load {stats['load_seconds']:.2f}s, compute {stats['compute_seconds']:.2f}s, "
+            f"write {stats['write_seconds']:.2f}s"
+        )
+        self.stdout.write(f"Per product: {naive_elapsed:.1f}s (extrapolated from {options['sample']} products)")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} sampled forecasts differ, e.g. product {mismatches[0]}")
+        self.stdout.write(self.style.SUCCESS("Sampled forecasts match"))
+
+    def populate(self, options, rng, now, batch_size=50_000):
+        Product.objects.bulk_create([
+            Product(name=f'Forecast {i}', slug=f'bench-fc-{i}', sku=f'BENCH-FC-{i}', description='',
+                    price=Decimal('2.00'), cost_price=Decimal('1.00'), stock_quantity=20)
+            for i in range(options['skus'])
+        ], batch_size=2000)
+        product_ids = np.array(Product.objects.filter(sku__startswith='BENCH-FC-').values_list('pk', flat=True))
+        rates = rng.lognormal(mean=0.5, sigma=1.0, size=len(product_ids))
+
+        table = connection.ops.quote_name(StockMovement._meta.db_table)
+        sql = (f"INSERT INTO {table} (product_id, movement_type, quantity, reason, created_at) "
+               f"VALUES (%s, 'out', %s, '', %s)")
+        adapt = connection.ops.adapt_datetimefield_value
+        inserted = 0
+        with connection.cursor() as cursor:
+            for age in range(options['days']):
+                selling = rng.random(len(product_ids)) < options['density']
+                quantities = 1 + rng.poisson(rates[selling])
+                created_at = adapt(now - timezone.timedelta(days=age, hours=1))
+                rows = [(int(pk), int(quantity), created_at)
+                        for pk, quantity in zip(product_ids[selling], quantities)]
+                for start in range(0, len(rows), batch_size):
+                    cursor.executemany(sql, rows[start:start + batch_size])
+                inserted += len(rows)
+        return inserted
+
+    def forecast_one(self, product_id, now, days):
+        """The same demand rate and deviation, from one product's own query."""
+        start = now - timezone.timedelta(days=days)
+        created = Product.objects.filter(pk=product_id).values_list('created_at', flat=True).get()
+        totals = {}
+        movements = StockMovement.objects.filter(product_id=product_id, movement_type='out',
+                                                 created_at__gte=start, created_at__lt=now)
+        for created_at, quantity in movements.values_list('created_at', 'quantity'):
+            age = (now.date() - created_at.date()).days
+            totals[age] = totals.get(age, 0) + quantity
+        decay = 0.5 ** (1 / settings.FORECAST_HALF_LIFE_DAYS)
+        active = min(max((now.date() - created.date()).days + 1, 1), days)
+        weight = sum(decay ** age for age in range(active))
+        demand = sum(decay ** age * units for age, units in totals.items()) / weight
+        variance = sum(decay ** age * units * units for age, units in totals.items()) / weight - demand ** 2
+        return demand, math.sqrt(max(variance, 0))
@@ -0,0 +1,61 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.inventory.lookup import get_lookup_cache, lookup_product, lookup_products
+from apps.inventory.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark scanner lookups by barcode: indexed database path against cache hits, "
+        "single and batched. Synthetic products are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--scans', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=50, help="Codes per batch lookup")
+
+    def handle(self, *args, **options):
+        cache = get_lookup_cache()
+        with transaction.atomic():
+            Product.objects.bulk_create([
+                Product(name=f'Scan {i}', slug=f'bench-scan-{i}', sku=f'BENCH-SCAN-{i}', barcode=f'99{i:011d}',
+                        description='', price=Decimal('1.00'), cost_price=Decimal('0.50'))
+                for i in range(options['products'])
+            ], batch_size=2000)
+            codes = [f'99{random.randrange(options["products"]):011d}' for _ in range(options['scans'])]
+
+            cache.clear()
+            cold = self.time_each(codes, lambda code: (cache.clear(), lookup_product(code)))
+            lookup_products(codes)
+            warm = self.time_each(codes, lookup_product)
+            batches = [codes[i:i + options['batch']] for i in range(0, len(codes), options['batch'])]
+            cache.clear()
+            cold_batch = self.time_each(batches, lookup_products)
+            warm_batch = self.time_each(batches, lookup_products)
+            stats = cache.stats()
+            cache.clear()
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{options['products']} products, {options['scans']} scans (median ms)")
+        self.stdout.write(f"{'database':>16}: {cold:8.3f}")
+        self.stdout.write(f"{'cache hit':>16}: {warm:8.3f}")
+        self.stdout.write(f"{'batch database':>16}: {cold_batch:8.3f} per {options['batch']} codes")
+        self.stdout.write(f"{'batch cache hit':>16}: {warm_batch:8.3f} per {options['batch']} codes")
+        self.stdout.write(self.style.SUCCESS(
+            f"Hit rate {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses)"
+        ))
+
+    def time_each(self, values, lookup):
+        samples = []
+        for value in values:
+            started = time.perf_counter()
+            lookup(value)
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,88 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from apps.inventory.models import Category, Product
+from apps.inventory.search import normalize, rebuild_product_search_index, search_products
+
+ADJECTIVES = ('organic', 'fresh', 'spicy', 'classic', 'smoked', 'roasted', 'sparkling', 'sweet', 'mild', 'dark')
+NOUNS = ('coffee', 'tea', 'cola', 'cheddar', 'salmon', 'almonds', 'chocolate', 'lemonade', 'granola', 'salsa',
+         'pasta', 'honey', 'yogurt', 'crackers', 'olives', 'ketchup', 'bagels', 'muesli', 'cider', 'tofu')
+SIZES = ('small', 'large', 'family pack', 'single', 'twin pack')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark catalog search with facets: full-text index against icontains filters "
+        "with ORM facet counts. Synthetic products are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500_000)
+        parser.add_argument('--categories', type=int, default=40)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(7)
+        with transaction.atomic():
+            self.stdout.write(f"Inserting {options['products']} products...")
+            categories = [Category.objects.create(name=f'Bench aisle {i}', slug=f'bench-aisle-{i}')
+                          for i in range(options['categories'])]
+            self.populate(options['products'], categories, rng)
+
+            started = time.perf_counter()
+            indexed = rebuild_product_search_index()
+            self.stdout.write(f"Indexed {indexed} products in {time.perf_counter() - started:.1f} s")
+
+            queries = ['coffee', 'organic tea', 'smok salm', 'family pack', 'bench-sku-0012345', 'zzzz']
+            # icontains also matches inside words (e.g. digits inside barcodes), so its counts can be higher.
+            self.stdout.write(f"{'query':>18} {'matches':>8} {'index ms':>9} {'icontains':>10} {'icontains ms':>13}")
+            for query in queries:
+                indexed_ms, result = self.time_median(lambda: search_products(query), options['repeat'])
+                baseline_ms, count = self.time_median(lambda: self.icontains_search(query), options['repeat'])
+                self.stdout.write(
+                    f"{query:>18} {result['count']:>8} {indexed_ms:>9.1f} {count:>10} {baseline_ms:>13.1f}"
+                )
+
+            transaction.set_rollback(True)
+
+    def populate(self, total, categories, rng, batch_size=5000):
+        for offset in range(0, total, batch_size):
+            products = []
+            for i in range(offset, min(offset + batch_size, total)):
+                name = f"{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {rng.choice(SIZES)}"
+                products.append(Product(
+                    name=name, slug=f'bench-search-{i}', sku=f'BENCH-SKU-{i:07d}', barcode=f'77{i:011d}',
+                    description=f"{name}. {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} flavour, store cool and dry.",
+                    category=rng.choice(categories), price=Decimal(rng.randrange(50, 40000)) / 100,
+                    cost_price=Decimal('0.50'),
+                ))
+            Product.objects.bulk_create(products, batch_size=batch_size)
+
+    def icontains_search(self, query):
+        """The same search done with icontains filters and ORM facet queries."""
+        terms = normalize(query)
+        matches = Product.objects.filter(is_active=True)
+        for term in terms:
+            matches = matches.filter(Q(name__icontains=term) | Q(description__icontains=term)
+                                     | Q(sku__icontains=term) | Q(barcode__icontains=term))
+        count = matches.count()
+        list(matches.order_by('name')[:20])
+        list(matches.values('category_id').annotate(count=Count('id')).order_by())
+        for low, high in ((0, 10), (10, 25), (25, 50), (50, 100), (100, 250), (250, None)):
+            bucket = matches.filter(price__gte=low)
+            (bucket.filter(price__lt=high) if high else bucket).count()
+        return count
+
+    def time_median(self, run, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = run()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples), result
@@ -0,0 +1,130 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from apps.inventory.history import SIGNED_QUANTITY, stock_at, stock_levels_at
+from apps.inventory.models import Product, StockMovement, StockCheckpoint, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark point-in-time stock from monthly checkpoints against summing the whole "
+        "movement ledger. Synthetic products and movements are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movements', type=int, default=10_000_000)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--checkpoint-every', type=int, default=30, help="Days between checkpoints")
+        parser.add_argument('--queries', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write(f"Inserting {options['movements']} movements for {options['products']} products...")
+            start, end = self.populate(options)
+
+            dates = [start + (end - start) * random.random() for _ in range(options['queries'])]
+            product_ids = list(Product.objects.filter(sku__startswith='BENCH-HIST-').values_list('pk', flat=True))
+            samples = [(random.choice(product_ids), when) for when in dates]
+
+            full = self.time_each(samples, lambda args: self.full_history(*args))
+            checkpointed = self.time_each(samples, lambda args: stock_at(*args))
+            mismatches = sum(1 for args in samples if self.full_history(*args) != stock_at(*args))
+
+            when = dates[0]
+            catalog_full = self.time_each([when], lambda when: self.full_history_catalog(when))
+            catalog_checkpointed = self.time_each([when], stock_levels_at)
+            levels = stock_levels_at(when)
+            full_levels = self.full_history_catalog(when)
+            mismatches += sum(1 for pk in product_ids if levels.get(pk, (0,))[0] != full_levels.get(pk, 0))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{'':>22} {'full ledger':>12} {'checkpoint':>12}  (ms)")
+        self.stdout.write(f"{'stock of one product':>22} {full:12.2f} {checkpointed:12.2f}")
+        self.stdout.write(f"{'whole catalog':>22} {catalog_full:12.2f} {catalog_checkpointed:12.2f}")
+        if mismatches:
+            raise CommandError(f"{mismatches} results differ between the two methods")
+        self.stdout.write(self.style.SUCCESS("Both methods agree"))
+
+    def populate(self, options, batch_size=20000):
+        Product.objects.bulk_create([
+            Product(name=f'History {i}', slug=f'bench-hist-{i}', sku=f'BENCH-HIST-{i}', description='',
+                    price=Decimal('2.00'), cost_price=Decimal('1.00'))
+            for i in range(options['products'])
+        ], batch_size=2000)
+        # The ledger starts empty, so stock is the sum of all movements so far.
+        product_ids = list(Product.objects.filter(sku__startswith='BENCH-HIST-').values_list('pk', flat=True))
+        stock = dict.fromkeys(product_ids, 0)
+
+        end = timezone.now() - timezone.timedelta(days=1)
+        start = end - timezone.timedelta(days=options['days'])
+        # Products before the first checkpoint are walked back from today, if they existed then.
+        Product.objects.filter(pk__in=product_ids).update(created_at=start)
+        step = (end - start) / options['movements']
+        next_checkpoint = start + timezone.timedelta(days=options['checkpoint_every'])
+
+        table = connection.ops.quote_name(StockMovement._meta.db_table)
+        sql = (f"INSERT INTO {table} (product_id, movement_type, quantity, reason, created_at) "
+               f"VALUES (%s, %s, %s, '', %s)")
+        rows = []
+        with connection.cursor() as cursor:
+            for i in range(options['movements']):
+                created_at = start + step * i
+                if created_at >= next_checkpoint:
+                    cursor.executemany(sql, rows)
+                    rows = []
+                    self.checkpoint(next_checkpoint, stock)
+                    next_checkpoint += timezone.timedelta(days=options['checkpoint_every'])
+                product_id = random.choice(product_ids)
+                quantity = random.randint(1, 5)
+                if stock[product_id] >= quantity and random.random() < 0.5:
+                    movement = 'out'
+                    stock[product_id] -= quantity
+                else:
+                    movement = 'in'
+                    stock[product_id] += quantity
+                rows.append((product_id, movement, quantity, created_at))
+                if len(rows) >= batch_size:
+                    cursor.executemany(sql, rows)
+                    rows = []
+            cursor.executemany(sql, rows)
+
+        for product_id, quantity in stock.items():
+            Product.objects.filter(pk=product_id).update(stock_quantity=quantity)
+        return start, end
+
+    def checkpoint(self, taken_at, stock):
+        # The replay boundary of each product, as take_checkpoint records it.
+        last_movements = dict(StockMovement.objects.filter(product_id__in=list(stock)).values('product_id')
+                              .annotate(last=Max('id')).values_list('product_id', 'last'))
+        checkpoint = StockCheckpoint.objects.create(taken_at=taken_at, product_count=len(stock))
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(checkpoint=checkpoint, product_id=product_id, stock_quantity=quantity,
+                          cost_price=Decimal('1.00'), last_movement_id=last_movements.get(product_id, 0))
+            for product_id, quantity in stock.items()
+        ], batch_size=2000)
+
+    def full_history(self, product_id, when):
+        movements = StockMovement.objects.filter(product_id=product_id, created_at__lte=when)
+        return movements.aggregate(stock=Sum(SIGNED_QUANTITY))['stock'] or 0
+
+    def full_history_catalog(self, when):
+        totals = StockMovement.objects.filter(created_at__lte=when).values('product_id').annotate(
+            stock=Sum(SIGNED_QUANTITY)
+        )
+        return dict(totals.values_list('product_id', 'stock'))
+
+    def time_each(self, values, query):
+        samples = []
+        for value in values:
+            started = time.perf_counter()
+            query(value)
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
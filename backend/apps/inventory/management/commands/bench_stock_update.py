@@ -0,0 +1,68 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.inventory.models import Product, StockMovement
+from apps.inventory.stock import remove_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark basket stock decrements: read-modify-write per product against "
+        "one conditional UPDATE per basket. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baskets', type=int, default=500)
+        parser.add_argument('--lines', type=int, default=5, help="Products per basket")
+
+    def handle(self, *args, **options):
+        baskets, lines = options['baskets'], options['lines']
+
+        with transaction.atomic():
+            products = Product.objects.bulk_create([
+                Product(name=f'Bench {i}', slug=f'bench-stock-{i}', sku=f'BENCH-STOCK-{i}', description='',
+                        price=Decimal('1.00'), cost_price=Decimal('0.50'), stock_quantity=baskets * 2)
+                for i in range(lines)
+            ])
+            basket = {product.pk: 1 for product in products}
+
+            legacy = self.run(baskets, lambda: self.read_modify_write(basket))
+            conditional = self.run(baskets, lambda: remove_stock(basket))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{baskets} baskets x {lines} products")
+        for label, (elapsed, queries) in (('read-modify-write', legacy), ('conditional update', conditional)):
+            self.stdout.write(
+                f"{label:>18}: {baskets / elapsed:8.0f} baskets/s "
+                f"{queries / baskets:6.1f} queries/basket"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {legacy[0] / conditional[0]:.1f}x"))
+
+    def run(self, count, sell):
+        queries = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            for _ in range(count):
+                sell()
+            elapsed = time.perf_counter() - start
+        return elapsed, queries
+
+    def read_modify_write(self, basket):
+        """The previous Product.update_stock path: load, check, save, then log each product."""
+        with transaction.atomic():
+            for product_id, quantity in basket.items():
+                product = Product.objects.get(pk=product_id)
+                if product.stock_quantity < quantity:
+                    raise ValueError("Cannot remove more stock than available")
+                product.stock_quantity -= quantity
+                product.save(update_fields=['stock_quantity', 'updated_at'])
+                StockMovement.objects.create(product=product, movement_type='out', quantity=quantity)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory.history import take_checkpoint
+
+
+class Command(BaseCommand):
+    help = "Record the stock of every product as a checkpoint for point-in-time stock queries. Run nightly."
+
+    def handle(self, *args, **options):
+        checkpoint = take_checkpoint()
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {checkpoint.product_count} products at {checkpoint.taken_at:%Y-%m-%d %H:%M}"
+        ))
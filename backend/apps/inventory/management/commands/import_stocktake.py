@@ -0,0 +1,58 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.inventory.stocktake import (
+    DEFAULT_CHUNK_SIZE, STOCKTAKE_ENCODING, STOCKTAKE_FORMATS, StocktakeFormatError, apply_stocktake,
+    check_encoding, detect_format,
+)
+
+
+class Command(BaseCommand):
+    help = "Set stock levels from a CSV or NDJSON stock-take file of sku, counted_quantity rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for standard input")
+        parser.add_argument('--file-format', choices=STOCKTAKE_FORMATS,
+                            help="Defaults to the file extension, or csv")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--reason', default='Stock-take')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or detect_format(path)
+
+        def progress(stats):
+            self.stdout.write(f"{stats['rows']} rows, {stats['adjusted']} adjusted, "
+                              f"{stats['rows_per_second']:.0f} rows/s")
+
+        try:
+            if path == '-':
+                stream = sys.stdin
+            else:
+                binary = open(path, 'rb')
+                try:
+                    check_encoding(binary)
+                except UnicodeDecodeError as exc:
+                    binary.close()
+                    raise CommandError(f"{path} is not UTF-8 text (invalid byte at offset {exc.start})")
+                stream = io.TextIOWrapper(binary, encoding=STOCKTAKE_ENCODING, newline='')
+        except OSError as exc:
+            raise CommandError(exc)
+        with stream:
+            try:
+                stats = apply_stocktake(stream, file_format, reason=options['reason'],
+                                        chunk_size=options['chunk_size'], progress=progress)
+            except StocktakeFormatError as exc:
+                raise CommandError(f"{path}: {exc}")
+
+        for error in stats['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if stats['unknown_skus']:
+            self.stderr.write(f"Unknown SKUs: {', '.join(stats['unknown_skus'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {stats['rows']} rows in {stats['seconds']:.1f}s ({stats['rows_per_second']:.0f} rows/s): "
+            f"{stats['adjusted']} adjusted, {stats['matched'] - stats['adjusted']} unchanged, "
+            f"{stats['unknown']} unknown SKUs, {stats['invalid']} invalid rows"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory.search import rebuild_product_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index."
+
+    def handle(self, *args, **options):
+        indexed = rebuild_product_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products"))
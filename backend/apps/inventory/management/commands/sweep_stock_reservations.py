@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.inventory.reservations import sweep_reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Reclaim lapsed stock reservations in batches and return their stock to sale. "
+        "Meant to run every minute or so; safe to interrupt and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.STOCK_RESERVATION_SWEEP_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None)
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between batches to leave room for live traffic.")
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            self.stdout.write(f"batch {stats['batches']}: {stats['holds']} holds")
+
+        stats = sweep_reservations(batch_size=options['batch_size'], max_batches=options['max_batches'],
+                                   pause=options['pause'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Reclaimed {stats['holds']} lapsed holds in {stats['seconds']:.1f}s"))
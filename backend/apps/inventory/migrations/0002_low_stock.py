@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('low', 'Low Stock'), ('restocked', 'Restocked')], max_length=20)),
+                ('stock_quantity', models.PositiveIntegerField()),
+                ('min_stock_level', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='low_stock',
+            field=models.GeneratedField(db_persist=True, expression=models.Q(('stock_quantity__lte', models.F('min_stock_level'))), output_field=models.BooleanField()),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('low_stock', True)), fields=['stock_quantity', 'id'], name='product_low_stock_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockalert',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='inventory.product'),
+        ),
+    ]
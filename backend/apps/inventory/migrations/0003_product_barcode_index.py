@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_low_stock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['barcode'], name='product_barcode_idx'),
+        ),
+    ]
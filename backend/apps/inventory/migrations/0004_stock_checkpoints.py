@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_product_barcode_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(db_index=True)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-taken_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_quantity', models.PositiveIntegerField()),
+                ('cost_price', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['created_at'], name='stock_movement_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='checkpoint',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.stockcheckpoint'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='inventory.product'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('checkpoint', 'product'), name='stock_snapshot_unique'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+PATH_STEP_WIDTH = 10
+
+
+def fill_paths(apps, schema_editor):
+    """Materialize the path and depth of every category, root first."""
+    Category = apps.get_model('inventory', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    children = {}
+    for pk, parent_id in parents.items():
+        children.setdefault(parent_id, []).append(pk)
+
+    paths = {}
+    # Categories caught in a parent cycle are unreachable from a root; they
+    # become roots themselves.
+    roots = children.get(None, []) + sorted(pk for pk in parents if parents[pk] is not None)
+    for root in roots:
+        if root in paths:
+            continue
+        if parents[root] is not None:
+            Category.objects.filter(pk=root).update(parent=None)
+        stack = [(root, '', 0)]
+        while stack:
+            pk, parent_path, depth = stack.pop()
+            if pk in paths:
+                continue
+            paths[pk] = (f"{parent_path}{pk:0{PATH_STEP_WIDTH}d}/", depth)
+            stack.extend((child, paths[pk][0], depth + 1) for child in children.get(pk, []))
+
+    categories = [Category(pk=pk, path=path, depth=depth) for pk, (path, depth) in paths.items()]
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_stock_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE inventory_product_search USING fts5("
+    "name, description, sku, barcode, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "INSERT INTO inventory_product_search (rowid, name, description, sku, barcode) "
+    "SELECT id, name, description, sku, COALESCE(barcode, '') FROM inventory_product",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE TABLE inventory_product_search ("
+    "product_id bigint PRIMARY KEY REFERENCES inventory_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX inventory_product_search_document_idx ON inventory_product_search USING GIN (document)",
+    "INSERT INTO inventory_product_search (product_id, document) "
+    "SELECT id, setweight(to_tsvector('simple', name), 'A')"
+    " || setweight(to_tsvector('simple', sku || ' ' || COALESCE(barcode, '')), 'A')"
+    " || setweight(to_tsvector('simple', description), 'C') FROM inventory_product",
+]
+
+
+def create_search_table(apps, schema_editor):
+    statements = {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS inventory_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_category_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:26
+
+import django.core.validators
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_product_search'),
+        ('orders', '0009_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='available_quantity',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('stock_quantity'), '-', models.F('reserved_quantity')), output_field=models.IntegerField()),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='orders.order')),
+                ('order_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservation', to='orders.orderitem')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='inventory.product')),
+            ],
+            options={
+                'ordering': ['expires_at'],
+                'indexes': [models.Index(fields=['expires_at'], name='stock_reservation_expiry_idx'), models.Index(fields=['product', 'expires_at'], name='stock_reservation_product_idx')],
+            },
+        ),
+    ]
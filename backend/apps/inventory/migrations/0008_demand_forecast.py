@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='daily_demand',
+            field=models.FloatField(default=0, editable=False, help_text='Forecast units sold per day'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='demand_std',
+            field=models.FloatField(default=0, editable=False, help_text='Standard deviation of daily demand'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='forecast_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='order_up_to_level',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reorder_point',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_demand_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='last_movement_id',
+            field=models.BigIntegerField(blank=True, help_text="Id of the product's last movement included in the snapshot (empty for older checkpoints)", null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_stock_snapshot_last_movement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryTreeVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -1,30 +1,121 @@
-from django.db import models
+import time
+
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.utils.text import slugify
 
 class Category(models.Model):
     """
     Categories for inventory products.
+    
+    The hierarchy is materialized in ``path``: the zero-padded ids of the
+    category's ancestors and itself, e.g. ``0000000001/0000000007/``. A
+    subtree is then a single range on the indexed path; see
+    ``apps.inventory.categories``.
     """
+    PATH_STEP_WIDTH = 10
+    
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True, related_name='children')
+    path = models.CharField(max_length=255, blank=True, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     
     def __str__(self):
         return self.name
     
+    def clean(self):
+        if self.pk and self.parent_id and self.path and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': "A category cannot be moved under itself or its sub-categories."})
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'parent' not in update_fields:
+            super().save(*args, **kwargs)
+            return
+        
+        with transaction.atomic():
+            old_path, old_depth = '', 0
+            if self.pk:
+                old_path, old_depth = Category.objects.filter(pk=self.pk).values_list('path', 'depth').first() or ('', 0)
+            parent_path, parent_depth = '', -1
+            if self.parent_id:
+                parent_path, parent_depth = Category.objects.filter(pk=self.parent_id).values_list('path', 'depth').get()
+            if old_path and parent_path.startswith(old_path):
+                raise ValueError("A category cannot be moved under itself or its sub-categories")
+            
+            super().save(*args, **kwargs)
+            new_path = f"{parent_path}{self.pk:0{self.PATH_STEP_WIDTH}d}/"
+            if new_path != old_path:
+                if old_path:
+                    Category.rebase_subtree(old_path, new_path, parent_depth + 1 - old_depth)
+                else:
+                    Category.objects.filter(pk=self.pk).update(path=new_path, depth=parent_depth + 1)
+            self.path, self.depth = new_path, parent_depth + 1
+    
+    @staticmethod
+    def path_range(path):
+        """Return the ``[low, high)`` range of paths in the subtree rooted at ``path``."""
+        return path, path[:-1] + chr(ord('/') + 1)
+    
+    @classmethod
+    def rebase_subtree(cls, old_path, new_path, depth_change):
+        """Move every path under ``old_path`` to ``new_path`` with one UPDATE."""
+        low, high = cls.path_range(old_path)
+        cls.objects.filter(path__gte=low, path__lt=high).update(
+            path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+            depth=F('depth') + depth_change,
+        )
+        CategoryTreeVersion.bump()
+    
+    @property
+    def ancestor_ids(self):
+        """Ids from the root down to this category's parent."""
+        return [int(step) for step in self.path.split('/') if step][:-1]
     
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['path'], name='category_path_idx'),
+        ]
+
+class CategoryTreeVersion(models.Model):
+    """
+    Version stamp of the category tree, part of the cache key of the
+    serialized tree; see ``apps.inventory.categories``. Kept in the database
+    so a change made by any process or command drops every process's copy.
+    A single row.
+    """
+    version = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"Category tree version {self.version}"
+    
+    @classmethod
+    def current(cls):
+        """The current stamp, creating it if missing."""
+        version = cls.objects.filter(pk=1).values_list('version', flat=True).first()
+        if version is None:
+            # Started from the clock, so a recreated stamp never repeats an old one.
+            cls.objects.bulk_create([cls(pk=1, version=time.time_ns())], ignore_conflicts=True)
+            version = cls.objects.filter(pk=1).values_list('version', flat=True).get()
+        return version
+    
+    @classmethod
+    def bump(cls):
+        """Invalidate the cached trees, in the transaction of the category change."""
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1):
+            cls.objects.bulk_create([cls(pk=1, version=time.time_ns())], ignore_conflicts=True)
 
 class Product(models.Model):
     """
@@ -44,6 +135,28 @@ class Product(models.Model):
     stock_quantity = models.PositiveIntegerField(default=0)
     min_stock_level = models.PositiveIntegerField(default=5)
     max_stock_level = models.PositiveIntegerField(default=100)
+    # Sum of the active StockReservation holds; see apps.inventory.reservations.
+    reserved_quantity = models.PositiveIntegerField(default=0, editable=False)
+    # Can go negative when a stock count lands below what is on hold.
+    available_quantity = models.GeneratedField(
+        expression=models.F('stock_quantity') - models.F('reserved_quantity'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+    # Computed by the database in the same statement as every stock change,
+    # including F() updates and bulk writes that bypass save().
+    low_stock = models.GeneratedField(
+        expression=models.Q(stock_quantity__lte=models.F('min_stock_level')),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
+    
+    # Written by the demand forecast; see apps.inventory.forecasting.
+    daily_demand = models.FloatField(default=0, editable=False, help_text="Forecast units sold per day")
+    demand_std = models.FloatField(default=0, editable=False, help_text="Standard deviation of daily demand")
+    reorder_point = models.PositiveIntegerField(default=0, editable=False)
+    order_up_to_level = models.PositiveIntegerField(default=0, editable=False)
+    forecast_at = models.DateTimeField(blank=True, null=True, editable=False)
     
     is_active = models.BooleanField(default=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
@@ -60,6 +173,14 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if not self._state.adding and not kwargs.get('force_insert'):
+            # reserved_quantity only changes through F() updates; writing back a
+            # copy loaded before a hold was placed would undo it.
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields
+                                 if not field.primary_key and not field.generated]
+            kwargs['update_fields'] = [name for name in update_fields if name != 'reserved_quantity']
         super().save(*args, **kwargs)
     
     @property
@@ -75,34 +196,31 @@ class Product(models.Model):
         return ((self.price - self.cost_price) / self.cost_price) * 100
     
     def update_stock(self, quantity, movement_type='adjustment', reason='', user=None):
-        """Update stock and create a stock movement record."""
-        old_quantity = self.stock_quantity
+        """
+        Update stock and create a stock movement record.
+        
+        Changes are applied as conditional UPDATEs by ``apps.inventory.stock``,
+        so concurrent sales of the last unit cannot both succeed.
+        """
+        from .stock import add_stock, remove_stock, set_stock
         
         if movement_type == 'in':
-            self.stock_quantity += quantity
+            self.stock_quantity = add_stock({self.pk: quantity}, reason=reason, user=user)[self.pk]
         elif movement_type == 'out':
-            if self.stock_quantity >= quantity:
-                self.stock_quantity -= quantity
-            else:
-                raise ValueError("Cannot remove more stock than available")
+            self.stock_quantity = remove_stock({self.pk: quantity}, reason=reason, user=user)[self.pk]
         else:  # adjustment
-            self.stock_quantity = quantity
-        
-        self.save(update_fields=['stock_quantity', 'updated_at'])
-        
-        # Create stock movement record
-        StockMovement.objects.create(
-            product=self,
-            movement_type=movement_type,
-            quantity=quantity if movement_type != 'adjustment' else self.stock_quantity - old_quantity,
-            reason=reason,
-            performed_by=user
-        )
+            self.stock_quantity = set_stock(self.pk, quantity, reason=reason, user=user)
         
         return self.stock_quantity
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['barcode'], name='product_barcode_idx'),
+            # Holds only low-stock rows, so listing them is a scan of a small index.
+            models.Index(fields=['stock_quantity', 'id'], condition=models.Q(low_stock=True),
+                         name='product_low_stock_idx'),
+        ]
 
 class StockMovement(models.Model):
     """
@@ -126,3 +244,88 @@ class StockMovement(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Serve "movements since a checkpoint", per product and for the whole
+            # catalog; see apps.inventory.history.
+            models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx'),
+            models.Index(fields=['created_at'], name='stock_movement_created_idx'),
+        ]
+
+class StockCheckpoint(models.Model):
+    """
+    A point in time at which the stock of every product was recorded.
+    """
+    taken_at = models.DateTimeField(db_index=True)
+    product_count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Stock checkpoint {self.taken_at:%Y-%m-%d %H:%M}"
+    
+    class Meta:
+        ordering = ['-taken_at']
+
+class StockSnapshot(models.Model):
+    """
+    Stock and unit cost of a product at a checkpoint.
+    """
+    checkpoint = models.ForeignKey(StockCheckpoint, on_delete=models.CASCADE, related_name='snapshots')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    stock_quantity = models.PositiveIntegerField()
+    cost_price = models.DecimalField(max_digits=10, decimal_places=2)
+    last_movement_id = models.BigIntegerField(
+        null=True, blank=True,
+        help_text="Id of the product's last movement included in the snapshot (empty for older checkpoints)"
+    )
+    
+    def __str__(self):
+        return f"{self.product_id} @ {self.checkpoint_id}: {self.stock_quantity}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['checkpoint', 'product'], name='stock_snapshot_unique'),
+        ]
+
+class StockAlert(models.Model):
+    """
+    Feed of products crossing their minimum stock level. Consumers page
+    through it by ``id``; see ``apps.inventory.alerts``.
+    """
+    KIND_CHOICES = (
+        ('low', 'Low Stock'),
+        ('restocked', 'Restocked'),
+    )
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_alerts')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    stock_quantity = models.PositiveIntegerField()
+    min_stock_level = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.product.name} ({self.stock_quantity})"
+    
+    class Meta:
+        ordering = ['id']
+
+class StockReservation(models.Model):
+    """
+    An expiring hold on stock for one line of an unpaid order. Held
+    quantities are also summed into ``Product.reserved_quantity``; see
+    ``apps.inventory.reservations``.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey('orders.Order', on_delete=models.CASCADE, related_name='stock_reservations')
+    order_item = models.OneToOneField('orders.OrderItem', on_delete=models.CASCADE, related_name='stock_reservation')
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order {self.order_id}"
+    
+    class Meta:
+        ordering = ['expires_at']
+        indexes = [
+            models.Index(fields=['expires_at'], name='stock_reservation_expiry_idx'),
+            models.Index(fields=['product', 'expires_at'], name='stock_reservation_product_idx'),
+        ]
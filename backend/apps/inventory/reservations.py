@@ -0,0 +1,295 @@
+"""
+Expiring stock holds for unpaid orders.
+
+``reserve_order`` places one ``StockReservation`` per inventory line of an
+order and adds the held quantities to ``Product.reserved_quantity`` with a
+single conditional ``UPDATE ... WHERE available_quantity >= n``, in the same
+way ``apps.inventory.stock`` sells stock: two checkouts racing for the last
+unit cannot both get it. ``Product.available_quantity`` (stock minus holds)
+is a stored generated column, so available-to-sell is read straight off the
+product row, and register sales through ``remove_stock`` only take unheld
+stock.
+
+``commit_order`` turns the holds into sales and ``release_order`` gives the
+stock back. Holds are taken with ``DELETE ... RETURNING``, so a hold is
+settled exactly once even when a commit, a release and the sweeper race for
+it. Lapsed holds are reclaimed in batches by ``sweep_reservations`` (the
+``sweep_stock_reservations`` command), and by a checkout that finds its
+products short. Each operation costs a fixed number of statements per order,
+whatever the number of holds outstanding.
+
+Cancelling an order, through the transition engine or ``Order.save()``,
+releases its holds; completing it commits them. Deleting an order or an
+order line releases its holds, and archiving releases whatever holds a batch
+of closed orders still has in one statement.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.orders.archive import is_archiving
+from apps.orders.models import Order, OrderItem
+from apps.orders.signals import order_status_changed, orders_archived
+
+from .models import Product, StockReservation
+from .stock import LOOKUP_BATCH_SIZE, InsufficientStock, _new_levels, _quantity_case, _record, remove_stock
+
+logger = logging.getLogger(__name__)
+
+# Order lines whose product_id refers to an inventory Product.
+INVENTORY_PRODUCT_TYPE = 'inventory'
+
+
+class _Short(Exception):
+    """Rolls back a reservation attempt that did not cover every product."""
+
+
+def _order_lines(order_id, unheld_only=False):
+    lines = OrderItem.objects.filter(order_id=order_id, product_type=INVENTORY_PRODUCT_TYPE)
+    if unheld_only:
+        lines = lines.filter(stock_reservation__isnull=True)
+    return list(lines.values_list('pk', 'product_id', 'quantity'))
+
+
+def _available(product_ids):
+    return dict(Product.objects.filter(pk__in=list(product_ids)).values_list('pk', 'available_quantity'))
+
+
+def _take_holds(condition, params):
+    """Delete the holds matching ``condition`` and return the quantities per product."""
+    table = connection.ops.quote_name(StockReservation._meta.db_table)
+    totals = Counter()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {condition} RETURNING product_id, quantity", params)
+        for product_id, quantity in cursor.fetchall():
+            totals[product_id] += quantity
+    return totals
+
+
+def _unreserve(totals):
+    if totals:
+        Product.objects.filter(pk__in=list(totals)).update(
+            reserved_quantity=F('reserved_quantity') - _quantity_case(totals)
+        )
+
+
+def reserve_order(order_id, ttl=None):
+    """
+    Hold stock for the inventory lines of an order for ``ttl`` seconds.
+
+    Lines already held have their holds extended; the others are held all
+    or nothing. If a product is short, lapsed holds on it are reclaimed and
+    the reservation is tried once more before ``InsufficientStock`` is
+    raised. Returns the new expiry time.
+    """
+    if ttl is None:
+        ttl = settings.STOCK_RESERVATION_TTL
+    expires_at = timezone.now() + timezone.timedelta(seconds=ttl)
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                StockReservation.objects.filter(order_id=order_id).update(expires_at=expires_at)
+                lines = _order_lines(order_id, unheld_only=True)
+                totals = Counter()
+                for _, product_id, quantity in lines:
+                    totals[product_id] += quantity
+                if not totals:
+                    return expires_at
+                if len(totals) > LOOKUP_BATCH_SIZE:
+                    raise ValueError(f"Cannot reserve more than {LOOKUP_BATCH_SIZE} products at once")
+
+                requested = _quantity_case(totals)
+                updated = Product.objects.filter(pk__in=list(totals), available_quantity__gte=requested).update(
+                    reserved_quantity=F('reserved_quantity') + requested
+                )
+                if updated != len(totals):
+                    raise _Short()
+                StockReservation.objects.bulk_create([
+                    StockReservation(product_id=product_id, order_id=order_id, order_item_id=item_id,
+                                     quantity=quantity, expires_at=expires_at)
+                    for item_id, product_id, quantity in lines
+                ], batch_size=LOOKUP_BATCH_SIZE)
+                return expires_at
+        except _Short:
+            if attempt == 0 and sweep_expired(product_ids=list(totals)):
+                continue
+            available = _available(totals)
+            raise InsufficientStock({
+                product_id: (quantity, available.get(product_id, 0))
+                for product_id, quantity in totals.items()
+                if available.get(product_id, 0) < quantity
+            }) from None
+
+
+def commit_order(order_id, reason='', user=None):
+    """
+    Sell the stock held for an order, all or nothing.
+
+    Held quantities leave stock and holds in one ``UPDATE``. Lines whose hold
+    has lapsed are sold from available stock, raising ``InsufficientStock``
+    (and changing nothing) if it has run out. Returns the units sold.
+    """
+    with transaction.atomic():
+        held = _take_holds('order_id = %s', [order_id])
+        if held:
+            quantities = _quantity_case(held)
+            updated = Product.objects.filter(pk__in=list(held), stock_quantity__gte=quantities).update(
+                stock_quantity=F('stock_quantity') - quantities,
+                reserved_quantity=F('reserved_quantity') - quantities,
+                updated_at=timezone.now(),
+            )
+            if updated != len(held):
+                # A stock count went below what was held.
+                stock = dict(Product.objects.filter(pk__in=list(held)).values_list('pk', 'stock_quantity'))
+                raise InsufficientStock({
+                    product_id: (quantity, stock.get(product_id, 0))
+                    for product_id, quantity in held.items()
+                    if stock.get(product_id, 0) < quantity
+                })
+            _record(held, 'out', reason, user)
+            _new_levels(held, -1)
+
+        unheld = Counter()
+        for _, product_id, quantity in _order_lines(order_id):
+            unheld[product_id] += quantity
+        unheld.subtract(held)
+        unheld = +unheld
+        if unheld:
+            remove_stock(unheld, reason=reason, user=user)
+    return sum(held.values()) + sum(unheld.values())
+
+
+def release_order(order_id):
+    """Give back the stock held for an order. Returns the units released."""
+    with transaction.atomic():
+        held = _take_holds('order_id = %s', [order_id])
+        _unreserve(held)
+    return sum(held.values())
+
+
+def sweep_expired(now=None, batch_size=None, product_ids=None):
+    """
+    Reclaim one batch of lapsed holds, oldest first, optionally only on
+    ``product_ids``. Returns the number of holds removed.
+    """
+    if now is None:
+        now = timezone.now()
+    if batch_size is None:
+        batch_size = settings.STOCK_RESERVATION_SWEEP_BATCH_SIZE
+    table = connection.ops.quote_name(StockReservation._meta.db_table)
+    condition = 'expires_at <= %s'
+    params = [now]
+    if product_ids is not None:
+        product_ids = list(product_ids)[:LOOKUP_BATCH_SIZE]
+        condition += f" AND product_id IN ({', '.join(['%s'] * len(product_ids))})"
+        params += product_ids
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id IN ("
+                f"SELECT id FROM {table} WHERE {condition} ORDER BY expires_at LIMIT %s"
+                f") RETURNING product_id, quantity",
+                params + [batch_size],
+            )
+            rows = cursor.fetchall()
+        totals = Counter()
+        for product_id, quantity in rows:
+            totals[product_id] += quantity
+        _unreserve(totals)
+    return len(rows)
+
+
+def sweep_reservations(batch_size=None, max_batches=None, pause=0, progress=None):
+    """
+    Reclaim all lapsed holds in batches, each in its own short transaction.
+
+    ``pause`` seconds are slept between batches; ``progress`` is called with
+    the running stats after each batch. Returns the stats: batches, holds
+    and seconds.
+    """
+    if batch_size is None:
+        batch_size = settings.STOCK_RESERVATION_SWEEP_BATCH_SIZE
+    now = timezone.now()
+    stats = {'batches': 0, 'holds': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+    while max_batches is None or stats['batches'] < max_batches:
+        removed = sweep_expired(now, batch_size)
+        if not removed:
+            break
+        stats['batches'] += 1
+        stats['holds'] += removed
+        stats['seconds'] = time.perf_counter() - started
+        if progress:
+            progress(stats)
+        if removed < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return stats
+
+
+def _settle(order_id, to_status):
+    """Release the holds of an order that was cancelled, or sell those of one that was completed."""
+    if to_status == 'cancelled':
+        release_order(order_id)
+    elif to_status == 'completed' and StockReservation.objects.filter(order_id=order_id).exists():
+        try:
+            commit_order(order_id, reason=f'Order {order_id} completed')
+        except InsufficientStock as exc:
+            logger.warning("Stock for completed order %s could not be committed: %s",
+                           order_id, exc.shortages)
+
+
+@receiver(order_status_changed, sender=Order)
+def settle_reservations(sender, transitions, **kwargs):
+    for order_id, _, to_status in transitions:
+        _settle(order_id, to_status)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Read the stored status of an order about to be saved, to settle its holds if it changes."""
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    instance._reservation_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def settle_saved_order(sender, instance, created, raw=False, **kwargs):
+    old = instance.__dict__.pop('_reservation_status', None)
+    if raw or created or old is None or old == instance.status:
+        return
+    # Settled once the save is committed, as the transition engine does.
+    order_id, to_status = instance.pk, instance.status
+    transaction.on_commit(lambda: _settle(order_id, to_status))
+
+
+@receiver(pre_delete, sender=Order)
+def release_deleted_order(sender, instance, **kwargs):
+    if not is_archiving():
+        release_order(instance.pk)
+
+
+@receiver(pre_delete, sender=OrderItem)
+def release_deleted_item(sender, instance, **kwargs):
+    if not is_archiving():
+        with transaction.atomic():
+            _unreserve(_take_holds('order_item_id = %s', [instance.pk]))
+
+
+@receiver(orders_archived, sender=Order)
+def release_archived_orders(sender, order_ids, **kwargs):
+    for start in range(0, len(order_ids), LOOKUP_BATCH_SIZE):
+        batch = order_ids[start:start + LOOKUP_BATCH_SIZE]
+        _unreserve(_take_holds(f"order_id IN ({', '.join(['%s'] * len(batch))})", batch))
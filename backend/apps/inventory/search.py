@@ -0,0 +1,246 @@
+"""
+Full-text catalog search over product names, descriptions, SKUs and barcodes.
+
+Products are indexed in ``inventory_product_search``: an FTS5 table on
+SQLite and a ``tsvector`` table with a GIN index on PostgreSQL, created by
+migration ``0006_product_search``. Rows are rebuilt from the product table
+with ``INSERT ... SELECT`` by ``post_save``/``post_delete`` receivers, so the
+index follows every edit; bulk inserts that bypass ``save()`` call
+``index_products`` (or ``rebuild_product_search_index``) themselves.
+
+A search runs as one statement: the matching active products are
+collected once in a materialized CTE, and the requested page (ranked by
+BM25 on SQLite, ``ts_rank`` on PostgreSQL), the category counts and the
+price-range counts are all read from it. Every word of the query
+prefix-matches, so the endpoint also works as a typeahead.
+"""
+import re
+
+from django.core.files.storage import default_storage
+from django.db import NotSupportedError, connection
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.images.derivatives import variant_urls
+
+from .models import Category, Product
+
+SEARCH_TABLE = 'inventory_product_search'
+SEARCH_VENDORS = ('sqlite', 'postgresql')
+SEARCHABLE_FIELDS = {'name', 'description', 'sku', 'barcode'}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_TERMS = 8
+# Lower bounds of the price facet buckets; the last bucket is open-ended.
+PRICE_RANGES = (0, 10, 25, 50, 100, 250)
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+INDEX_BATCH_SIZE = 500
+
+_split = re.compile(r'[^0-9a-z]+')
+
+# Column weights: name, description, sku, barcode.
+_SQLITE_RANK = f"-bm25({SEARCH_TABLE}, 10.0, 1.0, 10.0, 10.0)"
+_POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', p.name), 'A')"
+    " || setweight(to_tsvector('simple', p.sku || ' ' || COALESCE(p.barcode, '')), 'A')"
+    " || setweight(to_tsvector('simple', p.description), 'C')"
+)
+
+
+def normalize(query):
+    """Lowercase ``query`` and split it into alphanumeric search terms."""
+    return [term for term in _split.split((query or '').lower()) if term][:MAX_TERMS]
+
+
+def _vendor():
+    if connection.vendor not in SEARCH_VENDORS:
+        raise NotSupportedError(f"Product search is not available on {connection.vendor}")
+    return connection.vendor
+
+
+def _match_expression(terms):
+    """Return the backend's query string for ``terms``, all prefix-matched."""
+    if _vendor() == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def index_products(product_ids):
+    """(Re)build the search rows of ``product_ids``; missing products are dropped."""
+    if connection.vendor not in SEARCH_VENDORS:
+        return
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), INDEX_BATCH_SIZE):
+            batch = product_ids[start:start + INDEX_BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", batch)
+                cursor.execute(
+                    f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, sku, barcode) "
+                    f"SELECT p.id, p.name, p.description, p.sku, COALESCE(p.barcode, '') "
+                    f"FROM inventory_product p WHERE p.id IN ({placeholders})",
+                    batch,
+                )
+            else:
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE product_id IN ({placeholders})", batch)
+                cursor.execute(
+                    f"INSERT INTO {SEARCH_TABLE} (product_id, document) "
+                    f"SELECT p.id, {_POSTGRES_DOCUMENT} FROM inventory_product p WHERE p.id IN ({placeholders})",
+                    batch,
+                )
+
+
+def rebuild_product_search_index():
+    """Rebuild the whole search index from the product table. Returns the rows indexed."""
+    vendor = _vendor()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        if vendor == 'sqlite':
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, sku, barcode) "
+                f"SELECT p.id, p.name, p.description, p.sku, COALESCE(p.barcode, '') FROM inventory_product p"
+            )
+        else:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, document) "
+                f"SELECT p.id, {_POSTGRES_DOCUMENT} FROM inventory_product p"
+            )
+        return cursor.rowcount
+
+
+def matching_product_ids(query):
+    """
+    Return a subquery of the ids of products matching ``query``, for
+    ``filter(pk__in=...)``, or None when the query has no search terms.
+    """
+    terms = normalize(query)
+    if not terms:
+        return None
+    if _vendor() == 'sqlite':
+        sql = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+    else:
+        sql = f"SELECT product_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)"
+    return RawSQL(sql, [_match_expression(terms)])
+
+
+def _matches_sql(terms, category=None, min_price=None, max_price=None):
+    """Return the SQL and params selecting ``(id, rank, category_id, price)`` of matches."""
+    match = _match_expression(terms)
+    if connection.vendor == 'sqlite':
+        sql = (
+            f"SELECT p.id, {_SQLITE_RANK} AS rank, p.category_id, p.price "
+            f"FROM {SEARCH_TABLE} s JOIN inventory_product p ON p.id = s.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND p.is_active"
+        )
+        params = [match]
+    else:
+        sql = (
+            "SELECT p.id, ts_rank(s.document, to_tsquery('simple', %s)) AS rank, p.category_id, p.price "
+            f"FROM {SEARCH_TABLE} s JOIN inventory_product p ON p.id = s.product_id "
+            "WHERE s.document @@ to_tsquery('simple', %s) AND p.is_active"
+        )
+        params = [match, match]
+
+    if category is not None:
+        # The whole subtree of the category; see Category.path.
+        low, high = Category.path_range(category.path)
+        sql += " AND p.category_id IN (SELECT id FROM inventory_category WHERE path >= %s AND path < %s)"
+        params += [low, high]
+    if min_price is not None:
+        sql += " AND p.price >= %s"
+        params.append(str(min_price))
+    if max_price is not None:
+        sql += " AND p.price <= %s"
+        params.append(str(max_price))
+    return sql, params
+
+
+def _price_bucket_sql():
+    whens = ' '.join(
+        f"WHEN price < {upper} THEN {index}" for index, upper in enumerate(PRICE_RANGES[1:])
+    )
+    return f"CASE {whens} ELSE {len(PRICE_RANGES) - 1} END"
+
+
+def search_products(query, category=None, min_price=None, max_price=None, limit=DEFAULT_LIMIT, offset=0):
+    """
+    Search active products.
+
+    ``category`` (a Category) restricts matches to its subtree. Returns the
+    total match count, one page of results (best first, with their rank and
+    image variant URLs) and the category and price-range facet counts over
+    all matches.
+    """
+    terms = normalize(query)
+    result = {'count': 0, 'results': [], 'facets': {'category': [], 'price': []}}
+    if not terms:
+        return result
+    limit = max(1, min(limit, MAX_LIMIT))
+    offset = max(0, offset)
+
+    matches, params = _matches_sql(terms, category, min_price, max_price)
+    sql = (
+        f"WITH matches AS MATERIALIZED ({matches}) "
+        "SELECT 'hit', id, CAST(rank AS DOUBLE PRECISION) FROM ("
+        "  SELECT id, rank FROM matches ORDER BY rank DESC, id LIMIT %s OFFSET %s"
+        ") AS hits "
+        "UNION ALL "
+        "SELECT 'category', category_id, CAST(COUNT(*) AS DOUBLE PRECISION) FROM matches GROUP BY category_id "
+        "UNION ALL "
+        "SELECT 'price', bucket, CAST(COUNT(*) AS DOUBLE PRECISION) FROM ("
+        f"  SELECT {_price_bucket_sql()} AS bucket FROM matches"
+        ") AS priced GROUP BY bucket"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit, offset])
+        rows = cursor.fetchall()
+
+    ranks = {}
+    category_counts = {}
+    for kind, key, value in rows:
+        if kind == 'hit':
+            ranks[key] = value
+        elif kind == 'category':
+            category_counts[key] = int(value)
+        else:
+            upper = PRICE_RANGES[key + 1] if key + 1 < len(PRICE_RANGES) else None
+            result['facets']['price'].append({'min': PRICE_RANGES[key], 'max': upper, 'count': int(value)})
+    result['count'] = sum(category_counts.values())
+    result['facets']['price'].sort(key=lambda bucket: bucket['min'])
+
+    names = dict(Category.objects.filter(pk__in=[pk for pk in category_counts if pk]).values_list('pk', 'name'))
+    result['facets']['category'] = sorted(
+        ({'id': pk, 'name': names.get(pk), 'count': count} for pk, count in category_counts.items()),
+        key=lambda facet: (-facet['count'], facet['name'] or ''),
+    )
+
+    products = Product.objects.filter(pk__in=list(ranks)).values(
+        'id', 'name', 'slug', 'sku', 'barcode', 'price', 'stock_quantity', 'available_quantity', 'category_id',
+        'image',
+    )
+    by_id = {product['id']: product for product in products}
+    variants = variant_urls(product['image'] for product in by_id.values())
+    for product in by_id.values():
+        name = product['image']
+        product['image'] = default_storage.url(name) if name else None
+        product['image_variants'] = variants.get(name, {})
+    result['results'] = [
+        {**by_id[pk], 'rank': rank}
+        for pk, rank in sorted(ranks.items(), key=lambda item: (-item[1], item[0])) if pk in by_id
+    ]
+    return result
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, update_fields=None, **kwargs):
+    """Reindex a product when a searchable field may have changed."""
+    if update_fields is None or SEARCHABLE_FIELDS & set(update_fields):
+        index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    index_products([instance.pk])
@@ -0,0 +1,102 @@
+from rest_framework import serializers
+
+from apps.images.fields import ImageVariantsField
+
+from .lookup import MAX_CODES
+from .models import Category, Product, StockAlert
+from .search import DEFAULT_LIMIT as SEARCH_DEFAULT_LIMIT, MAX_LIMIT as SEARCH_MAX_LIMIT
+from .stocktake import STOCKTAKE_FORMATS
+
+
+class StockTakeUploadSerializer(serializers.Serializer):
+    """Serializer for uploading a stock-take file."""
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(choices=STOCKTAKE_FORMATS, required=False)
+    reason = serializers.CharField(max_length=255, required=False, default='Stock-take')
+
+
+class LowStockProductSerializer(serializers.ModelSerializer):
+    """Serializer for products at or below their minimum stock level."""
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'sku', 'stock_quantity', 'available_quantity', 'min_stock_level', 'max_stock_level')
+        read_only_fields = fields
+
+
+class StockAlertSerializer(serializers.ModelSerializer):
+    """Serializer for stock alert feed entries."""
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    sku = serializers.CharField(source='product.sku', read_only=True)
+
+    class Meta:
+        model = StockAlert
+        fields = ('id', 'product', 'product_name', 'sku', 'kind', 'stock_quantity', 'min_stock_level', 'created_at')
+        read_only_fields = fields
+
+
+class ProductLookupSerializer(serializers.Serializer):
+    """Serializer for products resolved from a scanned code."""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    sku = serializers.CharField()
+    barcode = serializers.CharField(allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    is_active = serializers.BooleanField()
+    category_id = serializers.IntegerField(allow_null=True)
+
+
+class ProductLookupRequestSerializer(serializers.Serializer):
+    """Serializer for resolving many scanned codes at once."""
+    codes = serializers.ListField(
+        child=serializers.CharField(max_length=50), allow_empty=False, max_length=MAX_CODES
+    )
+
+
+class CategoryBreadcrumbSerializer(serializers.ModelSerializer):
+    """Serializer for a category in a breadcrumb trail."""
+
+    class Meta:
+        model = Category
+        fields = ('id', 'name', 'slug')
+        read_only_fields = fields
+
+
+class CategoryProductSerializer(serializers.ModelSerializer):
+    """Serializer for products listed under a category."""
+    image_variants = ImageVariantsField(source='image')
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'slug', 'sku', 'price', 'stock_quantity', 'available_quantity', 'category',
+                  'image', 'image_variants')
+        read_only_fields = fields
+
+
+class ProductSearchParamsSerializer(serializers.Serializer):
+    """Serializer for catalog search query parameters."""
+    q = serializers.CharField(max_length=200)
+    category = serializers.SlugField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=SEARCH_MAX_LIMIT, default=SEARCH_DEFAULT_LIMIT)
+    offset = serializers.IntegerField(min_value=0, default=0)
+
+
+class StockReservationRequestSerializer(serializers.Serializer):
+    """Serializer for holding stock for an order."""
+    order = serializers.IntegerField()
+    ttl = serializers.IntegerField(min_value=60, max_value=24 * 60 * 60, required=False,
+                                   help_text="Seconds before the hold lapses")
+
+
+class SuggestedPurchaseLineSerializer(serializers.ModelSerializer):
+    """Serializer for a line of the suggested purchase order."""
+    order_quantity = serializers.IntegerField(read_only=True)
+    order_cost = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'sku', 'available_quantity', 'daily_demand', 'demand_std', 'reorder_point',
+                  'order_up_to_level', 'order_quantity', 'cost_price', 'order_cost', 'forecast_at')
+        read_only_fields = fields
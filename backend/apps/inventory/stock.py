@@ -0,0 +1,171 @@
+"""
+Stock mutations as conditional UPDATEs.
+
+Stock is never read into Python and written back. A sale is
+``UPDATE ... SET stock_quantity = stock_quantity - n WHERE available_quantity >= n``:
+the database applies it atomically against the current row, so two terminals
+selling the last unit cannot both succeed, no row needs to be locked ahead
+of time, and stock held for unpaid orders (see
+``apps.inventory.reservations``) is never sold. A whole basket is one ``UPDATE`` with ``CASE`` expressions
+that either matches every product or is rolled back. Every change is
+recorded with a bulk insert of ``StockMovement`` rows in the same
+transaction, together with any low-stock alerts (see ``apps.inventory.alerts``).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .alerts import record_crossings
+from .models import Product, StockMovement
+
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+LOOKUP_BATCH_SIZE = 500
+# Attempts made by set_stock before giving up on a contended product.
+ADJUSTMENT_RETRIES = 5
+
+
+class InsufficientStock(ValueError):
+    """
+    Raised when a removal would take stock below zero. ``shortages`` maps
+    product ids to the quantity requested and the quantity available.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__("Cannot remove more stock than available")
+
+
+def _per_product(quantities):
+    """Merge ``(product_id, quantity)`` pairs or a mapping into one quantity per product."""
+    totals = Counter()
+    pairs = quantities.items() if isinstance(quantities, dict) else quantities
+    for product_id, quantity in pairs:
+        if quantity <= 0:
+            raise ValueError("Quantities must be positive")
+        totals[product_id] += quantity
+    return totals
+
+
+def _quantity_case(totals):
+    return Case(*[When(pk=product_id, then=Value(quantity)) for product_id, quantity in totals.items()])
+
+
+def _available_stock(product_ids):
+    product_ids = list(product_ids)
+    stock = {}
+    for start in range(0, len(product_ids), LOOKUP_BATCH_SIZE):
+        stock.update(
+            Product.objects.filter(pk__in=product_ids[start:start + LOOKUP_BATCH_SIZE])
+            .values_list('pk', 'available_quantity')
+        )
+    return stock
+
+
+def _new_levels(totals, sign):
+    """
+    Read the stock levels just written, record any low-stock crossings and
+    return the new stock per product.
+    """
+    levels = Product.objects.filter(pk__in=list(totals)).values_list('pk', 'stock_quantity', 'min_stock_level')
+    stock = {}
+    changes = []
+    for product_id, quantity, min_stock_level in levels:
+        stock[product_id] = quantity
+        changes.append((product_id, quantity - sign * totals[product_id], quantity, min_stock_level))
+    record_crossings(changes)
+    return stock
+
+
+def _record(totals, movement_type, reason, user):
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, movement_type=movement_type, quantity=quantity,
+                      reason=reason, performed_by=user)
+        for product_id, quantity in totals.items()
+    ], batch_size=LOOKUP_BATCH_SIZE)
+
+
+def remove_stock(quantities, reason='', user=None):
+    """
+    Remove stock for a basket, all or nothing.
+
+    ``quantities`` is a mapping or iterable of ``(product_id, quantity)``;
+    repeated products are summed. All products are decremented by a single
+    conditional ``UPDATE`` on the stock not held by reservations. If any
+    product is short (or missing) nothing is changed and ``InsufficientStock``
+    is raised. Returns the new stock per
+    product.
+    """
+    totals = _per_product(quantities)
+    if not totals:
+        return {}
+    if len(totals) > LOOKUP_BATCH_SIZE:
+        raise ValueError(f"Cannot remove more than {LOOKUP_BATCH_SIZE} products at once")
+
+    try:
+        with transaction.atomic():
+            requested = _quantity_case(totals)
+            updated = Product.objects.filter(pk__in=list(totals), available_quantity__gte=requested).update(
+                stock_quantity=F('stock_quantity') - requested, updated_at=timezone.now()
+            )
+            if updated != len(totals):
+                # Undoes the products that did have enough.
+                raise InsufficientStock({})
+            _record(totals, 'out', reason, user)
+            return _new_levels(totals, -1)
+    except InsufficientStock:
+        available = _available_stock(totals)
+        raise InsufficientStock({
+            product_id: (quantity, available.get(product_id, 0))
+            for product_id, quantity in totals.items()
+            if available.get(product_id, 0) < quantity
+        }) from None
+
+
+def add_stock(quantities, reason='', user=None):
+    """
+    Add stock for one or more products with a single ``UPDATE``. Returns the
+    new stock per product.
+    """
+    totals = _per_product(quantities)
+    if not totals:
+        return {}
+    if len(totals) > LOOKUP_BATCH_SIZE:
+        raise ValueError(f"Cannot add more than {LOOKUP_BATCH_SIZE} products at once")
+
+    with transaction.atomic():
+        updated = Product.objects.filter(pk__in=list(totals)).update(
+            stock_quantity=F('stock_quantity') + _quantity_case(totals), updated_at=timezone.now()
+        )
+        if updated != len(totals):
+            raise Product.DoesNotExist("Cannot add stock to unknown products")
+        _record(totals, 'in', reason, user)
+        return _new_levels(totals, 1)
+
+
+def set_stock(product_id, quantity, reason='', user=None):
+    """
+    Set the stock of a product to ``quantity`` and record the difference as
+    an adjustment.
+
+    The movement needs the previous level, so the update is made conditional
+    on the level just read and retried if a sale got in between.
+    """
+    if quantity < 0:
+        raise ValueError("Stock cannot be negative")
+    for _ in range(ADJUSTMENT_RETRIES):
+        level = Product.objects.filter(pk=product_id).values_list('stock_quantity', 'min_stock_level').first()
+        if level is None:
+            raise Product.DoesNotExist(f"Product {product_id} does not exist")
+        current, min_stock_level = level
+        with transaction.atomic():
+            updated = Product.objects.filter(pk=product_id, stock_quantity=current).update(
+                stock_quantity=quantity, updated_at=timezone.now()
+            )
+            if updated:
+                StockMovement.objects.create(product_id=product_id, movement_type='adjustment',
+                                             quantity=quantity - current, reason=reason, performed_by=user)
+                record_crossings([(product_id, current, quantity, min_stock_level)])
+                return quantity
+    raise RuntimeError(f"Stock of product {product_id} kept changing; adjustment not applied")
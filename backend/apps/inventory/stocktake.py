@@ -0,0 +1,207 @@
+"""
+Streaming stock-take import.
+
+A stock-take file lists ``sku, counted_quantity`` pairs as CSV (with a
+header row naming both columns) or NDJSON. Rows are read one at a time and applied in chunks:
+each chunk resolves its SKUs with one ``sku IN (...)`` query against the
+unique index, sets the counted quantities with one ``UPDATE`` per distinct
+count and records the differences with a ``bulk_create`` of adjustment
+movements. Only one
+chunk is held in memory, so files of any size import in flat memory.
+"""
+import codecs
+import csv
+import json
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .alerts import record_crossings
+from .models import Product, StockMovement
+
+DEFAULT_CHUNK_SIZE = 500
+# Unknown SKUs and invalid rows beyond this many are counted but not listed.
+MAX_REPORTED = 100
+
+STOCKTAKE_FORMATS = ('csv', 'ndjson')
+STOCKTAKE_ENCODING = 'utf-8-sig'
+STOCKTAKE_COLUMNS = ('sku', 'counted_quantity')
+
+
+class StocktakeFormatError(ValueError):
+    """The file as a whole cannot be read as a stock-take (a CSV header without the needed columns)."""
+
+
+def detect_format(filename, default='csv'):
+    """Guess the stock-take format from a file name."""
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def check_encoding(binary_file, encoding=STOCKTAKE_ENCODING, block_size=64 * 1024):
+    """
+    Raise ``UnicodeDecodeError`` if ``binary_file`` is not valid ``encoding``
+    text, then rewind it. Decoding is checked up front because chunks are
+    applied as they are read: a bad byte halfway through must not leave the
+    first half imported.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    offset = 0
+    try:
+        while True:
+            block = binary_file.read(block_size)
+            try:
+                decoder.decode(block, final=not block)
+            except UnicodeDecodeError as exc:
+                exc.start += offset
+                exc.end += offset
+                raise
+            if not block:
+                break
+            offset += len(block)
+    finally:
+        binary_file.seek(0)
+
+
+def _parse_row(sku, quantity):
+    """Return the cleaned ``(sku, counted_quantity)``; ``ValueError`` messages are shown to the user."""
+    sku = '' if sku is None else str(sku).strip()
+    if not sku:
+        raise ValueError("sku is required")
+    text = '' if quantity is None else str(quantity).strip()
+    if not text:
+        raise ValueError("counted_quantity is required")
+    if not (text.isascii() and text.isdigit()):
+        raise ValueError("counted_quantity must be a non-negative integer")
+    return sku, int(text)
+
+
+def iter_counts(lines, file_format='csv'):
+    """
+    Yield ``(line_number, sku, counted_quantity, error)`` for every data row
+    of a text stream. Rows that cannot be parsed have ``error`` set.
+
+    A CSV header that does not name both ``STOCKTAKE_COLUMNS`` raises
+    ``StocktakeFormatError`` before any row is yielded: without it the
+    first data row would be taken for the header and every row rejected.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        header = [name.strip().lower() for name in reader.fieldnames or []]
+        missing = [column for column in STOCKTAKE_COLUMNS if column not in header]
+        if missing:
+            raise StocktakeFormatError(
+                f"The first line must be a header naming the {' and '.join(STOCKTAKE_COLUMNS)} columns "
+                f"(missing: {', '.join(missing)})."
+            )
+        reader.fieldnames = header
+        for row in reader:
+            try:
+                sku, counted = _parse_row(row.get('sku'), row.get('counted_quantity'))
+            except ValueError as exc:
+                yield reader.line_num, None, None, str(exc)
+            else:
+                yield reader.line_num, sku, counted, None
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("each line must be a JSON object with sku and counted_quantity")
+                sku, counted = _parse_row(row.get('sku'), row.get('counted_quantity'))
+            except json.JSONDecodeError:
+                yield line_number, None, None, "not valid JSON"
+            except ValueError as exc:
+                yield line_number, None, None, str(exc)
+            else:
+                yield line_number, sku, counted, None
+
+
+def _apply_chunk(counts, reason, user, stats):
+    """Apply ``{sku: counted_quantity}`` and update ``stats`` in place."""
+    now = timezone.now()
+    with transaction.atomic():
+        products = (
+            Product.objects.select_for_update().filter(sku__in=list(counts))
+            .only('pk', 'sku', 'stock_quantity', 'min_stock_level')
+        )
+        # Products are grouped by counted quantity: one UPDATE per distinct
+        # count is far cheaper than building bulk_update's per-row CASE.
+        by_count = defaultdict(list)
+        movements = []
+        changes = []
+        for product in products:
+            counted = counts.pop(product.sku)
+            stats['matched'] += 1
+            delta = counted - product.stock_quantity
+            if not delta:
+                continue
+            by_count[counted].append(product.pk)
+            changes.append((product.pk, product.stock_quantity, counted, product.min_stock_level))
+            movements.append(StockMovement(product_id=product.pk, movement_type='adjustment', quantity=delta,
+                                           reason=reason, performed_by=user))
+        for counted, product_ids in by_count.items():
+            Product.objects.filter(pk__in=product_ids).update(stock_quantity=counted, updated_at=now)
+        StockMovement.objects.bulk_create(movements)
+        record_crossings(changes)
+    stats['adjusted'] += len(movements)
+
+    # Whatever was not popped has no matching product.
+    stats['unknown'] += len(counts)
+    room = MAX_REPORTED - len(stats['unknown_skus'])
+    stats['unknown_skus'].extend(list(counts)[:max(room, 0)])
+
+
+def apply_stocktake(lines, file_format='csv', reason='Stock-take', user=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Apply a stock-take file, chunk by chunk.
+
+    Each chunk is its own transaction, so an interrupted import keeps the
+    chunks already applied and can simply be run again. ``progress`` is
+    called with the running stats after every chunk. Returns the stats:
+    rows, matched, adjusted, unknown and invalid counts, the first unknown
+    SKUs and errors, seconds and rows per second. ``StocktakeFormatError``
+    is raised before anything is applied.
+    """
+    stats = {
+        'rows': 0, 'matched': 0, 'adjusted': 0, 'unknown': 0, 'invalid': 0,
+        'unknown_skus': [], 'errors': [], 'seconds': 0.0, 'rows_per_second': 0.0,
+    }
+    started = time.perf_counter()
+
+    def update_timing():
+        stats['seconds'] = time.perf_counter() - started
+        stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+
+    def flush(counts):
+        _apply_chunk(counts, reason, user, stats)
+        update_timing()
+        if progress:
+            progress(stats)
+
+    counts = {}
+    for line_number, sku, counted, error in iter_counts(lines, file_format):
+        stats['rows'] += 1
+        if error:
+            stats['invalid'] += 1
+            if len(stats['errors']) < MAX_REPORTED:
+                stats['errors'].append({'line': line_number, 'error': error})
+            continue
+        # A SKU listed twice in a chunk keeps its last count.
+        counts[sku] = counted
+        if len(counts) >= chunk_size:
+            flush(counts)
+            counts = {}
+    if counts:
+        flush(counts)
+    update_timing()
+    return stats
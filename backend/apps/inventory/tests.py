@@ -1,3 +1,278 @@
-from django.test import TestCase
+import io
+import random
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.orders.archive import archive_batch, archive_cutoff
+from apps.orders.models import ArchivedOrderItem, Order
+from apps.orders.services import create_order
+
+from .categories import category_tree
+from .forecasting import load_daily_sales
+from .models import Category, CategoryTreeVersion, Product, StockMovement, StockReservation
+from .reservations import commit_order, release_order, reserve_order, sweep_expired
+from .stock import InsufficientStock, add_stock, remove_stock, set_stock
+from .stocktake import StocktakeFormatError, apply_stocktake
+
+
+def new_order(product, quantity=1):
+    return create_order([{'product_name': product.name, 'product_id': product.pk, 'product_type': 'inventory',
+                          'quantity': quantity, 'unit_price': '1.00'}])
+
+
+def make_product(name, stock):
+    return Product.objects.create(
+        name=name, slug=name.lower().replace(' ', '-'), sku=name.upper().replace(' ', '-'), description='',
+        price=Decimal('1.00'), cost_price=Decimal('0.50'), stock_quantity=stock,
+    )
+
+
+class CategoryTreeTests(TestCase):
+    """The cached sidebar tree follows category changes made anywhere."""
+
+    def test_tree_follows_moves(self):
+        drinks = Category.objects.create(name='Drinks', slug='drinks')
+        tea = Category.objects.create(name='Tea', slug='tea')
+        self.assertEqual([node['slug'] for node in category_tree()], ['drinks', 'tea'])
+
+        tea.parent = drinks
+        tea.save()
+        tree = category_tree()
+        self.assertEqual([node['slug'] for node in tree], ['drinks'])
+        self.assertEqual([node['slug'] for node in tree[0]['children']], ['tea'])
+
+    def test_tree_follows_a_change_made_by_another_process(self):
+        Category.objects.create(name='Snacks', slug='snacks')
+        self.assertEqual(category_tree()[0]['name'], 'Snacks')
+
+        # Another process renames it: no signal here, only its bump of the stamp.
+        Category.objects.filter(slug='snacks').update(name='Crisps')
+        CategoryTreeVersion.objects.update(version=F('version') + 1)
+        self.assertEqual(category_tree()[0]['name'], 'Crisps')
+
+
+class ForecastHistoryTests(TestCase):
+    """Forecasts read the sales of archived orders as well as live ones."""
+
+    def test_archived_sales_are_loaded(self):
+        product = make_product('Figs', 100)
+        now = timezone.now()
+        for days_ago, quantity in ((300, 2), (200, 3), (10, 4)):
+            order = new_order(product, quantity=quantity)
+            Order.objects.filter(pk=order.pk).update(status='completed',
+                                                     created_at=now - timezone.timedelta(days=days_ago))
+        self.assertEqual(archive_batch(archive_cutoff(), 100)[0], 2)
+        self.assertEqual(ArchivedOrderItem.objects.count(), 2)
+
+        _, (product_ids, ages, units) = load_daily_sales(now - timezone.timedelta(days=730), now)
+        self.assertEqual(sorted(zip(ages.tolist(), units.tolist())), [(10, 4), (200, 3), (300, 2)])
+        self.assertEqual(set(product_ids.tolist()), {product.pk})
+
+
+class StockUpdateTests(TestCase):
+    """Stock changes are conditional UPDATEs with one movement per product."""
+
+    def setUp(self):
+        self.apples = make_product('Apples', 5)
+        self.pears = make_product('Pears', 1)
+
+    def test_remove_stock_takes_the_whole_basket(self):
+        levels = remove_stock([(self.apples.pk, 2), (self.pears.pk, 1), (self.apples.pk, 1)], reason='Sale')
+        self.assertEqual(levels, {self.apples.pk: 2, self.pears.pk: 0})
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(movement_type='out').values_list('product_id', 'quantity')),
+            sorted([(self.apples.pk, 3), (self.pears.pk, 1)]),
+        )
+
+    def test_short_basket_changes_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            remove_stock({self.apples.pk: 2, self.pears.pk: 2})
+        self.assertEqual(raised.exception.shortages, {self.pears.pk: (2, 1)})
+        self.apples.refresh_from_db()
+        self.assertEqual(self.apples.stock_quantity, 5)
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_add_and_set_stock_record_the_difference(self):
+        self.assertEqual(add_stock({self.apples.pk: 4}), {self.apples.pk: 9})
+        set_stock(self.apples.pk, 7, reason='Count')
+        self.apples.refresh_from_db()
+        self.assertEqual(self.apples.stock_quantity, 7)
+        self.assertEqual(StockMovement.objects.filter(product=self.apples).count(), 2)
+
+
+class StocktakeTests(TestCase):
+    """Stock-take files need their header and report bad rows in plain words."""
+
+    def setUp(self):
+        self.apples = make_product('Apples', 5)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('counter'))
+
+    def upload(self, content, name='count.csv'):
+        return self.client.post('/api/inventory/stocktake/',
+                                {'file': SimpleUploadedFile(name, content.encode())}, format='multipart')
+
+    def test_csv_without_the_header_is_rejected(self):
+        for content in ('APPLES,3\n', 'sku,quantity\nAPPLES,3\n', '\n'):
+            with self.subTest(content=content):
+                response = self.upload(content)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('counted_quantity', response.data['file'][0])
+        self.apples.refresh_from_db()
+        self.assertEqual(self.apples.stock_quantity, 5)
+        with self.assertRaises(StocktakeFormatError):
+            apply_stocktake(io.StringIO('APPLES,3\n'))
+
+    def test_header_names_are_matched_loosely(self):
+        response = self.upload(' SKU , Counted_Quantity\nAPPLES,3\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rows'], response.data['adjusted']), (1, 1))
+
+    def test_invalid_rows_are_explained(self):
+        stats = apply_stocktake(io.StringIO('sku,counted_quantity\nAPPLES,abc\nAPPLES,-2\n,4\nAPPLES\n'))
+        self.assertEqual([error['error'] for error in stats['errors']], [
+            'counted_quantity must be a non-negative integer',
+            'counted_quantity must be a non-negative integer',
+            'sku is required',
+            'counted_quantity is required',
+        ])
+        lines = ['{"sku": "APPLES"', '[1]', '{"sku": "APPLES", "counted_quantity": 2.5}']
+        stats = apply_stocktake(io.StringIO('\n'.join(lines)), 'ndjson')
+        self.assertEqual([error['error'] for error in stats['errors']], [
+            'not valid JSON',
+            'each line must be a JSON object with sku and counted_quantity',
+            'counted_quantity must be a non-negative integer',
+        ])
+
+
+class ReservationTests(TestCase):
+    """Holds are tracked on the product row and settled exactly once."""
+
+    def test_saving_a_stale_copy_keeps_the_holds(self):
+        product = make_product('Plums', 100)
+        stale = Product.objects.get(pk=product.pk)
+        order = new_order(product, quantity=3)
+        reserve_order(order.pk)
+
+        stale.price = Decimal('2.00')
+        stale.save()
+        product.refresh_from_db()
+        self.assertEqual((product.price, product.reserved_quantity, product.available_quantity),
+                         (Decimal('2.00'), 3, 97))
+
+        self.assertEqual(release_order(order.pk), 3)
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_quantity, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+    def test_statements_do_not_grow_with_outstanding_holds(self):
+        product = make_product('Quinces', 1000)
+        filler = make_product('Filler', 1000)
+
+        def statements():
+            counts = []
+            for settle in (commit_order, release_order):
+                order = new_order(product)
+                for operation in (reserve_order, settle):
+                    with CaptureQueriesContext(connection) as queries:
+                        operation(order.pk)
+                    counts.append(len(queries))
+            return counts
+
+        empty = statements()
+        for _ in range(30):
+            reserve_order(new_order(filler).pk)
+        self.assertEqual(statements(), empty)
+
+
+class ReservationContentionTests(TransactionTestCase):
+    """Checkouts racing for the same product never hold more than is in stock."""
+
+    def test_concurrent_checkouts_account_for_every_unit(self):
+        stock = 30
+        product = make_product('Contended', stock)
+
+        def retry(operation, *args, **kwargs):
+            while True:
+                try:
+                    return operation(*args, **kwargs)
+                except OperationalError:
+                    pass  # SQLite gave up waiting for the write lock; the transaction was rolled back
+
+        def work(seed):
+            rng = random.Random(seed)
+            committed = 0
+            try:
+                for _ in range(15):
+                    outcome = rng.random()
+                    order = retry(new_order, product, quantity=rng.randint(1, 3))
+                    try:
+                        # Some holds are placed already lapsed and left for the sweeper.
+                        retry(reserve_order, order.pk, ttl=0 if outcome < 0.2 else 600)
+                    except InsufficientStock:
+                        continue
+                    if 0.2 <= outcome < 0.6:
+                        committed += retry(commit_order, order.pk, reason='Contention test')
+                    elif outcome >= 0.6:
+                        retry(release_order, order.pk)
+                return committed
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            committed = sum(pool.map(work, range(6)))
+
+        product.refresh_from_db()
+        held = StockReservation.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertGreater(committed, 0)
+        self.assertEqual(product.reserved_quantity, held)
+        self.assertLessEqual(product.reserved_quantity, product.stock_quantity)
+        self.assertEqual(product.stock_quantity, stock - committed)
+
+        # Holds still in place lapse too.
+        sweep_expired(now=timezone.now() + timezone.timedelta(hours=1), batch_size=1000)
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_quantity, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class StockOversellTests(TransactionTestCase):
+    """Concurrent sales of the same products never take stock below zero."""
+
+    def test_concurrent_sales_never_oversell(self):
+        stock = 20
+        products = [make_product(f'Oversell {i}', stock) for i in range(2)]
+        basket = {product.pk: 1 for product in products}
+
+        def work(attempts):
+            sold = 0
+            try:
+                for _ in range(attempts):
+                    try:
+                        remove_stock(basket, reason='Oversell test')
+                        sold += 1
+                    except (InsufficientStock, OperationalError):
+                        pass
+                return sold
+            finally:
+                connections.close_all()
+
+        # More attempts than stock, so the last units are contended.
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            sold = sum(pool.map(work, [20] * 8))
+
+        self.assertGreater(sold, 0)
+        self.assertLessEqual(sold, stock)
+        for product in Product.objects.filter(pk__in=basket):
+            self.assertEqual(product.stock_quantity, stock - sold)
+            self.assertEqual(StockMovement.objects.filter(product=product, movement_type='out').count(), sold)
@@ -1,7 +1,37 @@
 from django.urls import path
+from .views import (
+    StockTakeView,
+    LowStockView,
+    StockAlertFeedView,
+    ProductLookupView,
+    ProductLookupStatsView,
+    InventoryValuationView,
+    CategoryTreeView,
+    CategoryBreadcrumbsView,
+    CategoryProductsView,
+    ProductSearchView,
+    StockReservationView,
+    StockReservationCommitView,
+    StockReservationReleaseView,
+    SuggestedPurchaseOrderView
+)
 
 app_name = 'inventory'
 
 urlpatterns = [
-    # Inventory endpoints will go here
-]
\ No newline at end of file
+    path('stocktake/', StockTakeView.as_view(), name='stocktake'),
+    path('low-stock/', LowStockView.as_view(), name='low_stock'),
+    path('alerts/', StockAlertFeedView.as_view(), name='stock_alerts'),
+    path('lookup/', ProductLookupView.as_view(), name='product_lookup'),
+    path('lookup/stats/', ProductLookupStatsView.as_view(), name='product_lookup_stats'),
+    path('valuation/', InventoryValuationView.as_view(), name='inventory_valuation'),
+    path('search/', ProductSearchView.as_view(), name='product_search'),
+    path('reservations/', StockReservationView.as_view(), name='stock_reservations'),
+    path('reservations/<int:order_id>/commit/', StockReservationCommitView.as_view(), name='stock_reservation_commit'),
+    path('reservations/<int:order_id>/release/', StockReservationReleaseView.as_view(),
+         name='stock_reservation_release'),
+    path('purchase-orders/suggested/', SuggestedPurchaseOrderView.as_view(), name='suggested_purchase_order'),
+    path('categories/tree/', CategoryTreeView.as_view(), name='category_tree'),
+    path('categories/<slug:slug>/breadcrumbs/', CategoryBreadcrumbsView.as_view(), name='category_breadcrumbs'),
+    path('categories/<slug:slug>/products/', CategoryProductsView.as_view(), name='category_products'),
+]
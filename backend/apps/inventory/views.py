@@ -1,3 +1,337 @@
-from django.shortcuts import render
+import io
+from decimal import Decimal
 
-# Create your views here.
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated
+
+from apps.orders.filters import parse_datetime_param
+from apps.orders.models import Order
+
+from . import alerts
+from .categories import (
+    PRODUCTS_DEFAULT_LIMIT, PRODUCTS_MAX_LIMIT, breadcrumbs, category_tree, subtree, subtree_products,
+)
+from .forecasting import suggested_purchase_order
+from .history import stock_at, value_inventory_at
+from .lookup import get_lookup_cache, lookup_product, lookup_products
+from .models import Category, Product
+from .reservations import commit_order, release_order, reserve_order
+from .serializers import (
+    StockTakeUploadSerializer,
+    LowStockProductSerializer,
+    StockAlertSerializer,
+    ProductLookupSerializer,
+    ProductLookupRequestSerializer,
+    CategoryBreadcrumbSerializer,
+    CategoryProductSerializer,
+    ProductSearchParamsSerializer,
+    StockReservationRequestSerializer,
+    SuggestedPurchaseLineSerializer
+)
+from .search import search_products
+from .stock import InsufficientStock
+from .stocktake import STOCKTAKE_ENCODING, StocktakeFormatError, apply_stocktake, check_encoding, detect_format
+
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class StockTakeView(APIView):
+    """
+    API view for applying a stock-take file.
+
+    Accepts a multipart upload of a CSV (``sku,counted_quantity`` header) or
+    NDJSON file. Stock levels are set to the counted quantities and the
+    differences are recorded as adjustments. Large uploads are spooled to
+    disk and read row by row.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        serializer = StockTakeUploadSerializer(data=request.data)
+        if serializer.is_valid():
+            upload = serializer.validated_data['file']
+            file_format = serializer.validated_data.get('file_format') or detect_format(upload.name)
+            try:
+                check_encoding(upload.file)
+            except UnicodeDecodeError as exc:
+                return Response({'file': [f"The file is not UTF-8 text (invalid byte at offset {exc.start})."]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            lines = io.TextIOWrapper(upload.file, encoding=STOCKTAKE_ENCODING, newline='')
+            try:
+                stats = apply_stocktake(lines, file_format, reason=serializer.validated_data['reason'],
+                                        user=request.user)
+            except StocktakeFormatError as exc:
+                return Response({'file': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(stats, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class LowStockView(APIView):
+    """
+    API view listing active products at or below their minimum stock level,
+    emptiest first. ``limit`` caps the number of products returned.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        limit = max(1, min(_int_param(request.query_params, 'limit', alerts.DEFAULT_LIMIT), alerts.MAX_LIMIT))
+        products = alerts.low_stock_products()[:limit]
+        return Response({'results': LowStockProductSerializer(products, many=True).data}, status=status.HTTP_200_OK)
+
+
+class StockAlertFeedView(APIView):
+    """
+    API view for the low-stock alert feed.
+
+    Returns alerts newer than the ``after`` cursor (an alert id) and the
+    ``cursor`` to send on the next poll. Alerts are served once they are
+    ``alerts.SETTLE_SECONDS`` old.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        feed, cursor = alerts.stock_alerts(
+            after=_int_param(request.query_params, 'after', 0),
+            limit=_int_param(request.query_params, 'limit', alerts.DEFAULT_LIMIT),
+        )
+        return Response({'results': StockAlertSerializer(feed, many=True).data, 'cursor': cursor},
+                        status=status.HTTP_200_OK)
+
+
+class ProductLookupView(APIView):
+    """
+    API view resolving scanned barcodes or SKUs to products.
+
+    GET resolves a single ``code``; POST resolves ``{"codes": [...]}`` at once
+    and returns one entry per code, with ``product`` null for unknown codes.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        code = request.query_params.get('code', '').strip()
+        if not code:
+            return Response({'error': 'code is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        product = lookup_product(code)
+        if product is None:
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ProductLookupSerializer(product).data, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        serializer = ProductLookupRequestSerializer(data=request.data)
+        if serializer.is_valid():
+            products = lookup_products(serializer.validated_data['codes'])
+            results = [
+                {'code': code, 'product': ProductLookupSerializer(product).data if product else None}
+                for code, product in products.items()
+            ]
+            return Response({'results': results}, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ProductLookupStatsView(APIView):
+    """
+    API view reporting the lookup cache counters of the serving process.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(get_lookup_cache().stats(), status=status.HTTP_200_OK)
+
+
+class InventoryValuationView(APIView):
+    """
+    API view for stock at a point in time.
+
+    ``at`` is an ISO 8601 datetime or a date (meaning the end of that day),
+    defaulting to now. Returns the units on hand and their value at cost for
+    the whole catalog, or the stock of a single ``product``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        at = request.query_params.get('at')
+        when = parse_datetime_param('at', at, end_of_day=True) if at else timezone.now()
+
+        product_id = request.query_params.get('product')
+        if product_id:
+            try:
+                stock = stock_at(int(product_id), when)
+            except (ValueError, Product.DoesNotExist):
+                return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'at': when, 'product': int(product_id), 'stock_quantity': stock},
+                            status=status.HTTP_200_OK)
+
+        valuation = value_inventory_at(when)
+        valuation['value'] = str(valuation['value'])
+        return Response(valuation, status=status.HTTP_200_OK)
+
+
+class CategoryTreeView(APIView):
+    """
+    API view for the nested tree of active categories, served from the cache.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'results': category_tree()}, status=status.HTTP_200_OK)
+
+
+class CategoryBreadcrumbsView(APIView):
+    """
+    API view for the chain of categories from the root down to a category.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, slug):
+        category = Category.objects.filter(slug=slug).only('pk', 'path').first()
+        if category is None:
+            return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+        trail = breadcrumbs(category)
+        return Response({'results': CategoryBreadcrumbSerializer(trail, many=True).data}, status=status.HTTP_200_OK)
+
+
+class CategoryProductsView(APIView):
+    """
+    API view listing the active products of a category and all of its
+    sub-categories. ``limit`` and ``offset`` page through them by name.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, slug):
+        category = Category.objects.filter(slug=slug).only('pk', 'path').first()
+        if category is None:
+            return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        limit = max(1, min(_int_param(request.query_params, 'limit', PRODUCTS_DEFAULT_LIMIT), PRODUCTS_MAX_LIMIT))
+        offset = max(0, _int_param(request.query_params, 'offset', 0))
+        products = subtree_products(category).filter(is_active=True).order_by('name', 'pk')[offset:offset + limit]
+        serializer = CategoryProductSerializer(products, many=True, context={'request': request})
+        return Response({'results': serializer.data}, status=status.HTTP_200_OK)
+
+
+class ProductSearchView(APIView):
+    """
+    API view for full-text catalog search.
+
+    ``q`` is matched against product names, descriptions, SKUs and barcodes;
+    ``category`` (a slug, including its sub-categories), ``min_price`` and
+    ``max_price`` narrow the matches. Returns ranked results with category
+    and price-range facet counts over all matches.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = ProductSearchParamsSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+
+        category = None
+        if params.get('category'):
+            category = Category.objects.filter(slug=params['category']).only('pk', 'path').first()
+            if category is None:
+                return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        results = search_products(
+            params['q'], category=category, min_price=params.get('min_price'), max_price=params.get('max_price'),
+            limit=params['limit'], offset=params['offset'],
+        )
+        return Response(results, status=status.HTTP_200_OK)
+
+
+def _shortage_response(exc):
+    shortages = [
+        {'product': product_id, 'requested': requested, 'available': available}
+        for product_id, (requested, available) in exc.shortages.items()
+    ]
+    return Response({'error': str(exc), 'shortages': shortages}, status=status.HTTP_409_CONFLICT)
+
+
+class StockReservationView(APIView):
+    """
+    API view for holding stock for the inventory lines of an order.
+
+    Holds lapse after ``ttl`` seconds (``STOCK_RESERVATION_TTL`` by default);
+    posting again for the same order extends them.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = StockReservationRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        order_id = serializer.validated_data['order']
+        if not Order.objects.filter(pk=order_id).exists():
+            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            expires_at = reserve_order(order_id, ttl=serializer.validated_data.get('ttl'))
+        except InsufficientStock as exc:
+            return _shortage_response(exc)
+        return Response({'order': order_id, 'expires_at': expires_at}, status=status.HTTP_201_CREATED)
+
+
+class StockReservationCommitView(APIView):
+    """
+    API view for selling the stock held for an order once it is paid.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, order_id):
+        if not Order.objects.filter(pk=order_id).exists():
+            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            sold = commit_order(order_id, reason=f'Order {order_id}', user=request.user)
+        except InsufficientStock as exc:
+            return _shortage_response(exc)
+        return Response({'order': order_id, 'sold': sold}, status=status.HTTP_200_OK)
+
+
+class StockReservationReleaseView(APIView):
+    """
+    API view for giving back the stock held for an order.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, order_id):
+        return Response({'order': order_id, 'released': release_order(order_id)}, status=status.HTTP_200_OK)
+
+
+class SuggestedPurchaseOrderView(APIView):
+    """
+    API view for the suggested purchase order: active products at or below
+    their forecast reorder point and the quantity that brings each back to
+    its order-up-to level, costliest lines first. ``category`` (a slug)
+    limits it to a category and its sub-categories.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        products = Product.objects.all()
+        slug = request.query_params.get('category')
+        if slug:
+            category = Category.objects.filter(slug=slug).only('pk', 'path').first()
+            if category is None:
+                return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+            products = products.filter(category__in=subtree(category))
+
+        lines = list(suggested_purchase_order(products))
+        total = sum((line.order_cost for line in lines), Decimal('0'))
+        return Response({
+            'lines': SuggestedPurchaseLineSerializer(lines, many=True).data,
+            'units': sum(line.order_quantity for line in lines),
+            'total_cost': str(total),
+        }, status=status.HTTP_200_OK)
@@ -1,7 +1,7 @@
-from django.contrib import admin
-from .models import Order, OrderItem, Customer
-import csv
-from django.http import HttpResponse
+from django.contrib import admin, messages
+from .models import Order, OrderItem, Customer, OrderTransition, ArchivedOrder, ArchivedOrderItem
+from .export import export_orders_response
+from .transitions import transition_orders, APPLIED
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -22,7 +22,7 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('order_number', 'user__username', 'customer__name')
     readonly_fields = ('order_number', 'created_at', 'updated_at')
     inlines = [OrderItemInline]
-    actions = ['export_as_csv', 'mark_as_completed', 'mark_as_cancelled']
+    actions = ['export_as_csv', 'export_items_as_csv', 'export_as_ndjson', 'mark_as_completed', 'mark_as_cancelled']
     
     def get_customer_name(self, obj):
         if obj.user:
@@ -33,24 +33,79 @@ class OrderAdmin(admin.ModelAdmin):
     get_customer_name.short_description = 'Customer'
     
     def export_as_csv(self, request, queryset):
-        meta = self.model._meta
-        field_names = [field.name for field in meta.fields]
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename={meta}.csv'
-        writer = csv.writer(response)
-        
-        writer.writerow(field_names)
-        for obj in queryset:
-            row = writer.writerow([getattr(obj, field) for field in field_names])
-            
-        return response
+        return export_orders_response(queryset, 'csv', filename=self.model._meta.model_name)
     export_as_csv.short_description = "Export selected orders as CSV"
     
+    def export_items_as_csv(self, request, queryset):
+        return export_orders_response(queryset, 'csv', include_items=True, filename='order_items')
+    export_items_as_csv.short_description = "Export selected orders with items as CSV"
+    
+    def export_as_ndjson(self, request, queryset):
+        return export_orders_response(queryset, 'ndjson', filename=self.model._meta.model_name)
+    export_as_ndjson.short_description = "Export selected orders as NDJSON"
+    
+    def transition_selected(self, request, queryset, to_status):
+        results = transition_orders(
+            [(pk, to_status, None) for pk in queryset.values_list('pk', flat=True)], user=request.user
+        )
+        applied = sum(1 for result in results if result['status'] == APPLIED)
+        self.message_user(request, f"Marked {applied} of {len(results)} orders as {to_status}")
+        if applied < len(results):
+            self.message_user(
+                request,
+                f"{len(results) - applied} orders were skipped: the change is not allowed from their "
+                f"current status or another user changed them first",
+                level=messages.WARNING,
+            )
+    
     def mark_as_completed(self, request, queryset):
-        queryset.update(status='completed')
+        self.transition_selected(request, queryset, 'completed')
     mark_as_completed.short_description = "Mark selected orders as completed"
     
     def mark_as_cancelled(self, request, queryset):
-        queryset.update(status='cancelled')
+        self.transition_selected(request, queryset, 'cancelled')
     mark_as_cancelled.short_description = "Mark selected orders as cancelled"
+
+@admin.register(OrderTransition)
+class OrderTransitionAdmin(admin.ModelAdmin):
+    list_display = ('order', 'from_status', 'to_status', 'performed_by', 'created_at')
+    list_filter = ('to_status', 'created_at')
+    search_fields = ('order__order_number',)
+    list_select_related = ('order', 'performed_by')
+    readonly_fields = ('order', 'from_status', 'to_status', 'performed_by', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False  # The log is written by the transition engine only
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('order_number', 'status', 'total_amount', 'payment_method', 'payment_status',
+                    'created_at', 'archived_at')
+    list_filter = ('status', 'payment_method', 'payment_status', 'created_at')
+    search_fields = ('order_number', 'customer__name')
+    inlines = [ArchivedOrderItemInline]
+    actions = ['export_as_csv']
+    
+    def has_add_permission(self, request):
+        return False  # Orders are archived by the archive_orders command only
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def export_as_csv(self, request, queryset):
+        return export_orders_response(queryset, 'csv', filename='archived_orders')
+    export_as_csv.short_description = "Export selected orders as CSV"
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.orders'
+
+    def ready(self):
+        # Connects the search index receivers.
+        from . import search  # noqa: F401
@@ -0,0 +1,158 @@
+"""
+Hot/cold archival of closed orders.
+
+Completed and cancelled orders older than ``ORDER_ARCHIVE_AFTER_DAYS`` are
+never written again. ``archive_orders`` moves them, with their items and
+status log, from the live tables into ``ArchivedOrder``,
+``ArchivedOrderItem`` and ``ArchivedOrderTransition`` so the live tables and
+their indexes only hold recent or open orders.
+
+Each batch is copied with ``INSERT ... SELECT`` and removed from the live
+tables in its own short transaction, so the job can be stopped at any point
+and simply run again: rows are either fully moved or untouched. Batch rows
+are locked with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database
+supports it, so live writers are never blocked by, or lost to, the job.
+
+Readers that must see every order use ``find_order`` and ``order_querysets``.
+
+``orders_archived`` is sent for each batch before its live rows are deleted,
+and ``is_archiving`` is true while they are, so receivers of the live
+tables' delete signals can handle a batch at once and skip per-row work.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    Order, OrderItem, OrderTransition,
+    ArchivedOrder, ArchivedOrderItem, ArchivedOrderTransition,
+)
+from .signals import orders_archived
+from .transitions import FINAL_STATUSES
+
+# The archive tables mirror these live tables column for column.
+ARCHIVE_TABLES = (
+    (Order, ArchivedOrder, 'id'),
+    (OrderItem, ArchivedOrderItem, 'order_id'),
+    (OrderTransition, ArchivedOrderTransition, 'order_id'),
+)
+
+_archiving = threading.local()
+
+
+def is_archiving():
+    """Whether this thread is deleting the live rows of orders it has just archived."""
+    return getattr(_archiving, 'active', False)
+
+
+def archive_cutoff(days=None):
+    """Return the creation time before which closed orders are archived."""
+    if days is None:
+        days = settings.ORDER_ARCHIVE_AFTER_DAYS
+    return timezone.now() - timezone.timedelta(days=days)
+
+
+def archivable_orders(cutoff):
+    return Order.objects.filter(status__in=FINAL_STATUSES, created_at__lt=cutoff)
+
+
+def _copy_rows(source, target, column, ids, archived_at):
+    """Copy the ``source`` rows whose ``column`` is in ``ids`` into ``target``."""
+    quote = connection.ops.quote_name
+    source_columns = {field.column for field in source._meta.concrete_fields}
+    columns = []
+    values = []
+    params = []
+    for field in target._meta.concrete_fields:
+        columns.append(quote(field.column))
+        if field.column in source_columns:
+            values.append(quote(field.column))
+        else:
+            values.append('%s')
+            params.append(archived_at)
+    sql = (
+        f"INSERT INTO {quote(target._meta.db_table)} ({', '.join(columns)}) "
+        f"SELECT {', '.join(values)} FROM {quote(source._meta.db_table)} "
+        f"WHERE {quote(column)} IN ({', '.join(['%s'] * len(ids))})"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + list(ids))
+        return cursor.rowcount
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Move one batch of the oldest archivable orders. Returns the number of
+    orders and items moved.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            archivable_orders(cutoff).order_by('created_at', 'id')
+            .select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0, 0
+
+        moved = {}
+        for source, target, column in ARCHIVE_TABLES:
+            moved[source] = _copy_rows(source, target, column, ids, now)
+        orders_archived.send(sender=Order, order_ids=ids)
+        # Cascades to the items, status log, search tokens and stock holds.
+        _archiving.active = True
+        try:
+            Order.objects.filter(pk__in=ids).delete()
+        finally:
+            _archiving.active = False
+    return moved[Order], moved[OrderItem]
+
+
+def archive_orders(cutoff=None, batch_size=None, max_batches=None, pause=0, progress=None):
+    """
+    Archive closed orders created before ``cutoff`` in batches.
+
+    ``pause`` seconds are slept between batches to leave room for live
+    traffic; ``progress`` is called with the running stats after each batch.
+    Returns the stats: batches, orders, items, seconds and orders per second.
+    """
+    if cutoff is None:
+        cutoff = archive_cutoff()
+    if batch_size is None:
+        batch_size = settings.ORDER_ARCHIVE_BATCH_SIZE
+
+    stats = {'batches': 0, 'orders': 0, 'items': 0, 'seconds': 0.0, 'orders_per_second': 0.0}
+    started = time.perf_counter()
+    while max_batches is None or stats['batches'] < max_batches:
+        orders, items = archive_batch(cutoff, batch_size)
+        if not orders:
+            break
+        stats['batches'] += 1
+        stats['orders'] += orders
+        stats['items'] += items
+        # Throughput excludes the pauses, so it reflects the batches themselves.
+        stats['seconds'] = time.perf_counter() - started - pause * (stats['batches'] - 1)
+        stats['orders_per_second'] = stats['orders'] / stats['seconds'] if stats['seconds'] else 0.0
+        if progress:
+            progress(stats)
+        if orders < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return stats
+
+
+def find_order(order_number):
+    """Return the live or archived order with ``order_number``, or None."""
+    for model in (Order, ArchivedOrder):
+        order = model.objects.filter(order_number=order_number).first()
+        if order is not None:
+            return order
+    return None
+
+
+def order_querysets():
+    """Return querysets over the live and the archived orders, in that order."""
+    return Order.objects.all(), ArchivedOrder.objects.all()
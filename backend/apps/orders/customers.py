@@ -0,0 +1,157 @@
+"""
+Guest customer identity resolution.
+
+Customers are recognised by normalized lookup keys (``Customer.email_key``
+and ``Customer.phone_key``) rather than by the raw values typed at the till,
+so ``Jane@Example.com `` and ``jane@example.com`` are the same person. Email
+keys are unique, which makes ``resolve_customer`` safe under concurrent
+checkouts: the losing insert fails and re-reads the winner's row. Phone keys
+are indexed but not unique, since households and businesses share numbers:
+a phone number only identifies a customer when no email is given, so a
+second member of a household with their own email gets their own customer.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Min, Value, When
+from django.utils import timezone
+
+from .models import Order, ArchivedOrder, Customer
+
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+LOOKUP_BATCH_SIZE = 500
+
+normalize_email = Customer.normalize_email
+normalize_phone = Customer.normalize_phone
+
+
+def _lookup(field, keys):
+    """Return a mapping of lookup key to the oldest customer with that key."""
+    keys = [key for key in set(keys) if key]
+    found = {}
+    for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        queryset = Customer.objects.filter(**{f'{field}__in': keys[start:start + LOOKUP_BATCH_SIZE]})
+        for customer in queryset.order_by('-pk'):
+            found[getattr(customer, field)] = customer
+    return found
+
+
+def find_customer(email=None, phone=None):
+    """Return the existing customer for ``email``, or for ``phone`` when no email is given."""
+    email_key = normalize_email(email)
+    if email_key:
+        return Customer.objects.filter(email_key=email_key).first()
+    phone_key = normalize_phone(phone)
+    if phone_key:
+        return Customer.objects.filter(phone_key=phone_key).order_by('pk').first()
+    return None
+
+
+def resolve_customer(name, email=None, phone=None, address=None):
+    """
+    Return the customer matching ``email`` (or ``phone`` when no email is
+    given), creating one if needed.
+
+    The insert runs in a savepoint so that, when a concurrent checkout creates
+    the same email first, the unique constraint rejects ours and the existing
+    row is returned instead.
+    """
+    customer = find_customer(email, phone)
+    if customer is not None:
+        return customer
+    try:
+        with transaction.atomic():
+            return Customer.objects.create(name=name, email=email, phone=phone, address=address)
+    except IntegrityError:
+        customer = Customer.objects.filter(email_key=normalize_email(email)).first()
+        if customer is None:
+            raise
+        return customer
+
+
+def resolve_customers(entries):
+    """
+    Resolve a batch of customer dicts (``name``, ``email``, ``phone``, ``address``).
+
+    Existing customers are looked up with one indexed query per key type and
+    the rest are written with a single bulk insert; entries sharing an email
+    within the batch, or a phone when they have no email, resolve to the same
+    new customer. Returns the
+    customers aligned with ``entries`` and the list of newly created ones.
+
+    Call this inside the caller's transaction: if a concurrent writer creates
+    one of the emails first, the bulk insert raises ``IntegrityError`` and the
+    caller is expected to retry.
+    """
+    entries = list(entries)
+    by_email = _lookup('email_key', (normalize_email(entry.get('email')) for entry in entries))
+    by_phone = _lookup('phone_key', (normalize_phone(entry.get('phone')) for entry in entries
+                                     if not normalize_email(entry.get('email'))))
+
+    customers = []
+    created = []
+    for entry in entries:
+        email_key = normalize_email(entry.get('email'))
+        phone_key = normalize_phone(entry.get('phone'))
+        if email_key:
+            customer = by_email.get(email_key)
+        else:
+            customer = by_phone.get(phone_key) if phone_key else None
+        if customer is None:
+            customer = Customer(**entry)
+            customer.set_lookup_keys()
+            created.append(customer)
+            if email_key:
+                by_email[email_key] = customer
+            if phone_key:
+                by_phone.setdefault(phone_key, customer)
+        customers.append(customer)
+
+    Customer.objects.bulk_create(created, batch_size=LOOKUP_BATCH_SIZE)
+    return customers, created
+
+
+def find_duplicate_customers():
+    """
+    Return a mapping of keeper customer id to the ids of its duplicates:
+    customers without an email that share a phone key are duplicates of
+    the oldest one.
+
+    Customers with an email cannot be duplicated: email keys are unique
+    since migration 0008, which folded the existing duplicates.
+    """
+    queryset = Customer.objects.filter(email_key='').exclude(phone_key='')
+    keepers = dict(
+        queryset.values('phone_key').annotate(copies=Count('pk'), keeper=Min('pk'))
+        .filter(copies__gt=1).values_list('phone_key', 'keeper')
+    )
+    duplicates = defaultdict(list)
+    keys = list(keepers)
+    for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        rows = queryset.filter(phone_key__in=keys[start:start + LOOKUP_BATCH_SIZE])
+        for pk, key in rows.values_list('pk', 'phone_key'):
+            if pk != keepers[key]:
+                duplicates[keepers[key]].append(pk)
+    return dict(duplicates)
+
+
+def merge_customers(duplicates, batch_size=LOOKUP_BATCH_SIZE):
+    """
+    Fold duplicate customers into their keepers.
+
+    ``duplicates`` maps keeper ids to duplicate ids. Live and archived orders
+    are re-pointed with one ``UPDATE ... SET customer_id = CASE ...`` per batch of
+    duplicates, then the duplicates are deleted. Returns the number of orders
+    moved and customers removed.
+    """
+    keeper_of = {dup: keeper for keeper, dups in duplicates.items() for dup in dups}
+    dup_ids = list(keeper_of)
+    moved = removed = 0
+    with transaction.atomic():
+        for start in range(0, len(dup_ids), batch_size):
+            batch = dup_ids[start:start + batch_size]
+            keeper = Case(*[When(customer_id=dup, then=Value(keeper_of[dup])) for dup in batch])
+            moved += Order.objects.filter(customer_id__in=batch).update(customer_id=keeper, updated_at=timezone.now())
+            moved += ArchivedOrder.objects.filter(customer_id__in=batch).update(customer_id=keeper)
+            removed += Customer.objects.filter(pk__in=batch).delete()[1].get(Customer._meta.label, 0)
+    return moved, removed
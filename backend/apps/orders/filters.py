@@ -0,0 +1,57 @@
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+# Query parameters matched exactly against the field of the same name.
+EXACT_FILTERS = ('status', 'payment_status', 'payment_method')
+ID_FILTERS = ('user', 'customer')
+
+
+def parse_datetime_param(name, value, end_of_day=False):
+    """
+    Parse an ISO 8601 datetime or a ``YYYY-MM-DD`` date query parameter.
+
+    Dates become the start of that day, or of the next day with
+    ``end_of_day``, so the filter stays a plain range on ``created_at``.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValidationError({name: 'Enter a date (YYYY-MM-DD) or an ISO 8601 datetime.'})
+        if end_of_day:
+            date += datetime.timedelta(days=1)
+        parsed = datetime.datetime.combine(date, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_orders(queryset, params):
+    """
+    Apply the order list query parameters to ``queryset``.
+
+    Supports exact matches on status, payment status, payment method, user and
+    customer ids, and a ``created_after`` / ``created_before`` range. Dates
+    without a time include the whole day.
+    """
+    for name in EXACT_FILTERS:
+        if params.get(name):
+            queryset = queryset.filter(**{name: params[name]})
+
+    for name in ID_FILTERS:
+        if params.get(name):
+            if not params[name].isdigit():
+                raise ValidationError({name: 'Enter a valid id.'})
+            queryset = queryset.filter(**{f'{name}_id': int(params[name])})
+
+    if params.get('created_after'):
+        queryset = queryset.filter(created_at__gte=parse_datetime_param('created_after', params['created_after']))
+    if params.get('created_before'):
+        queryset = queryset.filter(
+            created_at__lt=parse_datetime_param('created_before', params['created_before'], end_of_day=True)
+        )
+
+    return queryset
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.orders.archive import archive_cutoff, archive_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed and cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS to the archive tables. "
+        "Safe to interrupt and re-run while the shop is open."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None)
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between batches to leave room for live traffic.")
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['days'])
+        self.stdout.write(f"Archiving closed orders created before {cutoff:%Y-%m-%d %H:%M}")
+
+        def progress(stats):
+            self.stdout.write(
+                f"batch {stats['batches']}: {stats['orders']} orders, {stats['items']} items, "
+                f"{stats['orders_per_second']:.0f} orders/s"
+            )
+
+        stats = archive_orders(cutoff, batch_size=options['batch_size'], max_batches=options['max_batches'],
+                               pause=options['pause'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {stats['orders']} orders and {stats['items']} items in {stats['seconds']:.1f}s"
+        ))
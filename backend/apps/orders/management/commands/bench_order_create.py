@@ -0,0 +1,57 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.orders.models import Order, OrderItem
+from apps.orders.services import create_order
+
+
+class Command(BaseCommand):
+    help = "Benchmark bulk order creation against the per-item OrderItem.save() path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=50, help="Orders to create per path")
+        parser.add_argument('--lines', type=int, default=40, help="Line items per order")
+
+    def handle(self, *args, **options):
+        items = [
+            {
+                'product_name': f'Product {i}',
+                'product_id': i,
+                'product_type': 'inventory',
+                'quantity': 1 + i % 3,
+                'unit_price': Decimal('4.50'),
+            }
+            for i in range(options['lines'])
+        ]
+
+        # Everything is rolled back so the benchmark leaves no rows behind.
+        with transaction.atomic():
+            legacy = self.run(options['orders'], lambda: self.create_per_item(items))
+            bulk = self.run(options['orders'], lambda: create_order(items, tax_amount=Decimal('1.00')))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{options['orders']} orders x {options['lines']} lines")
+        for label, (elapsed, queries) in (('per-item save', legacy), ('bulk create', bulk)):
+            self.stdout.write(
+                f"{label:>14}: {elapsed * 1000 / options['orders']:8.2f} ms/order "
+                f"{queries / options['orders']:8.1f} queries/order"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {legacy[0] / bulk[0]:.1f}x"))
+
+    def run(self, count, create):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            for _ in range(count):
+                create()
+            elapsed = time.perf_counter() - start
+        return elapsed, len(ctx.captured_queries)
+
+    def create_per_item(self, items):
+        order = Order.objects.create(total_amount=0, tax_amount=Decimal('1.00'))
+        for item in items:
+            OrderItem.objects.create(order=order, **item)
+        return order
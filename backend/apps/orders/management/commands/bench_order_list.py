@@ -0,0 +1,71 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.orders.models import Order
+from apps.orders.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark keyset against offset pagination of the order list at increasing depths. "
+        "Synthetic orders are inserted inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=KeysetPagination.page_size)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        total = options['orders']
+        page_size = options['page_size']
+
+        with transaction.atomic():
+            self.stdout.write(f"Inserting {total} orders...")
+            self.populate(total)
+
+            self.stdout.write(f"{'depth':>10} {'offset ms':>10} {'keyset ms':>10}")
+            for fraction in (0, 0.01, 0.1, 0.5, 0.9, 0.99):
+                depth = int(total * fraction)
+                offset_ms = self.time(options['repeat'], lambda: list(
+                    Order.objects.order_by('-created_at', '-id')[depth:depth + page_size]
+                ))
+
+                position = None
+                if depth:
+                    anchor = Order.objects.order_by('-created_at', '-id').values('created_at', 'pk')[depth - 1]
+                    position = (anchor['created_at'], anchor['pk'])
+                keyset_ms = self.time(options['repeat'], lambda: list(
+                    KeysetPagination.get_page_queryset(Order.objects.all(), position, page_size)
+                ))
+                self.stdout.write(f"{depth:>10} {offset_ms:>10.2f} {keyset_ms:>10.2f}")
+
+            transaction.set_rollback(True)
+
+    def populate(self, total, batch_size=5000):
+        start = timezone.now() - timezone.timedelta(days=365)
+        step = timezone.timedelta(days=365) / total
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        for offset in range(0, total, batch_size):
+            Order.objects.bulk_create([
+                Order(
+                    order_number=f'BENCH-{i:010d}',
+                    status=statuses[i % len(statuses)],
+                    total_amount=Decimal('10.00'),
+                    created_at=start + step * i,
+                )
+                for i in range(offset, min(offset + batch_size, total))
+            ])
+
+    def time(self, repeat, query):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
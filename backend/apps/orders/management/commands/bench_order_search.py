@@ -0,0 +1,67 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.orders.models import Order, Customer, SearchToken
+from apps.orders.search import search, order_tokens, customer_tokens, build_tokens
+
+FIRST_NAMES = ('ann', 'bob', 'carla', 'dmitri', 'eve', 'farah', 'gus', 'hana', 'ivan', 'jo')
+LAST_NAMES = ('lee', 'smith', 'garcia', 'nguyen', 'okafor', 'rossi', 'tanaka', 'weber')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark typeahead latency over synthetic orders and customers. "
+        "Rows are inserted inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        total = options['orders']
+        with transaction.atomic():
+            self.stdout.write(f"Inserting {total} orders and {total // 4} customers...")
+            self.populate(total)
+
+            queries = ['ann', 'ann lee', 'okaf', '12345', '0000099', '5550', 'garcia@', 'zzzz']
+            self.stdout.write(f"{'query':>10} {'results':>8} {'median ms':>10} {'p95 ms':>8}")
+            for query in queries:
+                samples = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    results = search(query)
+                    samples.append((time.perf_counter() - started) * 1000)
+                samples.sort()
+                p95 = samples[int(len(samples) * 0.95) - 1]
+                self.stdout.write(f"{query:>10} {len(results):>8} {statistics.median(samples):>10.2f} {p95:>8.2f}")
+
+            transaction.set_rollback(True)
+
+    def populate(self, total, batch_size=5000):
+        for offset in range(0, total // 4, batch_size):
+            customers = Customer.objects.bulk_create([
+                Customer(
+                    name=f"{FIRST_NAMES[i % 10].title()} {LAST_NAMES[i % 8].title()}",
+                    email=f"{FIRST_NAMES[i % 10]}.{LAST_NAMES[i % 8]}{i}@example.com",
+                    phone=f"555{i:07d}",
+                )
+                for i in range(offset, min(offset + batch_size, total // 4))
+            ])
+            SearchToken.objects.bulk_create(
+                [token for customer in customers for token in build_tokens(customer_tokens(customer), customer_id=customer.pk)],
+                batch_size=batch_size,
+            )
+        for offset in range(0, total, batch_size):
+            orders = Order.objects.bulk_create([
+                Order(order_number=f'BENCH-{i:010d}', total_amount=Decimal('10.00'))
+                for i in range(offset, min(offset + batch_size, total))
+            ])
+            SearchToken.objects.bulk_create(
+                [token for order in orders for token in build_tokens(order_tokens(order), order_id=order.pk)],
+                batch_size=batch_size,
+            )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.orders.customers import find_duplicate_customers, merge_customers
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold guest customers without an email that share a phone number into the oldest of them, "
+        "re-pointing their orders. Customers with an email are unique by email already."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report duplicates without merging them.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        duplicates = find_duplicate_customers()
+        count = sum(len(dups) for dups in duplicates.values())
+        self.stdout.write(f"Found {count} duplicates of {len(duplicates)} customers")
+        if options['dry_run'] or not count:
+            return
+
+        moved, removed = merge_customers(duplicates, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} orders and removed {removed} customers"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.orders.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the order and customer typeahead search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        counts = {}
+
+        def progress(model):
+            counts[model._meta.verbose_name_plural] = counts.get(model._meta.verbose_name_plural, 0) + 1
+
+        rebuild_search_index(batch_size=options['batch_size'], progress=progress)
+        summary = ', '.join(f"{count} {name}" for name, count in counts.items()) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(f"Indexed {summary}"))
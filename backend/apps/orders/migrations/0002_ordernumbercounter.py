@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:38
+
+from django.db import migrations, models
+
+
+def create_order_counter(apps, schema_editor):
+    OrderNumberCounter = apps.get_model('orders', 'OrderNumberCounter')
+    OrderNumberCounter.objects.get_or_create(name='order', defaults={'next_value': 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_order_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_ordernumbercounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client-generated key used to de-duplicate offline uploads', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:50
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def normalize_phone(phone):
+    digits = ''.join(char for char in (phone or '') if char.isdigit())
+    return digits[2:] if digits.startswith('00') else digits
+
+
+def fill_lookup_keys(apps, schema_editor):
+    """Compute lookup keys and fold customers sharing an email into the oldest."""
+    Customer = apps.get_model('orders', 'Customer')
+    Order = apps.get_model('orders', 'Order')
+
+    customers = []
+    keepers = {}
+    duplicates = defaultdict(list)
+    for customer in Customer.objects.only('id', 'email', 'phone').order_by('pk').iterator(chunk_size=2000):
+        customer.email_key = normalize_email(customer.email)
+        customer.phone_key = normalize_phone(customer.phone)
+        if customer.email_key and customer.email_key in keepers:
+            duplicates[keepers[customer.email_key]].append(customer.pk)
+            continue
+        if customer.email_key:
+            keepers[customer.email_key] = customer.pk
+        customers.append(customer)
+    Customer.objects.bulk_update(customers, ['email_key', 'phone_key'], batch_size=500)
+
+    keeper_of = {dup: keeper for keeper, dups in duplicates.items() for dup in dups}
+    dup_ids = list(keeper_of)
+    for start in range(0, len(dup_ids), 500):
+        batch = dup_ids[start:start + 500]
+        Order.objects.filter(customer_id__in=batch).update(
+            customer_id=Case(*[When(customer_id=dup, then=Value(keeper_of[dup])) for dup in batch])
+        )
+        Customer.objects.filter(pk__in=batch).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='email_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('phone_key', ''), _negated=True), fields=['phone_key'], name='customer_phone_key_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(condition=models.Q(('email_key', ''), _negated=True), fields=('email_key',), name='customer_unique_email_key', violation_error_message='A customer with this email already exists.'),
+        ),
+    ]
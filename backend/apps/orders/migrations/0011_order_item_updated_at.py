@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['updated_at', 'id'], name='order_item_updated_idx'),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
-import uuid
+from django.utils import timezone
+from .numbering import allocate_order_number
 
 class Customer(models.Model):
     """
@@ -13,8 +14,61 @@ class Customer(models.Model):
     address = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Normalized lookup keys used to recognise returning guests.
+    email_key = models.CharField(max_length=254, blank=True, default='', editable=False)
+    phone_key = models.CharField(max_length=20, blank=True, default='', editable=False)
+    
     def __str__(self):
         return self.name
+    
+    def clean(self):
+        # Set the keys before constraints are validated by model forms.
+        self.set_lookup_keys()
+    
+    def save(self, *args, **kwargs):
+        self.set_lookup_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'email', 'phone'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'email_key', 'phone_key'}
+        super().save(*args, **kwargs)
+    
+    def set_lookup_keys(self):
+        self.email_key = self.normalize_email(self.email)
+        self.phone_key = self.normalize_phone(self.phone)
+    
+    @staticmethod
+    def normalize_email(email):
+        """Return the lookup key for an email address."""
+        return (email or '').strip().lower()
+    
+    @staticmethod
+    def normalize_phone(phone):
+        """Return the lookup key for a phone number: its digits, without a leading 00."""
+        digits = ''.join(char for char in (phone or '') if char.isdigit())
+        return digits[2:] if digits.startswith('00') else digits
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['email_key'],
+                condition=~models.Q(email_key=''),
+                name='customer_unique_email_key',
+                violation_error_message="A customer with this email already exists.",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['phone_key'], condition=~models.Q(phone_key=''), name='customer_phone_key_idx'),
+        ]
+
+class OrderNumberCounter(models.Model):
+    """
+    Counter from which order number blocks are reserved.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
 
 class Order(models.Model):
     """
@@ -49,6 +103,8 @@ class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, related_name='orders', null=True, blank=True)
     
     order_number = models.CharField(max_length=20, unique=True, editable=False)
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True,
+                                       help_text="Client-generated key used to de-duplicate offline uploads")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
@@ -59,7 +115,9 @@ class Order(models.Model):
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
     
     notes = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add so orders synced from offline devices
+    # keep their time of sale.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -72,7 +130,7 @@ class Order(models.Model):
     
     def generate_order_number(self):
         """Generate a unique order number."""
-        return f"ORD-{uuid.uuid4().hex[:8].upper()}"
+        return allocate_order_number()
     
     def calculate_total(self):
         """Calculate the total amount from order items."""
@@ -87,6 +145,32 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        # Composite indexes matching the keyset pagination order of the order list.
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+            models.Index(fields=['payment_status', '-created_at', '-id'], name='order_payment_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['customer', '-created_at', '-id'], name='order_customer_created_idx'),
+            # Watermark order of the incremental columnar export; see apps.analytics.columnar.
+            models.Index(fields=['updated_at', 'id'], name='order_updated_idx'),
+        ]
+
+class OrderTransition(models.Model):
+    """
+    Append-only log of order status changes.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='transitions')
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    performed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.order_id}: {self.from_status} -> {self.to_status}"
+    
+    class Meta:
+        ordering = ['id']
 
 class OrderItem(models.Model):
     """
@@ -99,6 +183,9 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    # Set when the row is written, unlike the order's created_at which
+    # offline devices backdate; the columnar export is ordered by it.
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.quantity} x {self.product_name}"
@@ -112,3 +199,95 @@ class OrderItem(models.Model):
     
     class Meta:
         ordering = ['id']
+        indexes = [
+            # Watermark order of the incremental columnar export; see apps.analytics.columnar.
+            models.Index(fields=['updated_at', 'id'], name='order_item_updated_idx'),
+        ]
+
+class SearchToken(models.Model):
+    """
+    Normalized search keys for the cashier typeahead.
+
+    Each row points at either an order or a customer. Lookups are prefix
+    range scans on ``token``; see ``apps.orders.search``.
+    """
+    token = models.CharField(max_length=64)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    
+    def __str__(self):
+        return self.token
+    
+    class Meta:
+        indexes = [models.Index(fields=['token'], name='search_token_idx')]
+
+class ArchivedOrder(models.Model):
+    """
+    Closed order moved out of the live ``Order`` table; see ``apps.orders.archive``.
+
+    Rows keep their original primary key and field values.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, related_name='archived_orders', null=True, blank=True)
+    
+    order_number = models.CharField(max_length=20, unique=True)
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    
+    payment_method = models.CharField(max_length=20, choices=Order.PAYMENT_METHOD_CHOICES)
+    payment_status = models.CharField(max_length=20, choices=Order.PAYMENT_STATUS_CHOICES)
+    
+    notes = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Order #{self.order_number} (archived)"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='archived_order_created_idx'),
+        ]
+
+class ArchivedOrderItem(models.Model):
+    """
+    Item of an archived order.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product_name = models.CharField(max_length=200)
+    product_id = models.PositiveIntegerField()
+    product_type = models.CharField(max_length=50)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name}"
+    
+    class Meta:
+        ordering = ['id']
+
+class ArchivedOrderTransition(models.Model):
+    """
+    Status change log entry of an archived order.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='transitions')
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    performed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.order_id}: {self.from_status} -> {self.to_status}"
+    
+    class Meta:
+        ordering = ['id']
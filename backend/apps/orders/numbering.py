@@ -0,0 +1,153 @@
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.module_loading import import_string
+
+ORDER_NUMBER_PREFIX = 'ORD-'
+
+
+class UUIDOrderNumberAllocator:
+    """
+    Legacy allocator returning eight random hex characters.
+
+    Kept for compatibility only: 32 bits of randomness will eventually
+    collide on the unique ``order_number`` column.
+    """
+
+    def allocate(self):
+        return f"{ORDER_NUMBER_PREFIX}{uuid.uuid4().hex[:8].upper()}"
+
+    def allocate_many(self, count):
+        return [self.allocate() for _ in range(count)]
+
+
+class BlockOrderNumberAllocator:
+    """
+    Allocator handing out monotonically increasing order numbers.
+
+    Each process reserves a block of numbers from the ``OrderNumberCounter``
+    row with one atomic increment and then issues numbers from memory, so
+    allocation costs no round trip until the block is exhausted and two
+    processes can never be handed the same number. Numbers are zero-padded
+    to ten digits, which keeps them distinct from legacy eight character
+    random numbers.
+    """
+    counter_name = 'order'
+    width = 10
+
+    def __init__(self, block_size=None, using=DEFAULT_DB_ALIAS):
+        self.block_size = block_size or getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 1000)
+        self.using = using
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._next = 0
+        self._end = 0
+
+    def format(self, number):
+        return f"{ORDER_NUMBER_PREFIX}{number:0{self.width}d}"
+
+    def allocate(self):
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count):
+        """Allocate ``count`` order numbers, reserving new blocks as needed."""
+        numbers = []
+        with self._lock:
+            # A forked worker inherits the parent's block; it must not reuse it.
+            if self._pid != os.getpid():
+                self._reset()
+
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    connection = connections[self.using]
+                    if connection.vendor == 'sqlite' and connection.in_atomic_block:
+                        # SQLite can't reserve on a second connection while this one
+                        # may hold the write lock, and a reservation made inside the
+                        # caller's transaction is undone if it rolls back. Take only
+                        # what is needed now and leave nothing cached.
+                        start, end = self.reserve(connection, count - len(numbers))
+                        numbers.extend(range(start, end))
+                        break
+                    self._next, self._end = self.reserve_block(max(self.block_size, count - len(numbers)))
+
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+
+        return [self.format(number) for number in numbers]
+
+    def reserve_block(self, size):
+        """Reserve ``size`` numbers in a committed transaction of their own."""
+        connection = connections[self.using]
+        if not connection.in_atomic_block:
+            return self.reserve(connection, size)
+
+        # Reserve on a dedicated connection so the block survives a rollback
+        # of the caller's transaction.
+        connection = connections.create_connection(self.using)
+        try:
+            return self.reserve(connection, size)
+        finally:
+            connection.close()
+
+    def reserve(self, connection, size):
+        """Increment the counter by ``size`` and return the reserved range."""
+        from .models import OrderNumberCounter
+
+        table = connection.ops.quote_name(OrderNumberCounter._meta.db_table)
+        in_atomic_block = connection.in_atomic_block
+        if not in_atomic_block:
+            connection.set_autocommit(False)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET next_value = next_value + %s WHERE name = %s",
+                    [size, self.counter_name],
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute(
+                        f"INSERT INTO {table} (name, next_value) VALUES (%s, %s)",
+                        [self.counter_name, 1 + size],
+                    )
+                cursor.execute(f"SELECT next_value FROM {table} WHERE name = %s", [self.counter_name])
+                end = cursor.fetchone()[0]
+            if not in_atomic_block:
+                connection.commit()
+        except Exception:
+            if not in_atomic_block:
+                connection.rollback()
+            raise
+        finally:
+            if not in_atomic_block:
+                connection.set_autocommit(True)
+        return end - size, end
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_order_number_allocator():
+    """Return the process-wide allocator configured by ``ORDER_NUMBER_ALLOCATOR``."""
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = import_string(settings.ORDER_NUMBER_ALLOCATOR)()
+    return _allocator
+
+
+def allocate_order_number():
+    """Allocate a single order number."""
+    return get_order_number_allocator().allocate()
+
+
+def allocate_order_numbers(count):
+    """Allocate ``count`` order numbers at once."""
+    return get_order_number_allocator().allocate_many(count)
@@ -0,0 +1,79 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over ``(created_at, id)``, newest first.
+
+    Each page continues strictly after the last row of the previous one, so
+    fetching a page is an index range scan no matter how deep it is, unlike
+    offset pagination which has to skip every earlier row.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        rows = list(self.get_page_queryset(queryset, self.decode_cursor(request), page_size))
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    @staticmethod
+    def get_page_queryset(queryset, position, page_size):
+        """Return the rows after ``position`` plus one more to detect a next page."""
+        if position is not None:
+            created_at, pk = position
+            # The leading created_at bound lets the planner seek into the index.
+            queryset = queryset.filter(
+                Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(pk__lt=pk))
+            )
+        return queryset.order_by('-created_at', '-id')[:page_size + 1]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.encode_cursor(last)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def encode_cursor(self, obj):
+        value = f"{obj.created_at.isoformat()}|{obj.pk}"
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            created_at = None
+        if created_at is None:
+            raise NotFound('Invalid cursor.')
+        return created_at, pk
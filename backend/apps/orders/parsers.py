@@ -0,0 +1,34 @@
+import io
+import zlib
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+
+class CompressedJSONParser(JSONParser):
+    """
+    JSON parser that also accepts gzip or deflate compressed request bodies.
+
+    The body is decompressed according to the ``Content-Encoding`` header, and
+    is capped at ``ORDER_SYNC_MAX_DECOMPRESSED_SIZE`` bytes.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').lower()
+        if stream is not None and encoding in ('gzip', 'deflate'):
+            stream = io.BytesIO(self.decompress(stream.read()))
+        return super().parse(stream, media_type, parser_context)
+
+    def decompress(self, data):
+        limit = settings.ORDER_SYNC_MAX_DECOMPRESSED_SIZE
+        # 32 + MAX_WBITS detects both gzip and zlib headers.
+        decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(data, limit + 1)
+        except zlib.error as exc:
+            raise ParseError(f'Invalid compressed body: {exc}')
+        if len(body) > limit or decompressor.unconsumed_tail:
+            raise ParseError('Decompressed body is too large.')
+        return body
@@ -0,0 +1,227 @@
+"""
+Typeahead search over order numbers and customer names, emails and phones.
+
+Every searchable value is broken into normalized tokens (lowercase
+alphanumerics) stored in ``SearchToken``. A keystroke becomes a prefix range
+scan on the token index (``token >= q AND token < q'``) followed by a
+``LIMIT``, so lookups cost the same on a few million rows as on a few
+hundred. Substring matching on order numbers and trailing-digit matching
+on phone numbers are handled by also indexing their suffixes.
+
+Tokens are kept in sync by ``post_save`` receivers and, for bulk inserts, the
+``orders_created`` signal; ``rebuild_search_index`` rebuilds them from
+scratch.
+
+Only live orders are searchable: archiving an order deletes its tokens with
+it (see ``apps.orders.archive``). Archived orders are found by their exact
+number with ``archive.find_order``.
+"""
+import re
+
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Order, Customer, SearchToken
+from .signals import orders_created
+
+TOKEN_MAX_LENGTH = 64
+MIN_SUFFIX_LENGTH = 3
+MIN_PHONE_SUFFIX_LENGTH = 4
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Candidate tokens read for the leading search term before ranking.
+CANDIDATE_LIMIT = 200
+
+_split = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(value):
+    """Lowercase ``value`` and split it into alphanumeric words."""
+    return [word for word in _split.split((value or '').lower()) if word]
+
+
+def suffixes(value, min_length):
+    return {value[start:] for start in range(0, max(len(value) - min_length, 0) + 1)}
+
+
+def order_tokens(order):
+    """Tokens for an order: every suffix of its number, so fragments match."""
+    tokens = set()
+    for word in normalize(order.order_number):
+        tokens |= suffixes(word, MIN_SUFFIX_LENGTH)
+    tokens.add(''.join(normalize(order.order_number)))
+    return tokens
+
+
+def customer_tokens(customer):
+    """Tokens for a customer: name words, email parts and phone number suffixes."""
+    tokens = set(normalize(customer.name))
+    if customer.email:
+        local_part = customer.email.lower().partition('@')[0]
+        tokens.update(normalize(local_part))
+        tokens.add(''.join(normalize(local_part)))
+        tokens.add(''.join(normalize(customer.email)))
+    digits = re.sub(r'\D', '', customer.phone or '')
+    if digits:
+        tokens |= suffixes(digits, MIN_PHONE_SUFFIX_LENGTH)
+    return tokens
+
+
+def build_tokens(tokens, **target):
+    return [SearchToken(token=token[:TOKEN_MAX_LENGTH], **target) for token in tokens if token]
+
+
+def index_orders(orders, replace=True):
+    """Index ``orders``, replacing their existing tokens unless they are new."""
+    orders = list(orders)
+    if replace:
+        SearchToken.objects.filter(order__in=[order.pk for order in orders]).delete()
+    SearchToken.objects.bulk_create(
+        [token for order in orders for token in build_tokens(order_tokens(order), order_id=order.pk)],
+        batch_size=1000,
+    )
+
+
+def index_customers(customers, replace=True):
+    """Index ``customers``, replacing their existing tokens unless they are new."""
+    customers = list(customers)
+    if replace:
+        SearchToken.objects.filter(customer__in=[customer.pk for customer in customers]).delete()
+    SearchToken.objects.bulk_create(
+        [token for customer in customers for token in build_tokens(customer_tokens(customer), customer_id=customer.pk)],
+        batch_size=1000,
+    )
+
+
+def _prefix_range(term):
+    """Return the ``[low, high)`` range of tokens starting with ``term``."""
+    return term, term[:-1] + chr(ord(term[-1]) + 1)
+
+
+def _term_q(term):
+    low, high = _prefix_range(term)
+    return Q(token__gte=low, token__lt=high)
+
+
+def _score(token, term):
+    # Exact token matches rank above prefix matches; shorter tokens above longer.
+    return token == term, -len(token)
+
+
+def _best_scores(rows, term):
+    matches = {}
+    for token, order_id, customer_id in rows:
+        key = ('order', order_id) if order_id else ('customer', customer_id)
+        score = _score(token, term)
+        if key not in matches or score > matches[key]:
+            matches[key] = score
+    return matches
+
+
+def _matches(terms):
+    """
+    Score the orders and customers with a token matching every term.
+
+    The longest term, usually the most selective, drives the prefix range
+    scan; each candidate token is kept only if its order or customer also
+    has a token matching every other term (an ``EXISTS`` on the foreign key
+    index), so ``CANDIDATE_LIMIT`` applies after the terms are intersected.
+    """
+    terms = sorted(terms, key=len, reverse=True)
+    leading, others = terms[0], terms[1:]
+    candidates = SearchToken.objects.filter(_term_q(leading))
+    for term in others:
+        matching = SearchToken.objects.filter(_term_q(term))
+        candidates = candidates.filter(
+            (Q(order__isnull=False) & Exists(matching.filter(order_id=OuterRef('order_id'))))
+            | (Q(customer__isnull=False) & Exists(matching.filter(customer_id=OuterRef('customer_id'))))
+        )
+    matches = _best_scores(
+        candidates.order_by('token').values_list('token', 'order_id', 'customer_id')[:CANDIDATE_LIMIT], leading
+    )
+
+    order_ids = [pk for kind, pk in matches if kind == 'order']
+    customer_ids = [pk for kind, pk in matches if kind == 'customer']
+    for term in others:
+        scores = _best_scores(SearchToken.objects.filter(
+            _term_q(term), Q(order_id__in=order_ids) | Q(customer_id__in=customer_ids)
+        ).values_list('token', 'order_id', 'customer_id'), term)
+        matches = {key: min(score, scores[key]) for key, score in matches.items() if key in scores}
+    return matches
+
+
+def search(query, limit=DEFAULT_LIMIT):
+    """
+    Return up to ``limit`` live orders and customers matching ``query``.
+
+    Every word of the query must prefix-match a token of the result.
+    """
+    terms = normalize(query)[:4]
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    matches = _matches([term[:TOKEN_MAX_LENGTH] for term in terms])
+    ranked = sorted(matches, key=lambda key: matches[key], reverse=True)[:limit]
+
+    order_ids = [pk for kind, pk in ranked if kind == 'order']
+    customer_ids = [pk for kind, pk in ranked if kind == 'customer']
+    orders = {
+        row['id']: row for row in Order.objects.filter(pk__in=order_ids).values(
+            'id', 'order_number', 'status', 'total_amount', 'created_at', 'customer__name'
+        )
+    }
+    customers = {
+        row['id']: row for row in Customer.objects.filter(pk__in=customer_ids).values(
+            'id', 'name', 'email', 'phone'
+        )
+    }
+
+    results = []
+    for kind, pk in ranked:
+        row = orders.get(pk) if kind == 'order' else customers.get(pk)
+        if row is not None:
+            results.append({'type': kind, **row})
+    return results
+
+
+@receiver(post_save, sender=Order)
+def index_saved_order(sender, instance, created, **kwargs):
+    """Index new orders; the order number never changes afterwards."""
+    if created:
+        index_orders([instance], replace=False)
+
+
+@receiver(post_save, sender=Customer)
+def index_saved_customer(sender, instance, created, update_fields=None, **kwargs):
+    """Reindex a customer when a searchable field may have changed."""
+    if created or update_fields is None or {'name', 'email', 'phone'} & set(update_fields):
+        index_customers([instance], replace=not created)
+
+
+@receiver(orders_created)
+def index_created_orders(sender, orders, customers=(), **kwargs):
+    """Index orders and customers created in bulk."""
+    index_orders(orders, replace=False)
+    if customers:
+        index_customers(customers, replace=False)
+
+
+def rebuild_search_index(batch_size=2000, progress=None):
+    """Rebuild all search tokens from the order and customer tables."""
+    SearchToken.objects.all().delete()
+    sources = (
+        (Order.objects.only('id', 'order_number'), order_tokens, 'order_id'),
+        (Customer.objects.only('id', 'name', 'email', 'phone'), customer_tokens, 'customer_id'),
+    )
+    for queryset, tokens_for, target in sources:
+        batch = []
+        for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+            batch.extend(build_tokens(tokens_for(obj), **{target: obj.pk}))
+            if len(batch) >= batch_size:
+                SearchToken.objects.bulk_create(batch, batch_size=1000)
+                batch = []
+            if progress:
+                progress(queryset.model)
+        SearchToken.objects.bulk_create(batch, batch_size=1000)
@@ -0,0 +1,136 @@
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework import serializers
+from .models import Order, OrderItem, Customer, ArchivedOrder
+from .services import create_order, sync_orders
+
+
+class CustomerSerializer(serializers.ModelSerializer):
+    """Serializer for guest customers."""
+
+    class Meta:
+        model = Customer
+        fields = ('id', 'name', 'email', 'phone', 'address')
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    """Serializer for order line items."""
+
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'product_name', 'product_id', 'product_type', 'quantity', 'unit_price', 'subtotal')
+        read_only_fields = ('id', 'subtotal')
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    """Serializer for reading orders with their items."""
+    customer = CustomerSerializer(read_only=True)
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'order_number', 'user', 'customer', 'status', 'total_amount', 'tax_amount',
+                  'discount_amount', 'payment_method', 'payment_status', 'notes', 'items',
+                  'created_at', 'updated_at')
+        read_only_fields = fields
+
+
+class ArchivedOrderSerializer(OrderSerializer):
+    """Serializer for reading archived orders with their items."""
+
+    class Meta(OrderSerializer.Meta):
+        model = ArchivedOrder
+        fields = OrderSerializer.Meta.fields + ('archived_at',)
+        read_only_fields = fields
+
+
+class OrderCreateSerializer(serializers.ModelSerializer):
+    """Serializer for creating an order and all of its items in one request."""
+    customer = CustomerSerializer(required=False)
+    customer_id = serializers.PrimaryKeyRelatedField(
+        queryset=Customer.objects.all(), source='existing_customer', required=False
+    )
+    items = OrderItemSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        model = Order
+        fields = ('customer', 'customer_id', 'status', 'tax_amount', 'discount_amount',
+                  'payment_method', 'payment_status', 'notes', 'items')
+
+    def validate(self, attrs):
+        """Validate the customer selection and that the total is not negative."""
+        if 'customer' in attrs and 'existing_customer' in attrs:
+            raise serializers.ValidationError("Provide either customer or customer_id, not both.")
+
+        item_total = sum(
+            (item.get('quantity', 1) * item['unit_price'] for item in attrs['items']), Decimal('0')
+        )
+        tax_amount = attrs.get('tax_amount', Decimal('0'))
+        discount_amount = attrs.get('discount_amount', Decimal('0'))
+        if item_total + tax_amount - discount_amount < 0:
+            raise serializers.ValidationError({"discount_amount": "Discount cannot exceed the order total."})
+        return attrs
+
+    def create(self, validated_data):
+        """Create the order through the bulk order service."""
+        items = validated_data.pop('items')
+        customer_data = validated_data.pop('customer', None)
+        customer = validated_data.pop('existing_customer', None)
+        user = None if customer or customer_data else self.context['request'].user
+
+        return create_order(items, user=user, customer=customer, customer_data=customer_data, **validated_data)
+
+
+class SyncOrderSerializer(OrderCreateSerializer):
+    """Serializer for a single order uploaded by an offline POS device."""
+    # Declared explicitly so validation doesn't run a uniqueness query per order;
+    # duplicates are resolved in bulk by the sync service.
+    idempotency_key = serializers.CharField(max_length=64)
+    created_at = serializers.DateTimeField(required=False)
+    customer_id = None
+
+    class Meta(OrderCreateSerializer.Meta):
+        fields = ('idempotency_key', 'created_at', 'customer', 'status', 'tax_amount', 'discount_amount',
+                  'payment_method', 'payment_status', 'notes', 'items')
+
+
+class OrderSyncSerializer(serializers.Serializer):
+    """Serializer for a batch of offline orders; each order is validated on its own."""
+    orders = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_orders(self, value):
+        """Limit the number of orders accepted in one upload."""
+        limit = settings.ORDER_SYNC_MAX_ORDERS
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} orders can be synced per request.")
+        return value
+
+    def save(self):
+        """Validate each order and ingest the valid ones, returning per-order results."""
+        # One child instance is reused so its fields are only built once.
+        child = SyncOrderSerializer(context=self.context)
+        results = []
+        valid = []
+        for data in self.validated_data['orders']:
+            try:
+                valid.append(child.run_validation(data))
+                results.append(None)
+            except serializers.ValidationError as exc:
+                results.append({'idempotency_key': data.get('idempotency_key'), 'status': 'invalid',
+                                'errors': exc.detail})
+
+        synced = iter(sync_orders(valid, user=self.context['request'].user) if valid else [])
+        return [next(synced) if result is None else result for result in results]
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    """Serializer for a single requested status change."""
+    order = serializers.IntegerField()
+    to_status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    expected_status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+
+
+class OrderTransitionBatchSerializer(serializers.Serializer):
+    """Serializer for a batch of status changes."""
+    transitions = OrderTransitionSerializer(many=True, allow_empty=False, max_length=1000)
@@ -0,0 +1,145 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+
+from .customers import resolve_customer, resolve_customers
+from .models import Order, OrderItem, ArchivedOrder
+from .numbering import allocate_order_number, allocate_order_numbers
+from .signals import order_items_created, orders_created
+
+# Keeps IN (...) lists below SQLite's bound parameter limit.
+LOOKUP_BATCH_SIZE = 500
+
+
+def build_order_items(items):
+    """Build unsaved OrderItem instances with their subtotals filled in."""
+    order_items = []
+    for item in items:
+        order_item = OrderItem(
+            product_name=item['product_name'],
+            product_id=item['product_id'],
+            product_type=item['product_type'],
+            quantity=item.get('quantity', 1),
+            unit_price=item['unit_price'],
+        )
+        order_item.subtotal = order_item.quantity * Decimal(order_item.unit_price)
+        order_items.append(order_item)
+    return order_items
+
+
+def compute_order_total(order_items, tax_amount=0, discount_amount=0):
+    """Compute an order total in memory from unsaved order items."""
+    item_total = sum((item.subtotal for item in order_items), Decimal('0'))
+    return item_total + Decimal(tax_amount) - Decimal(discount_amount)
+
+
+def create_order(items, user=None, customer=None, customer_data=None, **order_fields):
+    """
+    Create an order together with all of its items.
+
+    Subtotals and the order total are computed once in memory and the items
+    are written with a single bulk insert, so the number of queries does not
+    grow with the number of lines (``OrderItem.save()`` recalculates the
+    order total after every line).
+    """
+    order_items = build_order_items(items)
+    order = Order(user=user, customer=customer, **order_fields)
+    order.total_amount = compute_order_total(order_items, order.tax_amount, order.discount_amount)
+    # Allocate before the transaction so a block reservation never waits on it.
+    order.order_number = allocate_order_number()
+
+    with transaction.atomic():
+        if customer_data is not None:
+            order.customer = resolve_customer(**customer_data)
+        order.save()
+        for order_item in order_items:
+            order_item.order = order
+        OrderItem.objects.bulk_create(order_items)
+        order_items_created.send(sender=OrderItem, items=order_items)
+
+    return order
+
+
+def find_synced_orders(keys):
+    """Return a mapping of idempotency key to order number for known keys, archived or not."""
+    keys = list(keys)
+    found = {}
+    for model in (Order, ArchivedOrder):
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            found.update(
+                model.objects.filter(idempotency_key__in=keys[start:start + LOOKUP_BATCH_SIZE])
+                .values_list('idempotency_key', 'order_number')
+            )
+    return found
+
+
+def sync_orders(orders, user=None):
+    """
+    Ingest a batch of validated offline orders.
+
+    Each order carries a client-generated ``idempotency_key``; keys that were
+    already ingested (or repeated within the batch) are reported as
+    duplicates instead of being inserted twice. Guest customers are matched
+    to existing ones by email or phone; new customers, orders and items are
+    written with one bulk insert per table inside a single transaction. Returns one result per input order, in input order.
+    """
+    for attempt in range(2):
+        try:
+            return _sync_orders(orders, user)
+        except IntegrityError:
+            # A concurrent upload inserted one of our keys after we looked
+            # them up; the retry reports it as a duplicate.
+            if attempt:
+                raise
+
+
+def _sync_orders(orders, user):
+    existing = find_synced_orders(order['idempotency_key'] for order in orders)
+    results = []
+    pending = {}
+    for data in orders:
+        key = data['idempotency_key']
+        if key in existing or key in pending:
+            results.append({'idempotency_key': key, 'status': 'duplicate', 'order_number': existing.get(key)})
+        else:
+            pending[key] = data
+            results.append({'idempotency_key': key, 'status': 'created', 'order_number': None})
+
+    if not pending:
+        return results
+
+    new_orders = []
+    customer_entries = []
+    new_items = []
+    for data, order_number in zip(pending.values(), allocate_order_numbers(len(pending))):
+        data = dict(data)
+        items = build_order_items(data.pop('items'))
+        customer_data = data.pop('customer', None)
+        client_created_at = data.pop('created_at', None)
+
+        order = Order(user=None if customer_data else user, order_number=order_number, **data)
+        order.total_amount = compute_order_total(items, order.tax_amount, order.discount_amount)
+        if customer_data:
+            customer_entries.append((order, customer_data))
+        if client_created_at:
+            order.created_at = client_created_at
+        for item in items:
+            item.order = order
+        new_orders.append(order)
+        new_items.extend(items)
+
+    # Related objects saved by a bulk insert are picked up by the next one.
+    with transaction.atomic():
+        customers, new_customers = resolve_customers(data for _, data in customer_entries)
+        for (order, _), customer in zip(customer_entries, customers):
+            order.customer = customer
+        Order.objects.bulk_create(new_orders, batch_size=LOOKUP_BATCH_SIZE)
+        OrderItem.objects.bulk_create(new_items, batch_size=LOOKUP_BATCH_SIZE)
+        orders_created.send(sender=Order, orders=new_orders, customers=new_customers)
+        order_items_created.send(sender=OrderItem, items=new_items)
+
+    order_numbers = {order.idempotency_key: order.order_number for order in new_orders}
+    for result in results:
+        if result['order_number'] is None:
+            result['order_number'] = order_numbers[result['idempotency_key']]
+    return results
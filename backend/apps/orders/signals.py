@@ -0,0 +1,21 @@
+from django.dispatch import Signal
+
+# Sent after commit once order statuses have changed through the transition
+# engine, which bypasses Order.save(). ``transitions`` is a list of
+# ``(order_id, from_status, to_status)`` tuples.
+order_status_changed = Signal()
+
+# Sent inside the creating transaction when orders are bulk inserted, which
+# bypasses post_save. ``orders`` are the saved Order instances and
+# ``customers`` the Customer rows created alongside them.
+orders_created = Signal()
+
+# Sent inside the creating transaction when order items are bulk inserted,
+# which bypasses post_save. ``items`` are the saved OrderItem instances, each
+# with its ``order`` set.
+order_items_created = Signal()
+
+# Sent inside the archiving transaction once a batch of orders has been
+# copied to the archive tables, just before it is deleted from the live
+# ones. ``order_ids`` are the ids of the archived orders.
+orders_archived = Signal()
@@ -1,3 +1,161 @@
-from django.test import TestCase
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .models import Order, OrderNumberCounter
+from .numbering import BlockOrderNumberAllocator
+from .pagination import KeysetPagination
+
+# Run in a separate interpreter per process: allocates from the database
+# file argv[1], starting once a line is read from stdin.
+ALLOCATOR_PROCESS = """
+import sys
+import django
+django.setup()
+from django.db import OperationalError, connections
+from apps.orders.numbering import BlockOrderNumberAllocator
+
+connections['default'].settings_dict['NAME'] = sys.argv[1]
+allocator = BlockOrderNumberAllocator(block_size=int(sys.argv[2]))
+print('ready', flush=True)
+sys.stdin.readline()
+numbers = []
+while len(numbers) < int(sys.argv[3]):
+    try:
+        numbers.append(allocator.allocate())
+    except OperationalError:
+        pass
+print(' '.join(numbers))
+"""
+
+
+class BlockOrderNumberAllocatorTests(TransactionTestCase):
+    """Numbers allocated from many threads and allocators at once never collide."""
+
+    def allocate_concurrently(self, allocators, threads, per_thread):
+        def work(allocator):
+            numbers = []
+            try:
+                while len(numbers) < per_thread:
+                    try:
+                        numbers.append(allocator.allocate())
+                    except OperationalError:
+                        pass  # SQLite gave up waiting for the write lock; nothing was reserved
+                return numbers
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(work, [allocators[i % len(allocators)] for i in range(threads)]))
+
+    def test_concurrent_allocations_are_unique_and_increasing(self):
+        # One allocator per simulated process; small blocks force frequent, contended reservations.
+        allocators = [BlockOrderNumberAllocator(block_size=5) for _ in range(3)]
+        sequences = self.allocate_concurrently(allocators, threads=6, per_thread=100)
+
+        numbers = [number for sequence in sequences for number in sequence]
+        self.assertEqual(len(numbers), 600)
+        self.assertEqual(len(set(numbers)), len(numbers))
+        for sequence in sequences:
+            self.assertEqual(sequence, sorted(sequence))
+
+    def test_concurrent_processes_never_share_a_number(self):
+        # The test database is in memory, so the processes share a database file of their own.
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, 'numbers.sqlite3')
+            file_connection = type(connections['default'])({**connection.settings_dict, 'NAME': database})
+            try:
+                with file_connection.schema_editor() as editor:
+                    editor.create_model(OrderNumberCounter)
+            finally:
+                file_connection.close()
+
+            env = {**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)}
+            processes = [
+                subprocess.Popen([sys.executable, '-c', ALLOCATOR_PROCESS, database, '5', '200'],
+                                 cwd=settings.BASE_DIR, env=env, text=True,
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+                for _ in range(4)
+            ]
+            try:
+                for process in processes:
+                    self.assertEqual(process.stdout.readline().strip(), 'ready')
+                # Released together so their reservations contend.
+                for process in processes:
+                    process.stdin.write('\n')
+                    process.stdin.flush()
+                outputs = [process.communicate(timeout=120)[0] for process in processes]
+            finally:
+                for process in processes:
+                    process.kill()
+                    process.wait()
+            self.assertEqual([process.returncode for process in processes], [0] * 4)
+
+        sequences = [[int(number.removeprefix('ORD-')) for number in output.split()] for output in outputs]
+        for sequence in sequences:
+            self.assertEqual(len(sequence), 200)
+            self.assertEqual(sequence, sorted(sequence))
+        # Every reserved block is used up, so together the processes cover the range exactly.
+        self.assertEqual(sorted(number for sequence in sequences for number in sequence), list(range(1, 801)))
+
+    def test_numbers_are_zero_padded(self):
+        numbers = BlockOrderNumberAllocator(block_size=2).allocate_many(3)
+        self.assertTrue(all(re.fullmatch(r'ORD-\d{10}', number) for number in numbers))
+        self.assertEqual(len(set(numbers)), 3)
+
+
+class KeysetPaginationTests(TestCase):
+    """Order list pages are index range scans that visit every order once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # Pairs of orders share a timestamp, so pages must break ties by id.
+        Order.objects.bulk_create([
+            Order(order_number=f'PAGE-{i:04d}', status='completed' if i % 3 else 'pending',
+                  payment_method='cash', total_amount=Decimal('1.00'),
+                  created_at=now - timezone.timedelta(minutes=i // 2))
+            for i in range(25)
+        ])
+
+    def test_list_queries_use_their_index(self):
+        now = timezone.now()
+        position = (now, 1000)
+        cases = [
+            ('first page', Order.objects.all(), None, 'order_created_idx'),
+            ('deep page', Order.objects.all(), position, 'order_created_idx'),
+            ('status', Order.objects.filter(status='pending'), position, 'order_status_created_idx'),
+            ('payment status', Order.objects.filter(payment_status='completed'), position,
+             'order_payment_created_idx'),
+            ('user', Order.objects.filter(user_id=1), position, 'order_user_created_idx'),
+            ('customer', Order.objects.filter(customer_id=1), position, 'order_customer_created_idx'),
+            ('status and date range',
+             Order.objects.filter(status='completed', created_at__gte=now - timezone.timedelta(days=30)),
+             position, 'order_status_created_idx'),
+        ]
+        for label, queryset, position, index in cases:
+            with self.subTest(label):
+                plan = KeysetPagination.get_page_queryset(queryset, position, KeysetPagination.page_size).explain()
+                self.assertIn(index, plan)
+
+    def test_pages_visit_every_order_once(self):
+        for queryset in (Order.objects.all(), Order.objects.filter(status='completed')):
+            expected = list(queryset.order_by('-created_at', '-id').values_list('pk', flat=True))
+            seen = []
+            position = None
+            while True:
+                rows = list(KeysetPagination.get_page_queryset(queryset, position, 4))
+                seen += [row.pk for row in rows[:4]]
+                if len(rows) <= 4:
+                    break
+                position = (rows[3].created_at, rows[3].pk)
+            self.assertEqual(seen, expected)
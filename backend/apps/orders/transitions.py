@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderTransition
+from .signals import order_status_changed
+
+# Orders move forward through this flow, optionally skipping steps (a retail
+# sale can go straight from pending to completed). Any open order can be
+# cancelled; completed and cancelled are final. The graph has no cycles, so
+# "status is still what I read" is enough to detect a lost race.
+ORDER_FLOW = ('pending', 'confirmed', 'preparing', 'ready', 'completed')
+FINAL_STATUSES = ('completed', 'cancelled')
+
+APPLIED = 'applied'
+CONFLICT = 'conflict'
+INVALID = 'invalid'
+NOT_FOUND = 'not_found'
+
+LOOKUP_BATCH_SIZE = 500
+
+
+def can_transition(from_status, to_status):
+    """Return whether an order may move from ``from_status`` to ``to_status``."""
+    if from_status in FINAL_STATUSES or from_status == to_status:
+        return False
+    if to_status == 'cancelled':
+        return True
+    return (from_status in ORDER_FLOW and to_status in ORDER_FLOW
+            and ORDER_FLOW.index(to_status) > ORDER_FLOW.index(from_status))
+
+
+def _current_statuses(order_ids):
+    order_ids = list(order_ids)
+    statuses = {}
+    for start in range(0, len(order_ids), LOOKUP_BATCH_SIZE):
+        statuses.update(
+            Order.objects.filter(pk__in=order_ids[start:start + LOOKUP_BATCH_SIZE]).values_list('pk', 'status')
+        )
+    return statuses
+
+
+def transition_orders(changes, user=None):
+    """
+    Apply a batch of status changes with optimistic concurrency.
+
+    ``changes`` is an iterable of ``(order_id, to_status, expected_status)``.
+    Each change is a conditional ``UPDATE ... WHERE status = expected``, so
+    no rows are locked ahead of time: if another terminal moved the order
+    first, the update matches nothing and the change is reported as a
+    conflict together with the order's current status. When
+    ``expected_status`` is None the status read at the start of the batch is
+    used. Applied changes are appended to the ``OrderTransition`` log and
+    announced with ``order_status_changed`` once committed.
+
+    Returns one result dict per change, in input order.
+    """
+    changes = list(changes)
+    known = _current_statuses({order_id for order_id, _, _ in changes})
+
+    results = []
+    applied = []
+    now = timezone.now()
+    with transaction.atomic():
+        for order_id, to_status, expected_status in changes:
+            result = {'order': order_id, 'to_status': to_status}
+            results.append(result)
+            if order_id not in known:
+                result['status'] = NOT_FOUND
+                continue
+
+            from_status = expected_status or known[order_id]
+            result['from_status'] = from_status
+            if not can_transition(from_status, to_status):
+                result['status'] = INVALID
+                continue
+
+            updated = Order.objects.filter(pk=order_id, status=from_status).update(
+                status=to_status, updated_at=now
+            )
+            if updated:
+                result['status'] = APPLIED
+                applied.append((order_id, from_status, to_status))
+                # Later changes in this batch start from the new status.
+                known[order_id] = to_status
+            else:
+                result['status'] = CONFLICT
+
+        OrderTransition.objects.bulk_create([
+            OrderTransition(order_id=order_id, from_status=from_status, to_status=to_status,
+                            performed_by=user, created_at=now)
+            for order_id, from_status, to_status in applied
+        ])
+        if applied:
+            transaction.on_commit(
+                lambda: order_status_changed.send(sender=Order, transitions=applied)
+            )
+
+    conflicts = [result for result in results if result['status'] == CONFLICT]
+    if conflicts:
+        current = _current_statuses(result['order'] for result in conflicts)
+        for result in conflicts:
+            result['current_status'] = current.get(result['order'])
+    return results
+
+
+def transition_order(order_id, to_status, expected_status=None, user=None):
+    """Apply a single status change; see ``transition_orders``."""
+    return transition_orders([(order_id, to_status, expected_status)], user=user)[0]
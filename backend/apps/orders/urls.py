@@ -1,7 +1,20 @@
 from django.urls import path
+from .views import (
+    OrderListCreateView,
+    OrderExportView,
+    OrderSyncView,
+    OrderTransitionView,
+    OrderSearchView,
+    OrderDetailView
+)
 
 app_name = 'orders'
 
 urlpatterns = [
-    # Order endpoints will go here
-]
\ No newline at end of file
+    path('', OrderListCreateView.as_view(), name='order_list'),
+    path('export/', OrderExportView.as_view(), name='order_export'),
+    path('sync/', OrderSyncView.as_view(), name='order_sync'),
+    path('transitions/', OrderTransitionView.as_view(), name='order_transitions'),
+    path('search/', OrderSearchView.as_view(), name='order_search'),
+    path('<str:order_number>/', OrderDetailView.as_view(), name='order_detail'),
+]
@@ -1,3 +1,155 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
 
-# Create your views here.
+from .models import Order, ArchivedOrder
+from .serializers import (
+    OrderSerializer,
+    ArchivedOrderSerializer,
+    OrderCreateSerializer,
+    OrderSyncSerializer,
+    OrderTransitionBatchSerializer
+)
+from .archive import find_order
+from .export import EXPORT_FORMATS, export_orders_response
+from .filters import filter_orders
+from .pagination import KeysetPagination
+from .parsers import CompressedJSONParser
+from .transitions import transition_orders
+from . import search
+
+
+class OrderListCreateView(APIView):
+    """
+    API view for listing orders and creating an order with all of its items.
+
+    The list is filtered with the parameters supported by ``filter_orders``
+    and paginated with a ``(created_at, id)`` cursor.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        queryset = filter_orders(Order.objects.all(), request.query_params)
+        queryset = queryset.select_related('customer').prefetch_related('items')
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(OrderSerializer(page, many=True).data)
+
+    def post(self, request):
+        serializer = OrderCreateSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            order = serializer.save()
+            return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class OrderExportView(APIView):
+    """
+    API view streaming orders as CSV or NDJSON.
+
+    Query parameters: ``output`` (``csv`` or ``ndjson``), ``items`` to flatten
+    order items into one row each, and the order list filters. Matching
+    archived orders are exported after the live ones.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = filter_orders(Order.objects.all(), request.query_params)
+        archived_queryset = filter_orders(ArchivedOrder.objects.all(), request.query_params)
+        include_items = request.query_params.get('items', '').lower() in ('1', 'true', 'yes')
+        return export_orders_response(queryset, export_format, include_items=include_items,
+                                      archived_queryset=archived_queryset)
+
+
+class OrderDetailView(APIView):
+    """
+    API view for looking up an order by its number, whether live or archived.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, order_number):
+        order = find_order(order_number)
+        if order is None:
+            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer_class = ArchivedOrderSerializer if isinstance(order, ArchivedOrder) else OrderSerializer
+        return Response(serializer_class(order).data, status=status.HTTP_200_OK)
+
+
+class OrderSyncView(APIView):
+    """
+    API view for uploading orders queued by offline POS devices.
+
+    Accepts ``{"orders": [...]}``, optionally gzip or deflate compressed, where
+    every order carries a client-generated ``idempotency_key``. Re-uploading
+    an order is safe: it is reported as a duplicate instead of being inserted
+    again.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [CompressedJSONParser]
+
+    def post(self, request):
+        serializer = OrderSyncSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            results = serializer.save()
+            summary = {}
+            for result in results:
+                summary[result['status']] = summary.get(result['status'], 0) + 1
+            return Response({'results': results, 'summary': summary}, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class OrderTransitionView(APIView):
+    """
+    API view for changing the status of many orders at once.
+
+    Each change is applied only if the order is still in ``expected_status``
+    (or the status it had when the request arrived). Orders another terminal
+    changed first are reported with status ``conflict`` and their current
+    status.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = OrderTransitionBatchSerializer(data=request.data)
+        if serializer.is_valid():
+            results = transition_orders(
+                [
+                    (change['order'], change['to_status'], change.get('expected_status'))
+                    for change in serializer.validated_data['transitions']
+                ],
+                user=request.user,
+            )
+            summary = {}
+            for result in results:
+                summary[result['status']] = summary.get(result['status'], 0) + 1
+            return Response({'results': results, 'summary': summary}, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class OrderSearchView(APIView):
+    """
+    API view for the cashier typeahead over orders and customers.
+
+    ``q`` is matched against order number fragments and customer names,
+    emails and phone numbers; ``limit`` caps the number of results.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', search.DEFAULT_LIMIT))
+        except ValueError:
+            limit = search.DEFAULT_LIMIT
+        results = search.search(request.query_params.get('q', ''), limit=limit)
+        return Response({'results': results}, status=status.HTTP_200_OK)
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     'apps.inventory',
     'apps.analytics',
     'apps.employees',
+    'apps.images',
 ]
 
 MIDDLEWARE = [
@@ -191,6 +192,72 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Order numbers
+# Each process reserves ORDER_NUMBER_BLOCK_SIZE numbers at a time.
+ORDER_NUMBER_ALLOCATOR = 'apps.orders.numbering.BlockOrderNumberAllocator'
+ORDER_NUMBER_BLOCK_SIZE = 1000
+
+# Offline order sync
+ORDER_SYNC_MAX_ORDERS = 5000
+ORDER_SYNC_MAX_DECOMPRESSED_SIZE = 50 * 1024 * 1024
+
+# Order archival
+# Completed and cancelled orders older than this are moved to the archive tables.
+ORDER_ARCHIVE_AFTER_DAYS = 180
+ORDER_ARCHIVE_BATCH_SIZE = 1000
+
+# Scanner product lookup
+# Per-process LRU cache of scanned codes; entries expire after the TTL (seconds).
+PRODUCT_LOOKUP_CACHE_SIZE = 50000
+PRODUCT_LOOKUP_CACHE_TTL = 300
+PRODUCT_LOOKUP_WARM_ON_STARTUP = True
+
+# Stock reservations
+# Holds placed for unpaid orders lapse after this many seconds and are
+# reclaimed by the sweep_stock_reservations command, in batches.
+STOCK_RESERVATION_TTL = 15 * 60
+STOCK_RESERVATION_SWEEP_BATCH_SIZE = 1000
+
+# Demand forecasting
+# Days of sales history read, half-life (days) of the weight given to a day's
+# sales, supplier lead time and review period (days) and the share of
+# replenishment cycles that should not run out of stock.
+FORECAST_HISTORY_DAYS = 730
+FORECAST_HALF_LIFE_DAYS = 56
+FORECAST_LEAD_TIME_DAYS = 7
+FORECAST_REVIEW_DAYS = 14
+FORECAST_SERVICE_LEVEL = 0.95
+
+# Image derivatives
+# Every uploaded image is rendered at each of these widths (never wider than
+# the original) in a pool of worker processes; variants are stored under
+# IMAGE_DERIVATIVE_DIR in media storage, addressed by the original's content.
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1280)
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_DERIVATIVE_DIR = 'derivatives'
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Columnar analytics export
+# Orders, order items and stock movements are exported to one memory-mappable
+# .npy file per column under ANALYTICS_EXPORT_DIR, read in chunks of
+# ANALYTICS_EXPORT_CHUNK_SIZE rows; see apps.analytics.columnar.
+ANALYTICS_EXPORT_DIR = os.path.join(BASE_DIR, 'analytics_export')
+ANALYTICS_EXPORT_CHUNK_SIZE = 50_000
+
+# Dashboard
+# Widgets missing from the cache are computed in a pool of DASHBOARD_WORKERS
+# threads. Cached widget data is keyed by a data version stamp; widgets that
+# show stock levels, which change without signals, expire sooner.
+DASHBOARD_WORKERS = 4
+DASHBOARD_CACHE_TIMEOUT = 15 * 60
+DASHBOARD_STOCK_CACHE_TIMEOUT = 60
+
+# Top products
+# Units sold per product are tracked per hour in Space-Saving sketches of
+# TOP_PRODUCT_SKETCH_SIZE counters; see apps.analytics.heavy_hitters.
+TOP_PRODUCT_SKETCH_SIZE = 100
+
 # Fixtures
 FIXTURE_DIRS = [
     os.path.join(BASE_DIR, 'fixtures'),
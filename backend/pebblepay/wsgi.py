@@ -14,3 +14,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pebblepay.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+from django.db import DatabaseError  # noqa: E402
+
+if settings.PRODUCT_LOOKUP_WARM_ON_STARTUP:
+    from apps.inventory.lookup import warm_lookup_cache
+
+    try:
+        warm_lookup_cache()
+    except DatabaseError:
+        pass  # The database is not ready yet (e.g. before the first migrate); lookups fill the cache instead.